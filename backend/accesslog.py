@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from . import tracing
+
+# =========================
+# Log de acesso estruturado (JSON, uma linha por requisição)
+# =========================
+# O handler da requisição só põe o registro numa fila (QueueHandler); uma
+# thread do QueueListener formata e escreve. Destino: stdout, ou o arquivo
+# PDV_ACCESS_LOG (rotação por tamanho). PDV_ACCESS_LOG=off desliga.
+
+ACCESS_LOG = os.getenv("PDV_ACCESS_LOG", "")
+
+log = logging.getLogger("pdv.access")
+log.propagate = False
+
+_listener: logging.handlers.QueueListener | None = None
+_request: ContextVar[dict | None] = ContextVar("pdv_access", default=None)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        data.update(getattr(record, "fields", None) or {})
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def setup() -> None:
+    """Liga a fila + listener (idempotente)."""
+    global _listener
+    if _listener is not None or ACCESS_LOG.lower() == "off":
+        return
+    if ACCESS_LOG:
+        os.makedirs(os.path.dirname(os.path.abspath(ACCESS_LOG)), exist_ok=True)
+        target: logging.Handler = logging.handlers.RotatingFileHandler(
+            ACCESS_LOG, maxBytes=50 * 1024 * 1024, backupCount=5, encoding="utf-8"
+        )
+    else:
+        target = logging.StreamHandler(sys.stdout)
+    target.setFormatter(JsonFormatter())
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    log.addHandler(logging.handlers.QueueHandler(q))
+    log.setLevel(logging.INFO)
+    _listener = logging.handlers.QueueListener(q, target, respect_handler_level=False)
+    _listener.start()
+    atexit.register(stop)
+
+
+def stop() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()  # escoa a fila antes de sair
+        _listener = None
+
+
+def set_user(username: str | None) -> None:
+    """Chamado pela autenticação: anota o usuário no log da requisição."""
+    info = _request.get()
+    if info is not None:
+        info["user"] = username
+
+
+def current_user() -> str | None:
+    info = _request.get()
+    return info.get("user") if info else None
+
+
+class AccessLogMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _listener is None:
+            await self.app(scope, receive, send)
+            return
+        info: dict = {"user": None}
+        status = 500
+        queries = None
+        t0 = time.perf_counter()
+
+        async def _send(message):
+            nonlocal status, queries
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for k, v in message.get("headers", []):
+                    if k == b"x-query-count":
+                        queries = int(v)
+            await send(message)
+
+        token = _request.set(info)
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _request.reset(token)
+            route = scope.get("route")
+            client = scope.get("client")
+            log.info("access", extra={"fields": {
+                "method": scope["method"],
+                "route": route.path_format if route is not None else None,
+                "path": scope.get("path", ""),
+                "status": status,
+                "ms": round((time.perf_counter() - t0) * 1000.0, 2),
+                "user": info["user"],
+                "queries": queries,
+                "client": client[0] if client else None,
+                "trace_id": tracing.current_trace_id(),
+            }})
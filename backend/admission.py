@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from collections import deque
+
+# =========================
+# Controle de admissão por classe de rota
+# =========================
+# As rotas são `def` síncronas e dividem o threadpool do anyio (THREADS
+# threads). Cada classe tem um teto de requisições simultâneas, uma fila
+# com tamanho e espera máximos; estourou, 503 + Retry-After. A soma dos
+# tetos de browse/reporting/admin fica abaixo de THREADS, então o caixa
+# (scan e venda) sempre tem threads reservadas. Relatórios têm teto e
+# espera menores: são os primeiros a serem recusados.
+#
+# Ajuste fino: PDV_THREADS=40, PDV_LIMITS="browse=16,reporting=4,admin=4".
+# PDV_ADMISSION=off desliga.
+
+THREADS = int(os.getenv("PDV_THREADS", "40"))
+ENABLED = os.getenv("PDV_ADMISSION", "").lower() not in ("off", "0", "false", "no")
+
+#            teto  fila  espera(s)  Retry-After(s)
+_DEFAULTS = {
+    "checkout":  (THREADS, 256, 15.0, 1),
+    "browse":    (16, 64, 5.0, 2),
+    "admin":     (4, 8, 5.0, 5),
+    "reporting": (4, 8, 2.0, 10),
+}
+
+
+def _overrides() -> dict[str, int]:
+    out = {}
+    for part in os.getenv("PDV_LIMITS", "").split(","):
+        name, _, value = part.partition("=")
+        if name.strip() in _DEFAULTS and value.strip().isdigit():
+            out[name.strip()] = int(value)
+    return out
+
+
+def classify(method: str, path: str) -> str | None:
+    """Classe da requisição; None = sem limite (estáticos, health, stream SSE)."""
+    if (
+        path in ("/api/products/find", "/api/products/resolve", "/api/products/suggest")
+        or (path == "/api/sales" and method == "POST")
+    ):
+        return "checkout"
+    if not path.startswith("/api/") and path != "/metrics":
+        return None
+    if path == "/api/health" or path.startswith("/api/events/"):
+        return None
+    if path.startswith("/api/dashboard/") or path in ("/api/products/export", "/api/inventory/stock-at"):
+        return "reporting"
+    if (
+        path.startswith(("/api/admin/", "/api/inventory/sessions"))
+        or path in ("/metrics", "/api/products/import")
+    ):
+        return "admin"
+    return "browse"
+
+
+class Gate:
+    """Semáforo com fila limitada e timeout; roda só no event loop (sem locks)."""
+
+    def __init__(self, name: str, cap: int, max_queue: int, timeout: float, retry_after: int):
+        self.name = name
+        self.cap = cap
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for f in self._waiters if not f.done())
+
+    async def acquire(self) -> bool:
+        if self.active < self.cap and not self._waiters:
+            self.active += 1
+            return True
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            return False
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.timeout)
+            return True
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                return True  # a vaga chegou junto com o timeout
+            fut.cancel()
+            self._drop(fut)
+            self.timeouts += 1
+            return False
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()
+            else:
+                fut.cancel()
+                self._drop(fut)
+            raise
+
+    def _drop(self, fut: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(fut)
+        except ValueError:
+            pass
+
+    def release(self) -> None:
+        # passa a vaga direto para o próximo da fila (active não muda)
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+
+def _build() -> dict[str, Gate]:
+    over = _overrides()
+    gates = {}
+    for name, (cap, queue, timeout, retry) in _DEFAULTS.items():
+        gates[name] = Gate(name, over.get(name, cap), queue, timeout, retry)
+    return gates
+
+
+gates = _build()
+
+
+def reserved_for_checkout() -> int:
+    """Threads que nenhuma outra classe consegue ocupar."""
+    return THREADS - sum(g.cap for n, g in gates.items() if n != "checkout")
+
+
+def configure_threadpool() -> None:
+    """Ajusta o threadpool do anyio (chamar dentro do event loop, no startup)."""
+    import anyio.to_thread
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADS
+
+
+def stats() -> list[dict]:
+    return [
+        {"class": g.name, "cap": g.cap, "active": g.active, "queued": g.queued,
+         "rejected": g.rejected, "timeouts": g.timeouts}
+        for g in gates.values()
+    ]
+
+
+def gauges() -> list[tuple[str, str, float]]:
+    """Linhas para o /metrics (ver metrics.render)."""
+    out = [("pdv_admission_reserved_checkout", "Threads reservadas ao caixa.", reserved_for_checkout())]
+    for g in stats():
+        for k in ("active", "queued", "rejected", "timeouts"):
+            out.append((f'pdv_admission_{k}{{class="{g["class"]}"}}', f"Admissão por classe de rota: {k}.", g[k]))
+    return out
+
+
+async def _reject(send, gate: Gate) -> None:
+    body = json.dumps({"detail": "Servidor ocupado, tente novamente em instantes."}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(gate.retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        cls = classify(scope["method"], scope.get("path", "")) if scope["type"] == "http" and ENABLED else None
+        if cls is None:
+            await self.app(scope, receive, send)
+            return
+        gate = gates[cls]
+        if not await gate.acquire():
+            await _reject(send, gate)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import Integer, String, cast, func, literal
+from sqlalchemy.orm import Session
+
+from . import models
+
+# =========================
+# Séries temporais / heatmap de vendas
+# =========================
+# Cada relatório é UM GROUP BY (bucket, pagamento, operador). O resultado
+# esparso do banco é "densificado" com NumPy: buckets sem venda viram zero.
+
+BUCKETS = {"hour": "h", "day": "D", "week": "D"}
+MAX_BUCKETS = 10_000
+WEEKDAYS = ["dom", "seg", "ter", "qua", "qui", "sex", "sáb"]  # 0 = domingo (SQLite %w / PG dow)
+
+
+def _is_sqlite(db: Session) -> bool:
+    return db.get_bind().dialect.name == "sqlite"
+
+
+def _bucket_expr(db: Session, bucket: str):
+    col = models.Sale.created_at
+    if not _is_sqlite(db):
+        return func.date_trunc(bucket, col)
+    if bucket == "hour":
+        return func.strftime("%Y-%m-%dT%H", col)
+    if bucket == "day":
+        return func.strftime("%Y-%m-%d", col)
+    # semana começando na segunda-feira
+    back = (cast(func.strftime("%w", col), Integer) + 6) % 7
+    return func.date(col, literal("-") + cast(back, String) + literal(" days"))
+
+
+def _axis(s: datetime, e: datetime, bucket: str) -> np.ndarray:
+    unit = BUCKETS[bucket]
+    first = np.datetime64(s, unit)
+    if bucket == "week":
+        first = first - np.timedelta64(s.weekday(), "D")
+        step = np.timedelta64(7, "D")
+    else:
+        step = np.timedelta64(1, unit)
+    return np.arange(first, np.datetime64(e, unit) + np.timedelta64(1, unit), step)
+
+
+def _grouped(db: Session, s: datetime, e: datetime, *keys):
+    sa = models.Sale
+    return (
+        db.query(
+            *keys,
+            sa.payment,
+            func.coalesce(sa.operator, "-"),
+            func.count(sa.id),
+            func.coalesce(func.sum(sa.total), 0.0),
+        )
+        .filter(sa.created_at >= s, sa.created_at <= e)
+        .group_by(*keys, sa.payment, func.coalesce(sa.operator, "-"))
+        .all()
+    )
+
+
+def _breakdown(labels: np.ndarray, pos: tuple, orders: np.ndarray, revenue: np.ndarray, shape):
+    """Soma orders/revenue por rótulo (pagamento ou operador) com np.add.at."""
+    names, inv = np.unique(labels, return_inverse=True)
+    o = np.zeros((len(names), *shape), dtype=np.int64)
+    r = np.zeros((len(names), *shape), dtype=np.float64)
+    np.add.at(o, (inv, *pos), orders)
+    np.add.at(r, (inv, *pos), revenue)
+    return {
+        str(n): {"orders": o[i].tolist(), "revenue": np.round(r[i], 2).tolist()}
+        for i, n in enumerate(names)
+    }
+
+
+def timeseries(db: Session, s: datetime, e: datetime, bucket: str) -> dict:
+    if bucket not in BUCKETS:
+        raise ValueError("Bucket inválido (use hour, day ou week).")
+    axis = _axis(s, e, bucket)
+    if len(axis) > MAX_BUCKETS:
+        raise ValueError("Período longo demais para este bucket.")
+
+    rows = _grouped(db, s, e, _bucket_expr(db, bucket).label("bucket"))
+    n = len(axis)
+    if rows:
+        cols = list(zip(*rows))
+        unit = BUCKETS[bucket]
+        stamps = np.array(cols[0], dtype=f"datetime64[{unit}]")
+        step = axis[1] - axis[0] if n > 1 else np.timedelta64(1, unit)
+        idx = ((stamps - axis[0]) // step).astype(np.int64)
+        payments = np.array(cols[1], dtype=object).astype(str)
+        operators = np.array(cols[2], dtype=object).astype(str)
+        orders = np.array(cols[3], dtype=np.int64)
+        revenue = np.array(cols[4], dtype=np.float64)
+    else:
+        idx = np.zeros(0, dtype=np.int64)
+        payments = operators = np.zeros(0, dtype=str)
+        orders = np.zeros(0, dtype=np.int64)
+        revenue = np.zeros(0, dtype=np.float64)
+
+    return {
+        "bucket": bucket,
+        "period": {"start": s.isoformat(), "end": e.isoformat()},
+        "buckets": np.datetime_as_string(axis, unit="s").tolist(),
+        "orders": np.bincount(idx, weights=orders, minlength=n).astype(np.int64).tolist(),
+        "revenue": np.round(np.bincount(idx, weights=revenue, minlength=n), 2).tolist(),
+        "by_payment": _breakdown(payments, (idx,), orders, revenue, (n,)),
+        "by_operator": _breakdown(operators, (idx,), orders, revenue, (n,)),
+    }
+
+
+def heatmap(db: Session, s: datetime, e: datetime) -> dict:
+    col = models.Sale.created_at
+    if _is_sqlite(db):
+        dow = cast(func.strftime("%w", col), Integer)
+        hour = cast(func.strftime("%H", col), Integer)
+    else:
+        dow = cast(func.extract("dow", col), Integer)
+        hour = cast(func.extract("hour", col), Integer)
+
+    rows = _grouped(db, s, e, dow.label("dow"), hour.label("hour"))
+    shape = (7, 24)
+    if rows:
+        cols = list(zip(*rows))
+        pos = (np.array(cols[0], dtype=np.int64), np.array(cols[1], dtype=np.int64))
+        payments = np.array(cols[2], dtype=object).astype(str)
+        operators = np.array(cols[3], dtype=object).astype(str)
+        orders = np.array(cols[4], dtype=np.int64)
+        revenue = np.array(cols[5], dtype=np.float64)
+    else:
+        pos = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        payments = operators = np.zeros(0, dtype=str)
+        orders = np.zeros(0, dtype=np.int64)
+        revenue = np.zeros(0, dtype=np.float64)
+
+    o = np.zeros(shape, dtype=np.int64)
+    r = np.zeros(shape, dtype=np.float64)
+    np.add.at(o, pos, orders)
+    np.add.at(r, pos, revenue)
+    return {
+        "period": {"start": s.isoformat(), "end": e.isoformat()},
+        "weekdays": WEEKDAYS,
+        "hours": list(range(24)),
+        "orders": o.tolist(),
+        "revenue": np.round(r, 2).tolist(),
+        "by_payment": _breakdown(payments, pos, orders, revenue, shape),
+        "by_operator": _breakdown(operators, pos, orders, revenue, shape),
+    }
@@ -1,13 +1,18 @@
+from . import startup  # primeiro: marca o início do boot
+
 import os
 import uuid
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from datetime import datetime, date, time, timedelta
 
 from dotenv import load_dotenv
 from fastapi import (
-    FastAPI, Depends, HTTPException, Header, Response, Query, Path, UploadFile, File
+    FastAPI, Depends, HTTPException, Header, Request, Response, Query, Path, UploadFile, File
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy import func
 from sqlalchemy.orm import Session
@@ -15,18 +20,40 @@ from sqlalchemy.orm import Session
 # Silenciar ruído do passlib/bcrypt
 logging.getLogger("passlib").setLevel(logging.ERROR)
 
-from .database import Base, engine, get_db
-from . import models, schemas, crud
+from .database import engine, get_db, get_async_db
+from . import database, crud_async
+from . import models, schemas, crud, events, cache, stock, catalog, stocktake, migrations, metrics, querylog, profiling, tracing, accesslog, audit, admission, suggest
 from .auth import (
     create_access_token,
     get_current_user,
+    get_current_user_async,
     require_admin,
     user_from_token_str,
 )
+startup.mark("imports")
 
 load_dotenv()
+startup.mark("dotenv")
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    admission.configure_threadpool()
+    startup.mark("server start")
+    # autocompletar do PDV: índice montado antes da primeira tecla
+    suggest.ensure_built()
+    startup.mark("suggest index")
+    startup.log_report()
+    yield
+    audit.flush()
+    accesslog.stop()
 
-app = FastAPI(title="PDV API")
+app = FastAPI(title="PDV API", lifespan=lifespan)
+# rotas perfiláveis (X-Profile: 1 com token de admin) e com span próprio
+app.router.route_class = tracing.TracedRoute
+tracing.instrument_module(crud)
+# scan, venda, listagem e dashboard têm versão async (crud_async), escolhida
+# no registro da rota quando database.ASYNC_DB; as demais seguem síncronas
+tracing.instrument_module(crud_async)
 
 # CORS (libera tudo em dev se CORS_ORIGINS não estiver definido)
 origins_env = os.getenv("CORS_ORIGINS")
@@ -38,18 +65,37 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(profiling.ProfilingMiddleware)
+# consultas SQL por requisição (X-Query-Count, Server-Timing, N+1)
+app.add_middleware(querylog.QueryStatsMiddleware)
+querylog.instrument_engine(engine)
+database.on_async_engine(querylog.instrument_engine)
+# tetos por classe de rota: o caixa sempre tem threads reservadas (503 nos relatórios antes)
+app.add_middleware(admission.AdmissionMiddleware)
+# log de acesso em JSON (fila + thread; PDV_ACCESS_LOG=arquivo|off)
+accesslog.setup()
+app.add_middleware(accesslog.AccessLogMiddleware)
+# métricas por rota (mede também o CORS)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+database.on_async_engine(metrics.instrument_engine)
+# por último = mais externo: spans (PDV_TRACE_SAMPLE) em traces/spans.jsonl
+app.add_middleware(tracing.TracingMiddleware)
+tracing.instrument_engine(engine)
+database.on_async_engine(tracing.instrument_engine)
 
 # --- Pastas de uploads (imagens de produtos) ---
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
 PRODUCTS_DIR = os.path.join(UPLOAD_DIR, "products")
-os.makedirs(PRODUCTS_DIR, exist_ok=True)
+# a pasta é criada no primeiro upload (check_dir=False)
 
 # Servir uploads estaticamente (antes do frontend)
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR, check_dir=False), name="uploads")
 
-# Criação das tabelas
-Base.metadata.create_all(bind=engine)
+# Esquema: só confere a versão (migrações: python -m backend.migrations upgrade)
+migrations.ensure_current(engine)
+startup.mark("schema check")
 
 # ---------------------------
 #     HELPERS (PERMISSÕES)
@@ -106,17 +152,21 @@ def register(
 ):
     # Primeiro usuário pode ser criado sem autenticação (bootstrap)
     if crud.count_users(db) == 0:
-        u = crud.create_user(
+        u = crud.create_user_with_permissions(
             db,
             username=payload.username,
             password=payload.password,
-            role=payload.role or "admin",
+            # o schema tem "operator" por padrão: sem papel informado, o primeiro é admin
+            role=(payload.role if "role" in payload.model_fields_set else None) or "admin",
             full_name=payload.full_name,
             permissions=_perm_join(
                 payload.permissions
                 or ["dashboard", "vendas", "produtos", "administracao"]
             ),
         )
+        # sem sessão ainda: o próprio usuário criado responde pelo registro
+        audit.record("create", "user", u.id, actor=u.username, username=u.username,
+                     role=u.role, permissions=u.permissions, bootstrap=True)
         return _user_to_dict(u)
 
     # Depois, só admin autenticado pode criar
@@ -126,19 +176,25 @@ def register(
             status_code=403,
             detail="Apenas administradores podem criar usuários após o primeiro.",
         )
+    accesslog.set_user(admin.username)  # como get_current_user: log de acesso / auditoria
 
-    u = crud.create_user_with_permissions(
-        db,
-        username=payload.username,
-        password=payload.password,
-        role=payload.role or "operator",
-        full_name=payload.full_name,
-        permissions=_perm_join(
-            payload.permissions
-            or (["vendas"] if (payload.role or "operator") != "admin"
-                else ["dashboard", "vendas", "produtos", "administracao"])
-        ),
-    )
+    try:
+        u = crud.create_user_with_permissions(
+            db,
+            username=payload.username,
+            password=payload.password,
+            role=payload.role or "operator",
+            full_name=payload.full_name,
+            permissions=_perm_join(
+                payload.permissions
+                or (["vendas"] if (payload.role or "operator") != "admin"
+                    else ["dashboard", "vendas", "produtos", "administracao"])
+            ),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    audit.record("create", "user", u.id, actor=admin.username,
+                 username=u.username, role=u.role, permissions=u.permissions)
     return _user_to_dict(u)
 
 # ---------------------------
@@ -166,31 +222,18 @@ def _parse_bounds(start: str | None, end: str | None):
         e = datetime.combine(today, time.max)
     return s, e
 
-@app.get("/api/dashboard/summary")
-def dash_summary(
-    start: str | None = None,
-    end: str | None = None,
-    db: Session = Depends(get_db),
-    user=Depends(get_current_user),
-):
-    s, e = _parse_bounds(start, end)
-
-    orders = (
-        db.query(func.count(models.Sale.id))
-        .filter(models.Sale.created_at >= s, models.Sale.created_at <= e)
-        .scalar()
-        or 0
-    )
-
-    revenue = (
-        db.query(func.coalesce(func.sum(models.Sale.total), 0.0))
+def _period_revenue(db: Session, s: datetime, e: datetime) -> tuple[int, float]:
+    orders, revenue = (
+        db.query(
+            func.count(models.Sale.id),
+            func.coalesce(func.sum(models.Sale.total), 0.0),
+        )
         .filter(models.Sale.created_at >= s, models.Sale.created_at <= e)
-        .scalar()
-        or 0.0
+        .one()
     )
+    return int(orders or 0), float(revenue or 0.0)
 
-    avg_ticket = (revenue / orders) if orders else 0.0
-
+def _month_bounds() -> tuple[datetime, datetime]:
     # faturamento acumulado do mês corrente
     first_day = date(date.today().year, date.today().month, 1)
     # primeiro dia do mês seguinte
@@ -200,43 +243,56 @@ def dash_summary(
         next_first = date(first_day.year, first_day.month + 1, 1)
     # último dia do mês corrente
     last_day = next_first - timedelta(days=1)
+    return datetime.combine(first_day, time.min), datetime.combine(last_day, time.max)
 
-    ms = datetime.combine(first_day, time.min)
-    me = datetime.combine(last_day, time.max)
-
-    month_revenue = (
-        db.query(func.coalesce(func.sum(models.Sale.total), 0.0))
-        .filter(models.Sale.created_at >= ms, models.Sale.created_at <= me)
-        .scalar()
-        or 0.0
-    )
-
+def _summary(s: datetime, e: datetime, orders: int, revenue: float, month_revenue: float) -> dict:
     return {
         "period": {"start": s.isoformat(), "end": e.isoformat()},
         "kpis": {
             "orders": orders,
             "revenue": revenue,
-            "avg_ticket": avg_ticket,
+            "avg_ticket": (revenue / orders) if orders else 0.0,
             "month_revenue": month_revenue,
         },
     }
 
-@app.get("/api/dashboard/latest_sales")
-def dash_latest_sales(
+def dash_summary(
     start: str | None = None,
     end: str | None = None,
-    limit: int = 20,
     db: Session = Depends(get_db),
     user=Depends(get_current_user),
 ):
     s, e = _parse_bounds(start, end)
-    q = (
-        db.query(models.Sale)
-        .filter(models.Sale.created_at >= s, models.Sale.created_at <= e)
-        .order_by(models.Sale.created_at.desc())
-        .limit(limit)
-        .all()
+
+    orders, revenue = cache.dashboard.get_or_compute(
+        ("summary", s, e, None), s, e, lambda: _period_revenue(db, s, e)
+    )
+    ms, me = _month_bounds()
+    # cacheado à parte: muda a cada venda mesmo quando o período é passado
+    _, month_revenue = cache.dashboard.get_or_compute(
+        ("summary", ms, me, None), ms, me, lambda: _period_revenue(db, ms, me)
     )
+    return _summary(s, e, orders, revenue, month_revenue)
+
+async def dash_summary_async(
+    start: str | None = None,
+    end: str | None = None,
+    db=Depends(get_async_db),
+    user=Depends(get_current_user_async),
+):
+    s, e = _parse_bounds(start, end)
+    orders, revenue = await cache.dashboard.aget_or_compute(
+        ("summary", s, e, None), s, e, lambda: crud_async.period_revenue(db, s, e)
+    )
+    ms, me = _month_bounds()
+    _, month_revenue = await cache.dashboard.aget_or_compute(
+        ("summary", ms, me, None), ms, me, lambda: crud_async.period_revenue(db, ms, me)
+    )
+    return _summary(s, e, orders, revenue, month_revenue)
+
+app.get("/api/dashboard/summary")(dash_summary_async if database.ASYNC_DB else dash_summary)
+
+def _latest_items(sales) -> dict:
     return {
         "items": [
             {
@@ -246,11 +302,39 @@ def dash_latest_sales(
                 "payment": x.payment,
                 "total": x.total,
             }
-            for x in q
+            for x in sales
         ]
     }
 
-@app.get("/api/dashboard/top_products")
+def dash_latest_sales(
+    start: str | None = None,
+    end: str | None = None,
+    limit: int = 20,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    s, e = _parse_bounds(start, end)
+    q = (
+        db.query(models.Sale)
+        .filter(models.Sale.created_at >= s, models.Sale.created_at <= e)
+        .order_by(models.Sale.created_at.desc())
+        .limit(limit)
+        .all()
+    )
+    return _latest_items(q)
+
+async def dash_latest_sales_async(
+    start: str | None = None,
+    end: str | None = None,
+    limit: int = 20,
+    db=Depends(get_async_db),
+    user=Depends(get_current_user_async),
+):
+    s, e = _parse_bounds(start, end)
+    return _latest_items(await crud_async.latest_sales(db, s, e, limit))
+
+app.get("/api/dashboard/latest_sales")(dash_latest_sales_async if database.ASYNC_DB else dash_latest_sales)
+
 def dash_top_products(
     start: str | None = None,
     end: str | None = None,
@@ -262,26 +346,73 @@ def dash_top_products(
     it = models.SaleItem
     sa = models.Sale
 
-    rows = (
-        db_session.query(
-            it.name.label("name"),
-            func.coalesce(func.sum(it.qty), 0).label("qty"),
-            func.coalesce(func.sum(it.qty * it.price), 0.0).label("revenue"),
+    def compute():
+        rows = (
+            db_session.query(
+                it.name.label("name"),
+                func.coalesce(func.sum(it.qty), 0).label("qty"),
+                func.coalesce(func.sum(it.qty * it.price), 0.0).label("revenue"),
+            )
+            .join(sa, it.sale_id == sa.id)
+            .filter(sa.created_at >= s, sa.created_at <= e)
+            .group_by(it.name)
+            .order_by(func.sum(it.qty).desc())
+            .limit(limit)
+            .all()
         )
-        .join(sa, it.sale_id == sa.id)
-        .filter(sa.created_at >= s, sa.created_at <= e)
-        .group_by(it.name)
-        .order_by(func.sum(it.qty).desc())
-        .limit(limit)
-        .all()
-    )
-
-    return {
-        "items": [
+        return [
             {"name": r.name, "qty": int(r.qty or 0), "revenue": float(r.revenue or 0)}
             for r in rows
         ]
-    }
+
+    items = cache.dashboard.get_or_compute(("top_products", s, e, limit), s, e, compute)
+    return {"items": items}
+
+async def dash_top_products_async(
+    start: str | None = None,
+    end: str | None = None,
+    limit: int = 10,
+    db=Depends(get_async_db),
+    user=Depends(get_current_user_async),
+):
+    s, e = _parse_bounds(start, end)
+    items = await cache.dashboard.aget_or_compute(
+        ("top_products", s, e, limit), s, e, lambda: crud_async.top_products(db, s, e, limit)
+    )
+    return {"items": items}
+
+app.get("/api/dashboard/top_products")(dash_top_products_async if database.ASYNC_DB else dash_top_products)
+
+@app.get("/api/dashboard/timeseries")
+def dash_timeseries(
+    start: str | None = None,
+    end: str | None = None,
+    bucket: str = Query("day", pattern="^(hour|day|week)$"),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    from . import analytics  # NumPy só carrega quando usado
+    s, e = _parse_bounds(start, end)
+    try:
+        return cache.dashboard.get_or_compute(
+            ("timeseries", s, e, bucket), s, e, lambda: analytics.timeseries(db, s, e, bucket)
+        )
+    except ValueError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+
+@app.get("/api/dashboard/heatmap")
+def dash_heatmap(
+    start: str | None = None,
+    end: str | None = None,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    from . import analytics  # NumPy só carrega quando usado
+    # dia da semana x hora (para escala dos caixas)
+    s, e = _parse_bounds(start, end)
+    return cache.dashboard.get_or_compute(
+        ("heatmap", s, e, None), s, e, lambda: analytics.heatmap(db, s, e)
+    )
 
 @app.get("/api/dashboard/export/sales.csv")
 def dash_export_sales_csv(
@@ -307,6 +438,43 @@ def dash_export_sales_csv(
         headers={"Content-Disposition": "attachment; filename=sales.csv"},
     )
 
+# ---------------------------
+#   EVENTOS AO VIVO (SSE)
+# ---------------------------
+
+SSE_PING_SECONDS = 15
+
+@app.get("/api/events/stream")
+def events_stream(
+    request: Request,
+    token: str | None = None,
+    authorization: str | None = Header(default=None),
+    db: Session = Depends(get_db),
+):
+    # EventSource não envia cabeçalhos: aceita o token também via ?token=
+    user = user_from_token_str(authorization or (f"Bearer {token}" if token else None), db)
+    if not user:
+        raise HTTPException(status_code=401, detail="Não autenticado")
+
+    async def stream():
+        sub = events.broker.subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    msg = await asyncio.wait_for(sub.queue.get(), timeout=SSE_PING_SECONDS)
+                except asyncio.TimeoutError:
+                    msg = ": ping\n\n"
+                yield msg
+        finally:
+            events.broker.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # ---------------------------
 #          CLIENTS
 # ---------------------------
@@ -338,6 +506,7 @@ def upload_product_image(
         raise HTTPException(status_code=400, detail="Formato inválido (use JPG, PNG ou WEBP).")
 
     name = f"{uuid.uuid4().hex}{ext}"
+    os.makedirs(PRODUCTS_DIR, exist_ok=True)
     path = os.path.join(PRODUCTS_DIR, name)
     with open(path, "wb") as f:
         f.write(file.file.read())
@@ -346,7 +515,10 @@ def upload_product_image(
     return {"url": url}
 
 # 1) Buscar por SKU/EAN/nome (ESTÁTICA — antes da dinâmica)
-@app.get("/api/products/find", response_model=schemas.ProductOut)
+def _ambiguous(e: crud.AmbiguousScan) -> JSONResponse:
+    # 300 Multiple Choices: o PDV mostra a lista para o caixa escolher
+    return JSONResponse(status_code=300, content={"detail": str(e), "candidates": e.candidates})
+
 def find_product(
     query: str = Query("", max_length=128),   # sem min_length para evitar 422
     db: Session = Depends(get_db),
@@ -354,11 +526,88 @@ def find_product(
     q = (query or "").strip()
     if not q:
         raise HTTPException(status_code=400, detail="Código inválido. Informe o SKU/EAN/nome.")
-    prod = crud.find_product(db, q)
+    try:
+        prod = crud.find_product(db, q)
+    except crud.AmbiguousScan as e:
+        return _ambiguous(e)
     if not prod:
         raise HTTPException(status_code=404, detail="Produto não encontrado. Cadastre no inventário primeiro.")
     return prod
 
+async def find_product_async(
+    query: str = Query("", max_length=128),
+    db=Depends(get_async_db),
+):
+    q = (query or "").strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="Código inválido. Informe o SKU/EAN/nome.")
+    try:
+        prod = await crud_async.find_product(db, q)
+    except crud.AmbiguousScan as e:
+        return _ambiguous(e)
+    if not prod:
+        raise HTTPException(status_code=404, detail="Produto não encontrado. Cadastre no inventário primeiro.")
+    return prod
+
+app.get("/api/products/find", response_model=schemas.ProductOut)(
+    find_product_async if database.ASYNC_DB else find_product
+)
+
+# 1b) Candidatos ordenados (SKU, código de barras, início do SKU/nome, trecho)
+def resolve_product(
+    query: str = Query("", max_length=128),
+    limit: int = Query(crud.RESOLVE_LIMIT, ge=1, le=50),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    return crud.resolve(db, query, limit)
+
+async def resolve_product_async(
+    query: str = Query("", max_length=128),
+    limit: int = Query(crud.RESOLVE_LIMIT, ge=1, le=50),
+    db=Depends(get_async_db),
+    user=Depends(get_current_user_async),
+):
+    return await crud_async.resolve(db, query, limit)
+
+app.get("/api/products/resolve", response_model=schemas.ResolveOut)(
+    resolve_product_async if database.ASYNC_DB else resolve_product
+)
+
+# 1c) Autocompletar do PDV (índice em memória, backend/suggest.py)
+def suggest_products(
+    query: str = Query("", max_length=128),
+    limit: int = Query(suggest.SUGGEST_LIMIT, ge=1, le=50),
+    user=Depends(get_current_user),
+):
+    suggest.ensure_built()
+    return {"items": suggest.index.suggest(query, limit)}
+
+async def suggest_products_async(
+    query: str = Query("", max_length=128),
+    limit: int = Query(suggest.SUGGEST_LIMIT, ge=1, le=50),
+    user=Depends(get_current_user_async),
+):
+    suggest.ensure_built()
+    return {"items": suggest.index.suggest(query, limit)}
+
+app.get("/api/products/suggest", response_model=schemas.SuggestOut)(
+    suggest_products_async if database.ASYNC_DB else suggest_products
+)
+
+# Exportação do catálogo com variações e estoque (ESTÁTICA — antes da dinâmica)
+@app.get("/api/products/export")
+def export_products(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    _: models.User = Depends(require_admin),
+):
+    media = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        catalog.iter_export(format),
+        media_type=media,
+        headers={"Content-Disposition": f"attachment; filename=catalog.{format}"},
+    )
+
 # 2) Criar (regra de duplicidade: mesmo sku+name não permitido)
 @app.post("/api/products", response_model=schemas.ProductOut)
 def create_product(
@@ -367,20 +616,33 @@ def create_product(
     _: models.User = Depends(require_admin),
 ):
     try:
-        return crud.create_product_strict(db, p)
+        created = crud.create_product_strict(db, p)
     except ValueError as e:
         raise HTTPException(status_code=409, detail=str(e))
+    audit.record("create", "product", created.id, sku=created.sku, name=created.name, price=created.price)
+    return created
 
-# 3) Listar
-@app.get("/api/products")
-def list_products(
-    query: str | None = None,
-    limit: int = 50,
-    offset: int = 0,
+# Importação em massa (CSV/XLSX) — responde com relatório por linha
+@app.post("/api/products/import")
+def import_products(
+    file: UploadFile = File(...),
     db: Session = Depends(get_db),
-    user=Depends(get_current_user),
+    _: models.User = Depends(require_admin),
 ):
-    items, total = crud.list_products(db, query=query, limit=limit, offset=offset)
+    ext = os.path.splitext(file.filename or "")[1].lower()
+    if ext not in {".csv", ".txt", ".xlsx"}:
+        raise HTTPException(status_code=400, detail="Formato inválido (use CSV ou XLSX).")
+    rows = catalog.iter_xlsx(file.file) if ext == ".xlsx" else catalog.iter_csv(file.file)
+    try:
+        report = catalog.import_rows(db, rows)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    audit.record("import", "catalog", None, file=file.filename,
+                 **{k: v for k, v in report.items() if k != "errors"})
+    return report
+
+# 3) Listar
+def _product_page(items, total) -> dict:
     return {
         "items": [
             {
@@ -396,6 +658,27 @@ def list_products(
         "total": total,
     }
 
+def list_products(
+    query: str | None = None,
+    limit: int = 50,
+    offset: int = 0,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    items, total = crud.list_products(db, query=query, limit=limit, offset=offset)
+    return _product_page(items, total)
+
+async def list_products_async(
+    query: str | None = None,
+    limit: int = 50,
+    offset: int = 0,
+    db=Depends(get_async_db),
+    user=Depends(get_current_user_async),
+):
+    return _product_page(*await crud_async.list_products(db, query, limit=limit, offset=offset))
+
+app.get("/api/products")(list_products_async if database.ASYNC_DB else list_products)
+
 # 4) Obter por ID (DINÂMICA — depois da /find)
 @app.get("/api/products/{product_id}", response_model=schemas.ProductOut)
 def get_product(
@@ -422,6 +705,7 @@ def update_product(
         raise HTTPException(status_code=409, detail=str(e))
     if not updated:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
+    audit.record("update", "product", product_id, **p.model_dump(exclude_unset=True))
     return updated
 
 # ---------- VARIANTS (NOVO) ----------
@@ -451,22 +735,189 @@ def upsert_product_variant(
     if not p:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
     pv = crud.upsert_variant(db, product_id, payload)
+    audit.record("upsert", "variant", pv.id, product_id=product_id, **payload.model_dump())
     return schemas.VariantOut.model_validate(pv)
 
+# ---------- CÓDIGOS DE BARRAS ----------
+
+@app.get("/api/products/{product_id}/barcodes", response_model=list[schemas.BarcodeOut])
+def list_product_barcodes(
+    product_id: int = Path(..., ge=1),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    if not crud.get_product(db, product_id):
+        raise HTTPException(status_code=404, detail="Produto não encontrado")
+    return [crud.barcode_out(bc) for bc in crud.list_barcodes(db, product_id)]
+
+@app.post("/api/products/{product_id}/barcodes", response_model=schemas.BarcodeOut)
+def add_product_barcode(
+    product_id: int = Path(..., ge=1),
+    payload: schemas.BarcodeCreate = ...,
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_admin),
+):
+    p = crud.get_product(db, product_id)
+    if not p:
+        raise HTTPException(status_code=404, detail="Produto não encontrado")
+    try:
+        bc = crud.add_barcode(db, p, payload)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    audit.record("create", "barcode", bc.id, product_id=product_id, **payload.model_dump())
+    return crud.barcode_out(bc)
+
+@app.delete("/api/barcodes/{barcode_id}")
+def delete_barcode(
+    barcode_id: int = Path(..., ge=1),
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_admin),
+):
+    if not crud.delete_barcode(db, barcode_id):
+        raise HTTPException(status_code=404, detail="Código de barras não encontrado")
+    audit.record("delete", "barcode", barcode_id)
+    return {"ok": True}
+
+# ---------------------------
+#          ESTOQUE
+# ---------------------------
+
+@app.get("/api/inventory/low-stock")
+def inventory_low_stock(
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    rows = crud.list_low_stock(db, after_id=after_id, limit=limit)
+    return {
+        "items": [
+            {
+                "variant_id": r.id,
+                "product_id": r.product_id,
+                "sku": r.sku,
+                "name": r.name,
+                "variant": r.variant,
+                "stock": r.stock,
+                "min_stock": r.min_stock,
+                "missing": r.min_stock - r.stock,
+                "price": r.price,
+                "image_url": r.image_url,
+            }
+            for r in rows
+        ],
+        # próxima página: ?after_id=<next_after_id>
+        "next_after_id": rows[-1].id if len(rows) == limit else None,
+    }
+
+@app.get("/api/inventory/stock-at")
+def inventory_stock_at(
+    variant_id: int = Query(..., ge=1),
+    at: str = Query(..., description="YYYY-MM-DD ou YYYY-MM-DDTHH:MM"),
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_admin),
+):
+    try:
+        when = datetime.fromisoformat(at)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Data inválida.")
+    if len(at) == 10:
+        when = datetime.combine(when.date(), time.max)
+    if not db.get(models.ProductVariant, variant_id):
+        raise HTTPException(status_code=404, detail="Variação não encontrada")
+    return {"variant_id": variant_id, "at": when.isoformat(), "stock": stock.stock_at(db, variant_id, when)}
+
+# Inventário / recebimento em lote
+def _stock_session_or_404(db: Session, session_id: int) -> models.StockSession:
+    sess = stocktake.get_session(db, session_id)
+    if not sess:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+    return sess
+
+@app.post("/api/inventory/sessions")
+def inventory_open_session(
+    payload: schemas.StockSessionCreate,
+    db: Session = Depends(get_db),
+    user: models.User = Depends(require_admin),
+):
+    sess = stocktake.open_session(db, payload.kind, user.username)
+    return stocktake.session_summary(db, sess)
+
+@app.get("/api/inventory/sessions/{session_id}")
+def inventory_get_session(
+    session_id: int = Path(..., ge=1),
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_admin),
+):
+    return stocktake.session_summary(db, _stock_session_or_404(db, session_id))
+
+@app.post("/api/inventory/sessions/{session_id}/scans")
+def inventory_add_scans(
+    payload: schemas.StockScanIn,
+    session_id: int = Path(..., ge=1),
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_admin),
+):
+    sess = _stock_session_or_404(db, session_id)
+    try:
+        return stocktake.add_scans(db, sess, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/api/inventory/sessions/{session_id}/apply")
+def inventory_apply_session(
+    session_id: int = Path(..., ge=1),
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_admin),
+):
+    sess = _stock_session_or_404(db, session_id)
+    try:
+        result = stocktake.apply_session(db, sess)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    audit.record("apply", "stock_session", session_id, kind=result["kind"], changed=result["changed"],
+                 units_in=result["units_in"], units_out=result["units_out"])
+    return result
+
+@app.delete("/api/inventory/sessions/{session_id}")
+def inventory_cancel_session(
+    session_id: int = Path(..., ge=1),
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_admin),
+):
+    sess = _stock_session_or_404(db, session_id)
+    try:
+        stocktake.cancel_session(db, sess)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    audit.record("cancel", "stock_session", session_id)
+    return {"ok": True}
+
 # ---------------------------
 #           SALES
 # ---------------------------
 
-@app.post("/api/sales", response_model=schemas.SaleOut)
 def create_sale(
     payload: schemas.SaleIn, db: Session = Depends(get_db), user=Depends(get_current_user)
 ):
     try:
-        return crud.create_sale(db, payload)
+        return crud.create_sale(db, payload, operator=user.username)
     except ValueError as e:
         # caso você ative o bloqueio de estoque no crud
         raise HTTPException(status_code=409, detail=str(e))
 
+async def create_sale_async(
+    payload: schemas.SaleIn, db=Depends(get_async_db), user=Depends(get_current_user_async)
+):
+    try:
+        return await crud_async.create_sale(db, payload, operator=user.username)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+app.post("/api/sales", response_model=schemas.SaleOut)(create_sale_async if database.ASYNC_DB else create_sale)
+
 @app.get("/api/sales")
 def list_sales(
     limit: int = 20, db: Session = Depends(get_db), user=Depends(get_current_user)
@@ -506,6 +957,68 @@ def list_sales(
 #      ADMINISTRAÇÃO
 # ---------------------------
 
+@app.post("/api/admin/products/bulk-price")
+def admin_bulk_price(
+    payload: schemas.BulkPriceIn,
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_admin),
+):
+    try:
+        result = catalog.bulk_update_prices(db, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not payload.dry_run:
+        audit.record("bulk_price", "catalog", None, products=result["products"], variants=result["variants"],
+                     **payload.model_dump(exclude={"dry_run"}))
+    return result
+
+@app.get("/api/admin/startup")
+def admin_startup(_: models.User = Depends(require_admin)):
+    # tempo de boot por fase deste worker
+    return startup.report()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def admin_metrics(_: models.User = Depends(require_admin)):
+    # formato texto do Prometheus (scrape com Authorization: Bearer <token>)
+    c = cache.dashboard.stats()
+    body = metrics.render(engine, [
+        ("pdv_events_subscribers", "Clientes conectados no stream de eventos.", events.broker.subscribers),
+        ("pdv_dashboard_cache_entries", "Entradas no cache do dashboard.", c["size"]),
+        ("pdv_dashboard_cache_hits", "Acertos do cache do dashboard.", c["hits"]),
+        ("pdv_dashboard_cache_misses", "Faltas do cache do dashboard.", c["misses"]),
+        *admission.gauges(),
+    ])
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.get("/api/admin/profiles")
+def admin_list_profiles(_: models.User = Depends(require_admin)):
+    # perfis deste worker (por requisição e janelas de amostragem)
+    return profiling.list_profiles()
+
+@app.get("/api/admin/profiles/{profile_id}", response_class=PlainTextResponse)
+def admin_get_profile(
+    profile_id: int,
+    format: str = Query("folded", pattern="^(folded|top)$"),
+    _: models.User = Depends(require_admin),
+):
+    prof = profiling.get_profile(profile_id)
+    if not prof or not prof.sampler:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    if format == "top":
+        return JSONResponse({**prof.info(), "top": prof.sampler.top(30)})
+    return PlainTextResponse(prof.sampler.folded())
+
+@app.post("/api/admin/profiler/sample")
+def admin_sample(
+    seconds: float = Query(30, gt=0, le=600),
+    hz: int = Query(50, ge=1, le=250),
+    _: models.User = Depends(require_admin),
+):
+    try:
+        return profiling.start_window(seconds, hz).info()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
 @app.get("/api/admin/users", response_model=list[schemas.UserOut])
 def admin_list_users(db: Session = Depends(get_db), _: models.User = Depends(require_admin)):
     users = crud.list_users(db)
@@ -527,9 +1040,10 @@ def admin_create_user(payload: schemas.UserCreate, db: Session = Depends(get_db)
                     else ["dashboard","vendas","produtos","administracao"])
             ),
         )
-        return _user_to_dict(u)
     except ValueError as e:
         raise HTTPException(status_code=409, detail=str(e))
+    audit.record("create", "user", u.id, username=u.username, role=u.role, permissions=u.permissions)
+    return _user_to_dict(u)
 
 @app.put("/api/admin/users/{user_id}", response_model=schemas.UserOut)
 def admin_update_user(user_id: int, payload: schemas.UserUpdate, db: Session = Depends(get_db), _: models.User = Depends(require_admin)):
@@ -539,6 +1053,9 @@ def admin_update_user(user_id: int, payload: schemas.UserUpdate, db: Session = D
     u = crud.update_user(db, user_id, payload)
     if not u:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
+    # nunca grava a senha na auditoria
+    changed = payload.model_dump(exclude_unset=True, exclude={"password"})
+    audit.record("update", "user", user_id, **changed, password_changed="password" in payload.model_fields_set)
     return _user_to_dict(u)
 
 @app.delete("/api/admin/users/{user_id}")
@@ -546,6 +1063,7 @@ def admin_delete_user(user_id: int, db: Session = Depends(get_db), _: models.Use
     ok = crud.delete_user(db, user_id)
     if not ok:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
+    audit.record("delete", "user", user_id)
     return {"ok": True}
 
 # ---------------------------
@@ -555,3 +1073,4 @@ def admin_delete_user(user_id: int, db: Session = Depends(get_db), _: models.Use
 FRONT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "frontend"))
 # Montado por último para não interceptar as rotas /api/*
 app.mount("/", StaticFiles(directory=FRONT_DIR, html=True), name="frontend")
+startup.mark("routes")
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from . import models
+from .accesslog import current_user
+from .database import engine
+
+# =========================
+# Auditoria em lote
+# =========================
+# record() só enfileira; uma thread grava em audit_log quando junta
+# PDV_AUDIT_BATCH registros ou passa PDV_AUDIT_FLUSH_MS desde o primeiro
+# da fila (um INSERT executemany por lote, fora da transação da rota).
+# Chame depois do commit da mutação, para não auditar o que não aconteceu.
+
+BATCH = int(os.getenv("PDV_AUDIT_BATCH", "100"))
+FLUSH_MS = int(os.getenv("PDV_AUDIT_FLUSH_MS", "500"))
+
+log = logging.getLogger("uvicorn.error")
+_q: queue.SimpleQueue[dict] = queue.SimpleQueue()
+_thread: threading.Thread | None = None
+_lock = threading.Lock()
+_idle = threading.Event()
+_idle.set()
+
+
+def record(action: str, entity: str, entity_id=None, actor: str | None = None, **detail) -> None:
+    """Enfileira um registro (ator padrão: o usuário da requisição)."""
+    _q.put({
+        "at": datetime.now(),
+        "actor": actor if actor is not None else current_user(),
+        "action": action,
+        "entity": entity,
+        "entity_id": None if entity_id is None else str(entity_id),
+        "detail": json.dumps(detail, ensure_ascii=False, default=str) if detail else None,
+    })
+    _ensure_thread()
+
+
+def _ensure_thread() -> None:
+    global _thread
+    if _thread is None:
+        with _lock:
+            if _thread is None:
+                _thread = threading.Thread(target=_run, name="pdv-audit", daemon=True)
+                _thread.start()
+                atexit.register(flush)
+
+
+def _write(rows: list[dict]) -> None:
+    try:
+        with engine.begin() as conn:
+            conn.execute(insert(models.AuditLog.__table__), rows)
+    except Exception:
+        # não perde o rastro: vai para o log do servidor
+        log.exception("Falha ao gravar %d registros de auditoria: %s",
+                      len(rows), json.dumps(rows, default=str, ensure_ascii=False))
+
+
+def _run() -> None:
+    while True:
+        rows = [_q.get()]
+        _idle.clear()
+        deadline = time.monotonic() + FLUSH_MS / 1000.0
+        while len(rows) < BATCH:
+            try:
+                rows.append(_q.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        with _lock:
+            _write(rows)
+        if _q.empty():
+            _idle.set()
+
+
+def flush() -> None:
+    """Grava já o que estiver na fila (shutdown, scripts)."""
+    rows = []
+    while True:
+        try:
+            rows.append(_q.get_nowait())
+        except queue.Empty:
+            break
+    if rows:
+        with _lock:
+            _write(rows)
+    # e espera o lote que a thread já estava montando
+    _idle.wait(timeout=FLUSH_MS / 1000.0 + 5)
@@ -3,10 +3,11 @@ from datetime import datetime, timedelta, timezone
 from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
 from sqlalchemy.orm import Session
-from .database import get_db
+from .database import get_db, get_async_db
 from . import crud, models
+from .tracing import traced
+from .accesslog import set_user
 from fastapi import Header
 
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-change-me")
@@ -14,13 +15,21 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "360"))
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+def _jose():
+    # python-jose (+ cryptography) carrega na 1ª requisição autenticada, não no boot
+    from jose import jwt, JWTError
+    return jwt, JWTError
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+    jwt, JWTError = _jose()
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+@traced("auth.get_current_user")
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> models.User:
+    jwt, JWTError = _jose()
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Não autenticado", headers={"WWW-Authenticate": "Bearer"})
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -32,9 +41,11 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     user = crud.get_user_by_username(db, username=username)
     if user is None:
         raise credentials_exception
+    set_user(user.username)  # log de acesso / auditoria
     return user
 
 def user_from_token_str(token: Optional[str], db: Session) -> Optional[models.User]:
+    jwt, JWTError = _jose()
     if not token: return None
     if token.lower().startswith("bearer "): token = token.split(" ",1)[1]
     try:
@@ -45,12 +56,14 @@ def user_from_token_str(token: Optional[str], db: Session) -> Optional[models.Us
     except JWTError:
         return None
 
+@traced("auth.require_admin")
 def require_admin(user: models.User = Depends(get_current_user)) -> models.User:
     if user.role != "admin":
         raise HTTPException(status_code=403, detail="Apenas administradores")
     return user
 
 def user_from_token_str(authorization: str | None, db: Session) -> models.User | None:
+    jwt, JWTError = _jose()
     if not authorization:
         return None
     scheme, _, token = authorization.partition(" ")
@@ -65,6 +78,7 @@ def user_from_token_str(authorization: str | None, db: Session) -> models.User |
         return None
     return crud.get_user_by_username(db, username)
 
+@traced("auth.get_current_user")
 def get_current_user(
     authorization: str | None = Header(default=None),
     db: Session = Depends(get_db),
@@ -72,6 +86,29 @@ def get_current_user(
     user = user_from_token_str(authorization, db)
     if not user:
         raise HTTPException(status_code=401, detail="Não autenticado")
+    set_user(user.username)  # log de acesso / auditoria
+    return user
+
+@traced("auth.get_current_user_async")
+async def get_current_user_async(
+    authorization: str | None = Header(default=None),
+    db=Depends(get_async_db),
+) -> models.User:
+    """Igual a get_current_user, para as rotas async (database.ASYNC_DB)."""
+    from . import crud_async
+
+    jwt, JWTError = _jose()
+    scheme, _, token = (authorization or "").partition(" ")
+    username = None
+    if scheme.lower() == "bearer" and token:
+        try:
+            username = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+        except JWTError:
+            username = None
+    user = await crud_async.get_user_by_username(db, username) if username else None
+    if not user:
+        raise HTTPException(status_code=401, detail="Não autenticado")
+    set_user(user.username)  # log de acesso / auditoria
     return user
 
 def require_permission(perm: str):
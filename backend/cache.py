@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Hashable
+
+# =========================
+# Cache de resultados do dashboard
+# =========================
+# Cache em processo (cada worker do uvicorn tem o seu), com:
+#   - LRU limitado por DASH_CACHE_SIZE;
+#   - single-flight: requisições idênticas simultâneas esperam o mesmo cálculo;
+#   - invalidação por venda: ao gravar uma venda, caem apenas as entradas
+#     cujo período contém o horário da venda. Períodos passados ficam até
+#     serem despejados pelo LRU.
+
+DASH_CACHE_SIZE = int(os.getenv("DASH_CACHE_SIZE", "256"))
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "stale", "start", "end", "waiters")
+
+    def __init__(self, start: datetime, end: datetime):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.stale = False
+        self.start = start
+        self.end = end
+        # seguidores assíncronos: (loop, future) acordados ao terminar
+        self.waiters: list = []
+
+
+class RangeCache:
+    def __init__(self, maxsize: int = DASH_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        # key -> (start, end, value)
+        self._data: OrderedDict[Hashable, tuple[datetime, datetime, Any]] = OrderedDict()
+        self._flights: dict[Hashable, _Flight] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(
+        self,
+        key: Hashable,
+        start: datetime,
+        end: datetime,
+        compute: Callable[[], Any],
+    ) -> Any:
+        """Retorna o valor em cache ou calcula uma única vez por chave."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight(start, end)
+                self._flights[key] = flight
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._land(key, flight)
+        return flight.result
+
+    async def aget_or_compute(
+        self,
+        key: Hashable,
+        start: datetime,
+        end: datetime,
+        compute: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """Versão para rotas async: `compute` é uma corrotina; espera sem bloquear o loop."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight(start, end)
+                self._flights[key] = flight
+            else:
+                loop = asyncio.get_running_loop()
+                fut = loop.create_future()
+                flight.waiters.append((loop, fut))
+
+        if not leader:
+            await fut
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = await compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._land(key, flight)
+        return flight.result
+
+    def _land(self, key: Hashable, flight: _Flight) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            # venda gravada durante o cálculo: entrega, mas não guarda
+            if flight.error is None and not flight.stale:
+                self._data[key] = (flight.start, flight.end, flight.result)
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+            flight.done.set()
+            waiters, flight.waiters = flight.waiters, []
+        for loop, fut in waiters:
+            loop.call_soon_threadsafe(_wake, fut)
+
+    def invalidate_at(self, moment: datetime) -> int:
+        """Descarta as entradas cujo período contém `moment`."""
+        with self._lock:
+            dead = [k for k, (s, e, _) in self._data.items() if s <= moment <= e]
+            for k in dead:
+                del self._data[k]
+            for k, f in list(self._flights.items()):
+                if f.start <= moment <= f.end:
+                    f.stale = True
+                    # novas requisições não devem aproveitar um cálculo vencido
+                    del self._flights[k]
+        return len(dead)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+def _wake(fut) -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+dashboard = RangeCache()
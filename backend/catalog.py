@@ -0,0 +1,386 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+from typing import IO, Iterable, Iterator
+
+from sqlalchemy import Integer, case, cast, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from . import models, schemas, suggest
+
+# =========================
+# Importação em massa (CSV / XLSX)
+# =========================
+# O arquivo é lido linha a linha e processado em blocos: cada bloco faz
+# poucas consultas por conjunto (IN) e grava com executemany numa única
+# transação. Erros de validação não interrompem a importação; voltam num
+# relatório por linha.
+
+IMPORT_CHUNK = int(os.getenv("IMPORT_CHUNK", "1000"))
+
+# cabeçalho aceito (também em português)
+COLUMN_ALIASES = {
+    "sku": "sku", "codigo": "sku", "código": "sku",
+    "name": "name", "nome": "name",
+    "variant": "variant", "variacao": "variant", "variação": "variant",
+    "price": "price", "preco": "price", "preço": "price",
+    "variant_price": "variant_price", "preco_variacao": "variant_price",
+    "stock": "stock", "estoque": "stock",
+    "min_stock": "min_stock", "estoque_minimo": "min_stock",
+    "image_url": "image_url", "imagem": "image_url",
+}
+
+
+def iter_csv(fileobj: IO[bytes]) -> Iterator[list]:
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(text, dialect)
+
+
+def iter_xlsx(fileobj: IO[bytes]) -> Iterator[list]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:  # dependência opcional
+        raise ValueError("Importação XLSX requer o pacote openpyxl.")
+    wb = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        for row in wb.active.iter_rows(values_only=True):
+            yield ["" if v is None else v for v in row]
+    finally:
+        wb.close()
+
+
+def _num(v, cast, field: str):
+    if v is None or (isinstance(v, str) and not v.strip()):
+        return None
+    if isinstance(v, str):
+        v = v.strip().replace(",", ".")
+    try:
+        return cast(v)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} inválido: {v!r}")
+
+
+def _parse_row(header: list[str], values: list) -> dict:
+    rec = {k: values[i] if i < len(values) else None for i, k in enumerate(header) if k}
+    sku = str(rec.get("sku") or "").strip()
+    name = str(rec.get("name") or "").strip()
+    if not sku or not name:
+        raise ValueError("SKU e nome são obrigatórios.")
+    price = _num(rec.get("price"), float, "preço")
+    if price is not None and price < 0:
+        raise ValueError("preço negativo.")
+    return {
+        "sku": sku,
+        "name": name,
+        "variant": str(rec.get("variant") or "").strip() or None,
+        "price": price,
+        "variant_price": _num(rec.get("variant_price"), float, "preço da variação"),
+        "stock": _num(rec.get("stock"), lambda x: int(float(x)), "estoque"),
+        "min_stock": _num(rec.get("min_stock"), lambda x: int(float(x)), "estoque mínimo"),
+        "image_url": str(rec.get("image_url") or "").strip() or None,
+    }
+
+
+def _apply_chunk(db: Session, rows: list[tuple[int, dict]], report: dict) -> list[tuple[int, str, str]]:
+    """Grava o bloco (sem commit). Devolve (id, sku, nome) dos produtos novos."""
+    P, PV = models.Product, models.ProductVariant
+
+    def merge(acc: dict, key, r: dict) -> None:
+        # (sku, nome) repetido no bloco: valores preenchidos da última linha vencem
+        prev = acc.get(key)
+        acc[key] = r if prev is None else {**prev, **{k: v for k, v in r.items() if v is not None}}
+
+    def key(r: dict) -> tuple[str, str]:
+        # mesma chave do índice único uq_products_sku_name_key
+        return models.ci_key(r["sku"]), models.ci_key(r["name"])
+
+    prods: dict[tuple[str, str], dict] = {}
+    for _, r in rows:
+        merge(prods, key(r), r)
+
+    def lookup() -> dict[tuple[str, str], models.Product]:
+        skus = {k[0] for k in prods}
+        found = db.execute(
+            select(P.id, P.variant, P.sku_key, P.name_key).where(P.sku_key.in_(skus))
+        ).all()
+        return {(f.sku_key, f.name_key): f for f in found}
+
+    existing = lookup()
+    new_p = [
+        {"sku": r["sku"], "name": r["name"], "sku_key": k[0], "name_key": k[1],
+         "sku_search": models.search_key(r["sku"]), "name_search": models.search_key(r["name"]),
+         "variant": r["variant"], "price": r["price"] or 0.0, "image_url": r["image_url"]}
+        for k, r in prods.items() if k not in existing
+    ]
+    upd_p = []
+    for k, r in prods.items():
+        if k in existing:
+            vals = {"id": existing[k].id}
+            if r["price"] is not None:
+                vals["price"] = r["price"]
+            if r["image_url"]:
+                vals["image_url"] = r["image_url"]
+            if len(vals) > 1:
+                upd_p.append(vals)
+    created = []
+    if new_p:
+        db.execute(insert(P), new_p)
+        existing = lookup()
+        created = [(existing[(r["sku_key"], r["name_key"])].id, r["sku"], r["name"]) for r in new_p]
+    if upd_p:
+        db.execute(update(P), upd_p)
+    report["created_products"] += len(new_p)
+    report["updated_products"] += len(upd_p)
+
+    # variações: (product_id, variante) -> linha
+    wanted: dict[tuple[int, str], dict] = {}
+    for _, r in rows:
+        prod = existing[key(r)]
+        varname = r["variant"] or prod.variant
+        if varname:
+            merge(wanted, (prod.id, varname), r)
+    if not wanted:
+        return created
+
+    def lookup_variants() -> dict[tuple[int, str], models.ProductVariant]:
+        pids = {k[0] for k in wanted}
+        found = db.execute(
+            select(PV.id, PV.product_id, PV.variant, PV.stock).where(PV.product_id.in_(pids))
+        ).all()
+        return {(f.product_id, f.variant): f for f in found}
+
+    have = lookup_variants()
+    new_v, upd_v, moves = [], [], []
+    for (pid, varname), r in wanted.items():
+        cur = have.get((pid, varname))
+        if cur is None:
+            new_v.append({
+                "product_id": pid, "variant": varname, "stock": r["stock"] or 0,
+                "min_stock": r["min_stock"] or 0, "price": r["variant_price"],
+            })
+            continue
+        vals = {"id": cur.id}
+        if r["stock"] is not None and r["stock"] != cur.stock:
+            vals["stock"] = r["stock"]
+            moves.append({"variant_id": cur.id, "delta": r["stock"] - cur.stock, "kind": "adjust"})
+        if r["min_stock"] is not None:
+            vals["min_stock"] = r["min_stock"]
+        if r["variant_price"] is not None:
+            vals["price"] = r["variant_price"]
+        if len(vals) > 1:
+            upd_v.append(vals)
+    if new_v:
+        db.execute(insert(PV), new_v)
+        have = lookup_variants()
+        for v in new_v:
+            if v["stock"]:
+                moves.append({
+                    "variant_id": have[(v["product_id"], v["variant"])].id,
+                    "delta": v["stock"], "kind": "adjust",
+                })
+    if upd_v:
+        db.execute(update(PV), upd_v)
+    if moves:
+        db.execute(insert(models.StockMovement), moves)
+    report["created_variants"] += len(new_v)
+    report["updated_variants"] += len(upd_v)
+    return created
+
+
+def import_rows(db: Session, rows: Iterable[list], chunk_size: int = IMPORT_CHUNK) -> dict:
+    """Importa produtos/variações de linhas (a primeira é o cabeçalho)."""
+    report = {
+        "rows": 0,
+        "created_products": 0, "updated_products": 0,
+        "created_variants": 0, "updated_variants": 0,
+        "errors": [],
+    }
+    it = iter(rows)
+    try:
+        raw_header = next(it)
+    except StopIteration:
+        raise ValueError("Arquivo vazio.")
+    header = [COLUMN_ALIASES.get(str(h or "").strip().lower(), "") for h in raw_header]
+    if "sku" not in header or "name" not in header:
+        raise ValueError("Cabeçalho precisa conter as colunas sku e name.")
+
+    def flush(batch: list[tuple[int, dict]]) -> None:
+        try:
+            created = _apply_chunk(db, batch, report)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            report["errors"].extend({"row": n, "error": f"bloco não gravado: {e}"} for n, _ in batch)
+            return
+        suggest.index.upsert_many(created)
+
+    batch: list[tuple[int, dict]] = []
+    for lineno, values in enumerate(it, start=2):
+        if not any(str(v).strip() for v in values if v is not None):
+            continue
+        report["rows"] += 1
+        try:
+            batch.append((lineno, _parse_row(header, values)))
+        except ValueError as e:
+            report["errors"].append({"row": lineno, "error": str(e)})
+        if len(batch) >= chunk_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return report
+
+
+# =========================
+# Exportação (streaming)
+# =========================
+# Uma linha por variação (produto sem variação sai com variant vazio).
+# yield_per mantém a memória constante independentemente do catálogo.
+
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "1000"))
+EXPORT_COLUMNS = [
+    "product_id", "sku", "name", "variant_id", "variant",
+    "price", "stock", "min_stock", "image_url",
+]
+
+
+def _export_query():
+    P, PV = models.Product, models.ProductVariant
+    return (
+        select(
+            P.id, P.sku, P.name, PV.id, PV.variant,
+            func.coalesce(PV.price, P.price),  # preço efetivo
+            PV.stock, PV.min_stock,
+            func.coalesce(PV.image_url, P.image_url),
+        )
+        .outerjoin(PV, PV.product_id == P.id)
+        .order_by(P.id, PV.id)
+        .execution_options(yield_per=EXPORT_BATCH)
+    )
+
+
+def iter_export(fmt: str = "csv") -> Iterator[str]:
+    """Gera o catálogo em blocos de texto (CSV ou NDJSON)."""
+    # sessão própria: o gerador roda depois que o endpoint já retornou
+    with SessionLocal() as db:
+        result = db.execute(_export_query())
+        if fmt == "csv":
+            buf = io.StringIO()
+            w = csv.writer(buf)
+            w.writerow(EXPORT_COLUMNS)
+            for part in result.partitions():
+                w.writerows(part)
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+            if buf.tell():
+                yield buf.getvalue()
+        else:
+            for part in result.partitions():
+                yield "".join(
+                    json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n"
+                    for row in part
+                )
+
+
+# =========================
+# Reajuste de preços em massa
+# =========================
+# Tudo em SQL: o novo preço é uma expressão sobre a coluna e o reajuste
+# vira um único UPDATE por tabela (produtos e/ou variações).
+
+def _ceil(x):
+    # CEIL portátil (SQLite antigo não tem)
+    return cast(x, Integer) + case((x > cast(x, Integer), 1), else_=0)
+
+
+def _new_price(col, data: schemas.BulkPriceIn):
+    if data.mode == "percent":
+        x = col * (1 + data.value / 100.0)
+    else:
+        x = col + data.value
+    x = case((x < 0, 0.0), else_=x)
+    if data.rounding == "cents":
+        x = func.round(x, 2)
+    elif data.rounding == "integer":
+        x = func.round(x, 0)
+    elif data.rounding in ("ends_90", "ends_99"):
+        # próximo preço terminado em ,90 / ,99 (nunca abaixo do calculado)
+        end = 0.90 if data.rounding == "ends_90" else 0.99
+        x = func.round(_ceil(func.round(x, 2) - end) + end, 2)
+    return x
+
+
+def _product_filter(data: schemas.BulkPriceIn) -> list:
+    P = models.Product
+    conds = []
+    if data.sku_prefix:
+        # faixa [prefixo, prefixo + U+FFFF) usa o índice de sku
+        conds += [P.sku >= data.sku_prefix, P.sku < data.sku_prefix + "\uffff"]
+    if data.query:
+        conds.append(P.name.ilike(f"%{data.query}%"))
+    if data.ids:
+        conds.append(P.id.in_(data.ids))
+    if not conds:
+        raise ValueError("Informe ao menos um filtro (sku_prefix, query ou ids).")
+    return conds
+
+
+PREVIEW_LIMIT = 20
+
+
+def bulk_update_prices(db: Session, data: schemas.BulkPriceIn) -> dict:
+    P, PV = models.Product, models.ProductVariant
+    conds = _product_filter(data)
+    out: dict = {"dry_run": data.dry_run, "products": 0, "variants": 0}
+
+    do_products = data.target in ("product", "both")
+    # variação sem preço próprio herda o do produto: só mexe nas que têm
+    var_conds = [PV.price.is_not(None), PV.product_id.in_(select(P.id).where(*conds))]
+    do_variants = data.target in ("variant", "both")
+
+    if data.dry_run:
+        if do_products:
+            out["products"] = db.execute(select(func.count()).select_from(P).where(*conds)).scalar_one()
+            out["preview"] = [
+                {"id": r.id, "sku": r.sku, "name": r.name, "old": r.price, "new": r.new}
+                for r in db.execute(
+                    select(P.id, P.sku, P.name, P.price, _new_price(P.price, data).label("new"))
+                    .where(*conds).order_by(P.id).limit(PREVIEW_LIMIT)
+                )
+            ]
+        if do_variants:
+            out["variants"] = db.execute(select(func.count()).select_from(PV).where(*var_conds)).scalar_one()
+            out["preview_variants"] = [
+                {"id": r.id, "product_id": r.product_id, "variant": r.variant, "old": r.price, "new": r.new}
+                for r in db.execute(
+                    select(PV.id, PV.product_id, PV.variant, PV.price, _new_price(PV.price, data).label("new"))
+                    .where(*var_conds).order_by(PV.id).limit(PREVIEW_LIMIT)
+                )
+            ]
+        return out
+
+    if do_products:
+        res = db.execute(
+            update(P).where(*conds).values(price=_new_price(P.price, data))
+            .execution_options(synchronize_session=False)
+        )
+        out["products"] = res.rowcount
+    if do_variants:
+        res = db.execute(
+            update(PV).where(*var_conds).values(price=_new_price(PV.price, data))
+            .execution_options(synchronize_session=False)
+        )
+        out["variants"] = res.rowcount
+    db.commit()
+    return out
@@ -1,26 +1,34 @@
 from __future__ import annotations
 
+import os
 import re
+import time
+from contextlib import contextmanager
+from functools import lru_cache
 from typing import Optional, List, Tuple
 
-from passlib.context import CryptContext
-from sqlalchemy import select, or_, func
-from sqlalchemy.orm import Session
+from sqlalchemy import select, insert, or_, and_, func, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session, joinedload, selectinload
 
-from . import models, schemas
+from . import models, schemas, events, cache, suggest
 
 # =========================
 # Senhas
 # =========================
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+@lru_cache(maxsize=1)
+def pwd_context():
+    # passlib é carregado no primeiro uso (login/cadastro), não no boot
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 
 def hash_password(password: str) -> str:
     if not password:
         raise ValueError("Password required")
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
 
 def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+    return pwd_context().verify(plain, hashed)
 
 
 # =========================
@@ -55,9 +63,11 @@ def create_user(
     db.refresh(u)
     return u
 
-def _perms_list_to_str(role: str, permissions: list[str] | None) -> str:
+def _perms_list_to_str(role: str, permissions: list[str] | str | None) -> str:
     if (role or "operator") == "admin":
         return "dashboard,vendas,produtos,administracao"
+    if isinstance(permissions, str):
+        permissions = permissions.split(",")  # as rotas mandam o CSV de _perm_join
     perms = permissions or ["vendas"]
     seen = set()
     norm: list[str] = []
@@ -73,7 +83,7 @@ def create_user_with_permissions(
     password: str,
     role: str,
     full_name: str | None,
-    permissions: list[str] | None,
+    permissions: list[str] | str | None,
 ) -> models.User:
     if get_user_by_username(db, username):
         raise ValueError("Usuário já existe.")
@@ -178,20 +188,22 @@ def get_variant_by_name(
         .first()
     )
 
-def ensure_legacy_variant_row(db: Session, product: models.Product) -> None:
+def ensure_legacy_variant_row(db: Session, product: models.Product, commit: bool = True) -> None:
     if product.variants:
         return
     if product.variant:
         pv = models.ProductVariant(
-            product_id=product.id,
             variant=product.variant,
             stock=0,
             min_stock=0,
             price=None,
         )
-        db.add(pv)
-        db.commit()
-        db.refresh(product)
+        product.variants.append(pv)
+        if commit:
+            db.commit()
+            db.refresh(product)
+        else:
+            db.flush()
 
 def product_with_variants(db: Session, product: models.Product) -> models.Product:
     _ = product.variants
@@ -200,6 +212,7 @@ def product_with_variants(db: Session, product: models.Product) -> models.Produc
 def upsert_variant(db: Session, product_id: int, payload: schemas.VariantCreate) -> models.ProductVariant:
     pv = get_variant_by_name(db, product_id, payload.variant)
     if pv:
+        delta = int(payload.stock) - int(pv.stock)
         pv.stock = payload.stock
         pv.min_stock = payload.min_stock
         pv.price = payload.price
@@ -212,38 +225,166 @@ def upsert_variant(db: Session, product_id: int, payload: schemas.VariantCreate)
             price=payload.price,
         )
         db.add(pv)
+        db.flush()
+        delta = int(payload.stock)
+    record_stock_movement(db, pv.id, delta, "adjust")
     db.commit()
     db.refresh(pv)
+    events.publish("stock_changed", {"variants": [events.variant_delta(pv)]})
     return pv
 
-def find_product(db: Session, query: str) -> Optional[models.Product]:
+# ---- Resolução de leitura do caixa ----
+# Do mais exato ao mais solto, parando no primeiro nível que decide:
+#   1. SKU exato          2. código de barras exato
+#   3. início do SKU      4. início do nome      5. trecho do nome
+# Os níveis 3 a 5 usam sku_search/name_search (sem acento: "agua" acha
+# "Água"); 3 e 4 são intervalos nos índices, o 5 percorre a tabela em ordem
+# de id e para no LIMIT. Tudo dentro de RESOLVE_BUDGET_MS:
+# o que não coube no prazo volta como `truncated`.
+
+RESOLVE_LIMIT = 10
+RESOLVE_BUDGET_MS = float(os.getenv("PDV_RESOLVE_BUDGET_MS", "50"))
+
+class AmbiguousScan(LookupError):
+    """Leitura que bate com mais de um produto: o caixa escolhe na lista."""
+
+    def __init__(self, candidates: list[dict]):
+        super().__init__("Mais de um produto encontrado. Escolha na lista.")
+        self.candidates = candidates
+
+def _key_prefix(col, key: str):
+    # col LIKE 'key%' como intervalo (o LIKE sem diferenciar maiúsculas do
+    # SQLite não usa índice); U+10FFFF fica depois de qualquer caractere
+    return and_(col >= key, col < key + "\U0010ffff")
+
+def _resolve_tiers(q: str, limit: int) -> list[tuple[str, object]]:
+    """Consultas de cada nível, já ordenadas e com LIMIT (o nível 2 é find_barcode)."""
+    P = models.Product
+    sku, _v = parse_sku_and_variant(q)
+    key = models.search_key(q)
+    tiers = [
+        ("sku", select(P).where(P.sku == sku).order_by(P.id).limit(limit)),
+        ("sku_prefix", select(P).where(_key_prefix(P.sku_search, key)).order_by(P.sku_search).limit(limit)),
+        ("name_prefix", select(P).where(_key_prefix(P.name_search, key)).order_by(P.name_search).limit(limit)),
+    ]
+    # código lido e não cadastrado: trecho do nome seria varredura inteira à toa
+    if not (q.isdigit() and len(q) >= 8):
+        tiers.append(("name", select(P).where(P.name_search.contains(key, autoescape=True)).order_by(P.id).limit(limit)))
+    return tiers
+
+def _candidate(p: models.Product, tier: str) -> dict:
+    return {
+        "id": p.id,
+        "sku": p.sku,
+        "name": p.name,
+        "variant": p.variant,
+        "price": p.price,
+        "image_url": p.image_url,
+        "tier": tier,
+    }
+
+def _merge_candidates(hits: list, rows, tier: str, limit: int) -> None:
+    """Acrescenta os produtos do nível em `hits`, sem repetir e até `limit`."""
+    seen = {p.id for _t, p in hits}
+    for p in rows:
+        if len(hits) >= limit:
+            break
+        if p.id not in seen:
+            seen.add(p.id)
+            hits.append((tier, p))
+
+def _timeout_ms(deadline: float) -> int:
+    return max(1, int((deadline - time.perf_counter()) * 1000))
+
+def _timed_out(e: OperationalError) -> bool:
+    # SQLite: progress handler; Postgres: statement_timeout
+    msg = str(e.orig)
+    return "interrupted" in msg or "statement timeout" in msg
+
+@contextmanager
+def _time_box(db: Session, deadline: float):
+    """Interrompe a consulta que passar do prazo, dentro do próprio banco.
+
+    SQLite: progress handler. Postgres: SET LOCAL statement_timeout num
+    savepoint; o cancelamento desfaz só o savepoint (e o SET junto), a
+    transação da sessão segue utilizável.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        with db.begin_nested():
+            db.execute(text(f"SET LOCAL statement_timeout = {_timeout_ms(deadline)}"))
+            yield
+            db.execute(text("SET LOCAL statement_timeout TO DEFAULT"))
+        return
+    raw = db.connection().connection.driver_connection
+    if not hasattr(raw, "set_progress_handler"):
+        yield
+        return
+    raw.set_progress_handler(lambda: time.perf_counter() > deadline, 1000)
+    try:
+        yield
+    finally:
+        raw.set_progress_handler(None, 0)
+
+def _resolve(
+    db: Session, query: str, limit: int, budget_ms: float | None
+) -> tuple[list[tuple[str, models.Product]], Optional[models.Barcode], bool]:
+    """(candidatos por nível, código de barras exato, estourou o prazo)."""
     q = _normalize(query)
     if not q:
+        return [], None, False
+    deadline = time.perf_counter() + (RESOLVE_BUDGET_MS if budget_ms is None else budget_ms) / 1000
+
+    # níveis exatos: busca pontual no índice, sempre rodam
+    tiers = _resolve_tiers(q, limit)
+    hits: list[tuple[str, models.Product]] = []
+    _merge_candidates(hits, db.execute(tiers[0][1]).scalars(), "sku", limit)
+    if hits:
+        return hits, None, False
+    bc = find_barcode(db, q)
+    if bc:
+        return [], bc, False
+
+    for tier, stmt in tiers[1:]:
+        if len(hits) >= limit:
+            break
+        if time.perf_counter() >= deadline:
+            return hits, None, True
+        try:
+            with _time_box(db, deadline):
+                rows = db.execute(stmt).scalars().all()
+        except OperationalError as e:
+            if not _timed_out(e):
+                raise
+            return hits, None, True
+        _merge_candidates(hits, rows, tier, limit)
+    return hits, None, False
+
+def resolve(db: Session, query: str, limit: int = RESOLVE_LIMIT, budget_ms: float | None = None) -> dict:
+    """Candidatos ordenados para o que foi lido/digitado no caixa."""
+    hits, bc, truncated = _resolve(db, query, limit, budget_ms)
+    if bc is not None:
+        return {"items": [{**_candidate(bc.product, "barcode"), "match": scan_result(bc)["match"]}],
+                "exact": True, "truncated": False}
+    exact = len(hits) == 1 and hits[0][0] == "sku"
+    return {"items": [_candidate(p, t) for t, p in hits], "exact": exact, "truncated": truncated}
+
+def find_product(db: Session, query: str) -> models.Product | dict | None:
+    """Um produto para a leitura do caixa (ver resolve).
+
+    Pelo código de barras devolve o dict de scan_result (variação exata e
+    preço numa consulta só); nos outros casos, o produto com as variações.
+    Mais de um candidato levanta AmbiguousScan com a lista.
+    """
+    hits, bc, _truncated = _resolve(db, query, RESOLVE_LIMIT, None)
+    if bc is not None:
+        return scan_result(bc)
+    if not hits:
         return None
-
-    sku, _v = parse_sku_and_variant(q)
-
-    p = (
-        db.execute(
-            select(models.Product).where(models.Product.sku == sku)
-        ).scalar_one_or_none()
-    )
-    if not p:
-        p = (
-            db.execute(
-                select(models.Product).where(
-                    or_(
-                        models.Product.sku.ilike(f"%{q}%"),
-                        models.Product.name.ilike(f"%{q}%"),
-                    )
-                )
-            ).scalar_one_or_none()
-        )
-
-    if p:
-        ensure_legacy_variant_row(db, p)
-        return product_with_variants(db, p)
-    return None
+    if len(hits) > 1:
+        raise AmbiguousScan([_candidate(p, t) for t, p in hits])
+    p = hits[0][1]
+    ensure_legacy_variant_row(db, p)
+    return product_with_variants(db, p)
 
 def list_products(
     db: Session, query: str | None, limit: int = 50, offset: int = 0
@@ -269,41 +410,71 @@ def list_products(
     else:
         total = db.query(models.Product).count()
 
+    # variações numa consulta só (selectin), não uma por produto
     items = (
-        db.execute(qsel.order_by(models.Product.id.desc()).limit(limit).offset(offset))
+        db.execute(
+            qsel.options(selectinload(models.Product.variants))
+            .order_by(models.Product.id.desc()).limit(limit).offset(offset)
+        )
         .scalars()
         .all()
     )
-    for p in items:
-        ensure_legacy_variant_row(db, p)
-        _ = p.variants
+    legacy = [p for p in items if not p.variants and p.variant]
+    if legacy:
+        # variações legadas num INSERT só; o commit expira a página, então
+        # ela volta numa releitura por id (mais um selectin), não num
+        # refresh por produto
+        ids = [p.id for p in items]
+        db.execute(
+            insert(models.ProductVariant),
+            [dict(product_id=p.id, variant=p.variant, stock=0, min_stock=0, price=None) for p in legacy],
+        )
+        db.commit()
+        items = (
+            db.execute(
+                select(models.Product)
+                .where(models.Product.id.in_(ids))
+                .options(selectinload(models.Product.variants))
+                .order_by(models.Product.id.desc())
+            )
+            .scalars()
+            .all()
+        )
     return items, total
 
-def create_product_strict(db: Session, data: schemas.ProductCreate) -> models.Product:
-    sku = _normalize(data.sku)
-    name = _normalize(data.name)
-
-    exists = (
-        db.query(models.Product)
-        .filter(
-            func.lower(models.Product.sku) == sku.lower(),
-            func.lower(models.Product.name) == name.lower(),
-        )
-        .first()
+def _is_sku_name_conflict(e: IntegrityError) -> bool:
+    # uq_products_sku_name_key (sem diferenciar maiúsculas) ou a antiga uq_products_sku_name;
+    # o SQLite cita as colunas, o Postgres o nome da restrição
+    msg = str(e.orig)
+    return (
+        "uq_products_sku_name" in msg
+        or "products.sku_key, products.name_key" in msg
+        or "products.sku, products.name" in msg
     )
-    if exists:
-        raise ValueError("Já existe um produto com este SKU e Nome.")
 
+def _commit_product(db: Session) -> None:
+    # a duplicidade de (sku, nome) é garantida pelo índice único do banco:
+    # sem consulta antes do INSERT e sem corrida entre dois cadastros
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if _is_sku_name_conflict(e):
+            raise ValueError("Já existe um produto com este SKU e Nome.") from None
+        raise
+
+def create_product_strict(db: Session, data: schemas.ProductCreate) -> models.Product:
     p = models.Product(
-        sku=sku,
-        name=name,
+        sku=_normalize(data.sku),
+        name=_normalize(data.name),
         variant=_normalize(data.variant),
         price=data.price or 0.0,
         image_url=data.image_url,
     )
     db.add(p)
-    db.commit()
+    _commit_product(db)
     db.refresh(p)
+    suggest.index.upsert(p.id, p.sku, p.name)
 
     ensure_legacy_variant_row(db, p)
     return p
@@ -324,6 +495,7 @@ def update_product(db: Session, product_id: int, data: schemas.ProductUpdate) ->
         prod.image_url = data.image_url
     db.commit()
     db.refresh(prod)
+    suggest.index.upsert(prod.id, prod.sku, prod.name)
     return prod
 
 def update_product_strict(db: Session, product_id: int, data: schemas.ProductUpdate) -> models.Product | None:
@@ -337,19 +509,6 @@ def update_product_strict(db: Session, product_id: int, data: schemas.ProductUpd
     new_sku = _normalize(data.sku) if hasattr(data, "sku") and data.sku is not None else p.sku
     new_name = _normalize(data.name) if hasattr(data, "name") and data.name is not None else p.name
 
-    if new_sku.lower() != p.sku.lower() or new_name.lower() != p.name.lower():
-        conflict = (
-            db.query(models.Product)
-            .filter(
-                func.lower(models.Product.sku) == new_sku.lower(),
-                func.lower(models.Product.name) == new_name.lower(),
-                models.Product.id != p.id,
-            )
-            .first()
-        )
-        if conflict:
-            raise ValueError("Já existe um produto com este SKU e Nome.")
-
     p.sku = new_sku
     if data.name is not None:
         p.name = new_name
@@ -357,8 +516,9 @@ def update_product_strict(db: Session, product_id: int, data: schemas.ProductUpd
         p.variant = _normalize(data.variant)
     if data.price is not None:
         p.price = data.price
-    db.commit()
+    _commit_product(db)
     db.refresh(p)
+    suggest.index.upsert(p.id, p.sku, p.name)
 
     ensure_legacy_variant_row(db, p)
     return p
@@ -369,6 +529,88 @@ def delete_product(db: Session, product_id: int) -> bool:
         return False
     db.delete(prod)
     db.commit()
+    suggest.index.remove(product_id)
+    return True
+
+
+# =========================
+# Códigos de barras
+# =========================
+
+def _barcode_query():
+    # produto e variação no mesmo SELECT (JOIN): uma ida ao banco por leitura
+    return select(models.Barcode).options(
+        joinedload(models.Barcode.product, innerjoin=True),
+        joinedload(models.Barcode.variant),
+    )
+
+def find_barcode(db: Session, code: str) -> Optional[models.Barcode]:
+    return db.execute(
+        _barcode_query().where(models.Barcode.code == code)
+    ).scalar_one_or_none()
+
+def scan_result(bc: models.Barcode) -> dict:
+    """Resposta do /find para um código de barras (formato de ProductOut)."""
+    p, pv = bc.product, bc.variant
+    price = pv.price if pv is not None and pv.price is not None else p.price
+    return {
+        "id": p.id,
+        "sku": p.sku,
+        "name": p.name,
+        "variant": p.variant,
+        "price": p.price,
+        "image_url": p.image_url,
+        "variants": [pv] if pv is not None else [],
+        "match": {
+            "code": bc.code,
+            "variant_id": pv.id if pv is not None else None,
+            "variant": pv.variant if pv is not None else p.variant,
+            "price": price or 0.0,
+            "pack_qty": bc.pack_qty,
+        },
+    }
+
+def barcode_out(bc: models.Barcode) -> dict:
+    return {
+        "id": bc.id,
+        "code": bc.code,
+        "product_id": bc.product_id,
+        "variant_id": bc.variant_id,
+        "variant": bc.variant.variant if bc.variant is not None else None,
+        "pack_qty": bc.pack_qty,
+    }
+
+def list_barcodes(db: Session, product_id: int) -> list[models.Barcode]:
+    return list(
+        db.execute(
+            _barcode_query().where(models.Barcode.product_id == product_id).order_by(models.Barcode.id)
+        ).scalars()
+    )
+
+def add_barcode(db: Session, product: models.Product, data: schemas.BarcodeCreate) -> models.Barcode:
+    variant = None
+    if data.variant:
+        variant = get_variant_by_name(db, product.id, _normalize(data.variant))
+        if variant is None:
+            raise LookupError("Variação não encontrada")
+    bc = models.Barcode(
+        code=_normalize(data.code), product=product, variant=variant, pack_qty=data.pack_qty
+    )
+    db.add(bc)
+    # unicidade do código pelo índice do banco (ix_barcodes_code)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise ValueError("Código de barras já cadastrado.") from None
+    return bc
+
+def delete_barcode(db: Session, barcode_id: int) -> bool:
+    bc = db.get(models.Barcode, barcode_id)
+    if not bc:
+        return False
+    db.delete(bc)
+    db.commit()
     return True
 
 
@@ -376,13 +618,40 @@ def delete_product(db: Session, product_id: int) -> bool:
 # Sales / Estoque
 # =========================
 
-def decrease_stock_for_items(db: Session, items: list[schemas.SaleItemIn]) -> None:
+def list_low_stock(db: Session, after_id: int = 0, limit: int = 50) -> list:
+    """Variações com stock <= min_stock, paginadas por id (keyset)."""
+    pv, p = models.ProductVariant, models.Product
+    return db.execute(
+        select(
+            pv.id, pv.product_id, p.sku, p.name, pv.variant, pv.stock, pv.min_stock,
+            func.coalesce(pv.price, p.price).label("price"),
+            func.coalesce(pv.image_url, p.image_url).label("image_url"),
+        )
+        .join(p, p.id == pv.product_id)
+        # mesma condição do índice parcial ix_product_variants_low_stock
+        .where(pv.stock <= pv.min_stock, pv.id > after_id)
+        .order_by(pv.id)
+        .limit(limit)
+    ).all()
+
+def record_stock_movement(
+    db: Session, variant_id: int, delta: int, kind: str, sale_id: int | None = None
+) -> None:
+    """Acrescenta um movimento ao livro-razão (na transação corrente)."""
+    if delta:
+        db.add(models.StockMovement(variant_id=variant_id, delta=delta, kind=kind, sale_id=sale_id))
+
+def decrease_stock_for_items(
+    db: Session, items: list[schemas.SaleItemIn], sale_id: int | None = None
+) -> list[models.ProductVariant]:
+    """Baixa o estoque dos itens vendidos. Não faz commit: roda na transação da venda."""
+    touched: dict[int, models.ProductVariant] = {}
     for it in items:
         prod = get_product_by_sku(db, it.sku)
         if not prod:
             continue
 
-        ensure_legacy_variant_row(db, prod)
+        ensure_legacy_variant_row(db, prod, commit=False)
 
         varname = (it.variant or prod.variant or "-").strip()
         pv = get_variant_by_name(db, prod.id, varname)
@@ -393,13 +662,15 @@ def decrease_stock_for_items(db: Session, items: list[schemas.SaleItemIn]) -> No
             db.add(pv)
             db.flush()
 
-        pv.stock = int(pv.stock) - int(it.qty)
-
-    db.commit()
+        # UPDATE ... SET stock = stock - qty (sem perder baixas concorrentes)
+        pv.stock = models.ProductVariant.stock - int(it.qty)
+        record_stock_movement(db, pv.id, -int(it.qty), "sale", sale_id)
+        db.flush()
+        touched[pv.id] = pv
 
-def create_sale(db: Session, payload: schemas.SaleIn) -> models.Sale:
-    decrease_stock_for_items(db, payload.items)
+    return list(touched.values())
 
+def create_sale(db: Session, payload: schemas.SaleIn, operator: str | None = None) -> models.Sale:
     sale = models.Sale(
         client_name=payload.client_name,
         payment=payload.payment,
@@ -410,6 +681,7 @@ def create_sale(db: Session, payload: schemas.SaleIn) -> models.Sale:
         received=payload.received,
         subtotal=payload.subtotal,
         total=payload.total,
+        operator=operator,
     )
     db.add(sale)
     db.flush()
@@ -426,9 +698,31 @@ def create_sale(db: Session, payload: schemas.SaleIn) -> models.Sale:
             )
         )
 
+    # venda, itens, baixa de estoque e livro-razão numa única transação
+    touched = decrease_stock_for_items(db, payload.items, sale_id=sale.id)
     db.commit()
     db.refresh(sale)
+    cache.dashboard.invalidate_at(sale.created_at)
+
+    # delta para o dashboard ao vivo (SSE)
+    events.publish("sale_created", {
+        "id": sale.id,
+        "created_at": sale.created_at.isoformat(),
+        "payment": sale.payment,
+        "total": sale.total,
+        "qty": sum(int(it.qty) for it in payload.items),
+    })
+    if touched:
+        events.publish("stock_changed", {
+            "variants": [events.variant_delta(pv) for pv in touched],
+        })
     return sale
 
 def list_sales(db: Session, limit: int = 20) -> list[models.Sale]:
-    return db.query(models.Sale).order_by(models.Sale.id.desc()).limit(limit).all()
+    return (
+        db.query(models.Sale)
+        .options(selectinload(models.Sale.items))
+        .order_by(models.Sale.id.desc())
+        .limit(limit)
+        .all()
+    )
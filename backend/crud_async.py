@@ -0,0 +1,332 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import weakref
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from sqlalchemy import func, or_, select, text, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload, selectinload
+
+from . import models, schemas, events, cache
+from .crud import (
+    RESOLVE_BUDGET_MS, RESOLVE_LIMIT, AmbiguousScan, _candidate, _merge_candidates,
+    _normalize, _resolve_tiers, _timed_out, _timeout_ms, scan_result,
+)
+
+if TYPE_CHECKING:  # sqlalchemy.ext.asyncio só carrega com o engine async
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+# =========================
+# CRUD assíncrono (rotas quentes)
+# =========================
+# Mesmas regras do crud.py, para AsyncSession (database.get_async_db).
+# O crud síncrono continua sendo a API dos scripts e das demais rotas.
+# As variações vêm sempre com selectinload: no async não há lazy load.
+
+P, PV = models.Product, models.ProductVariant
+
+# SQLite aceita um escritor por vez: com muitas vendas simultâneas, quem
+# espera o lock dentro do SQLite estoura o busy timeout (database is locked).
+# No caminho async as vendas fazem fila aqui, no event loop.
+_write_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+
+class _NoLock:
+    async def __aenter__(self):
+        return None
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def _writer(db: AsyncSession):
+    if db.bind.dialect.name != "sqlite":
+        return _NoLock()
+    loop = asyncio.get_running_loop()
+    lock = _write_locks.get(loop)
+    if lock is None:
+        lock = _write_locks[loop] = asyncio.Lock()
+    return lock
+
+
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[models.User]:
+    return (
+        await db.execute(select(models.User).where(models.User.username == username))
+    ).scalar_one_or_none()
+
+
+# =========================
+# Products
+# =========================
+
+async def _ensure_legacy_variants(db: AsyncSession, products: list[models.Product]) -> None:
+    # mesmo papel de crud.ensure_legacy_variant_row, para vários de uma vez
+    legacy = [p for p in products if not p.variants and p.variant]
+    for p in legacy:
+        p.variants.append(models.ProductVariant(variant=p.variant, stock=0, min_stock=0, price=None))
+    if legacy:
+        await db.commit()
+
+
+async def find_barcode(db: AsyncSession, code: str) -> Optional[models.Barcode]:
+    B = models.Barcode
+    return (
+        await db.execute(
+            select(B).where(B.code == code)
+            .options(joinedload(B.product, innerjoin=True), joinedload(B.variant))
+        )
+    ).scalar_one_or_none()
+
+
+@asynccontextmanager
+async def _time_box(db: AsyncSession, deadline: float):
+    """Mesmo papel do crud._time_box (aiosqlite / asyncpg)."""
+    if db.get_bind().dialect.name == "postgresql":
+        async with db.begin_nested():
+            await db.execute(text(f"SET LOCAL statement_timeout = {_timeout_ms(deadline)}"))
+            yield
+            await db.execute(text("SET LOCAL statement_timeout TO DEFAULT"))
+        return
+    # o handler roda na thread do aiosqlite, junto com a consulta
+    raw = (await (await db.connection()).get_raw_connection()).driver_connection
+    if not hasattr(raw, "set_progress_handler"):
+        yield
+        return
+    await raw.set_progress_handler(lambda: time.perf_counter() > deadline, 1000)
+    try:
+        yield
+    finally:
+        await raw.set_progress_handler(None, 0)
+
+
+async def _resolve(
+    db: AsyncSession, query: str, limit: int, budget_ms: float | None
+) -> tuple[list[tuple[str, models.Product]], Optional[models.Barcode], bool]:
+    """Mesmos níveis e prazo do crud._resolve."""
+    q = _normalize(query)
+    if not q:
+        return [], None, False
+    deadline = time.perf_counter() + (RESOLVE_BUDGET_MS if budget_ms is None else budget_ms) / 1000
+
+    tiers = _resolve_tiers(q, limit)
+    hits: list[tuple[str, models.Product]] = []
+    _merge_candidates(hits, (await db.execute(tiers[0][1])).scalars(), "sku", limit)
+    if hits:
+        return hits, None, False
+    bc = await find_barcode(db, q)
+    if bc:
+        return [], bc, False
+
+    for tier, stmt in tiers[1:]:
+        if len(hits) >= limit:
+            break
+        if time.perf_counter() >= deadline:
+            return hits, None, True
+        try:
+            async with _time_box(db, deadline):
+                rows = (await db.execute(stmt)).scalars().all()
+        except OperationalError as e:
+            if not _timed_out(e):
+                raise
+            return hits, None, True
+        _merge_candidates(hits, rows, tier, limit)
+    return hits, None, False
+
+
+async def resolve(
+    db: AsyncSession, query: str, limit: int = RESOLVE_LIMIT, budget_ms: float | None = None
+) -> dict:
+    hits, bc, truncated = await _resolve(db, query, limit, budget_ms)
+    if bc is not None:
+        return {"items": [{**_candidate(bc.product, "barcode"), "match": scan_result(bc)["match"]}],
+                "exact": True, "truncated": False}
+    exact = len(hits) == 1 and hits[0][0] == "sku"
+    return {"items": [_candidate(p, t) for t, p in hits], "exact": exact, "truncated": truncated}
+
+
+async def find_product(db: AsyncSession, query: str) -> models.Product | dict | None:
+    """Mesma regra do crud.find_product (AmbiguousScan com mais de um)."""
+    hits, bc, _truncated = await _resolve(db, query, RESOLVE_LIMIT, None)
+    if bc is not None:
+        return scan_result(bc)
+    if not hits:
+        return None
+    if len(hits) > 1:
+        raise AmbiguousScan([_candidate(p, t) for t, p in hits])
+    p = (
+        await db.execute(select(P).where(P.id == hits[0][1].id).options(selectinload(P.variants)))
+    ).scalar_one()
+    await _ensure_legacy_variants(db, [p])
+    return p
+
+
+async def list_products(
+    db: AsyncSession, query: str | None, limit: int = 50, offset: int = 0
+) -> Tuple[List[models.Product], int]:
+    cond = None
+    if query:
+        cond = or_(P.sku.ilike(f"%{query}%"), P.name.ilike(f"%{query}%"))
+    total_q = select(func.count()).select_from(P)
+    qsel = select(P).options(selectinload(P.variants))
+    if cond is not None:
+        total_q = total_q.where(cond)
+        qsel = qsel.where(cond)
+
+    total = (await db.execute(total_q)).scalar_one()
+    items = list(
+        (await db.execute(qsel.order_by(P.id.desc()).limit(limit).offset(offset))).scalars()
+    )
+    await _ensure_legacy_variants(db, items)
+    return items, total
+
+
+# =========================
+# Dashboard
+# =========================
+
+async def period_revenue(db: AsyncSession, s: datetime, e: datetime) -> tuple[int, float]:
+    orders, revenue = (
+        await db.execute(
+            select(func.count(models.Sale.id), func.coalesce(func.sum(models.Sale.total), 0.0))
+            .where(models.Sale.created_at >= s, models.Sale.created_at <= e)
+        )
+    ).one()
+    return int(orders or 0), float(revenue or 0.0)
+
+
+async def latest_sales(db: AsyncSession, s: datetime, e: datetime, limit: int = 20) -> list[models.Sale]:
+    return list((
+        await db.execute(
+            select(models.Sale)
+            .where(models.Sale.created_at >= s, models.Sale.created_at <= e)
+            .order_by(models.Sale.created_at.desc())
+            .limit(limit)
+        )
+    ).scalars())
+
+
+async def top_products(db: AsyncSession, s: datetime, e: datetime, limit: int = 10) -> list[dict]:
+    it, sa = models.SaleItem, models.Sale
+    rows = (
+        await db.execute(
+            select(
+                it.name.label("name"),
+                func.coalesce(func.sum(it.qty), 0).label("qty"),
+                func.coalesce(func.sum(it.qty * it.price), 0.0).label("revenue"),
+            )
+            .join(sa, it.sale_id == sa.id)
+            .where(sa.created_at >= s, sa.created_at <= e)
+            .group_by(it.name)
+            .order_by(func.sum(it.qty).desc())
+            .limit(limit)
+        )
+    ).all()
+    return [{"name": r.name, "qty": int(r.qty or 0), "revenue": float(r.revenue or 0)} for r in rows]
+
+
+# =========================
+# Sales
+# =========================
+
+async def decrease_stock_for_items(
+    db: AsyncSession, items: list[schemas.SaleItemIn], sale_id: int | None = None
+) -> list[int]:
+    """Baixa o estoque dos itens vendidos (sem commit). Devolve os ids das variações."""
+    skus = {it.sku for it in items if it.sku}
+    if not skus:
+        return []
+    # SKU pode repetir com nomes diferentes: como no crud, vale o primeiro
+    by_sku: dict[str, models.Product] = {}
+    for p in (
+        await db.execute(select(P).where(P.sku.in_(skus)).options(selectinload(P.variants)).order_by(P.id))
+    ).scalars():
+        by_sku.setdefault(p.sku, p)
+
+    lines: list[tuple[models.ProductVariant, int]] = []
+    for it in items:
+        prod = by_sku.get(it.sku)
+        if not prod:
+            continue
+        if not prod.variants and prod.variant:
+            prod.variants.append(models.ProductVariant(variant=prod.variant, stock=0, min_stock=0, price=None))
+        varname = (it.variant or prod.variant or "-").strip()
+        pv = next((v for v in prod.variants if v.variant == varname), None)
+        if pv is None:
+            pv = models.ProductVariant(variant=varname, stock=0, min_stock=0, price=None)
+            prod.variants.append(pv)
+        lines.append((pv, int(it.qty)))
+    await db.flush()  # ids das variações novas
+
+    per_variant: dict[int, int] = defaultdict(int)
+    for pv, qty in lines:
+        per_variant[pv.id] += qty
+        if qty:
+            db.add(models.StockMovement(variant_id=pv.id, delta=-qty, kind="sale", sale_id=sale_id))
+    for vid, qty in per_variant.items():
+        # UPDATE ... SET stock = stock - qty (sem perder baixas concorrentes)
+        await db.execute(
+            update(PV).where(PV.id == vid).values(stock=PV.stock - qty)
+            .execution_options(synchronize_session=False)
+        )
+    await db.flush()
+    return list(per_variant)
+
+
+async def _insert_sale(
+    db: AsyncSession, payload: schemas.SaleIn, operator: str | None
+) -> tuple[models.Sale, list[int]]:
+    sale = models.Sale(
+        client_name=payload.client_name,
+        payment=payload.payment,
+        installments=payload.installments,
+        discount_value=payload.discount_value,
+        discount_pct=payload.discount_pct,
+        freight=payload.freight,
+        received=payload.received,
+        subtotal=payload.subtotal,
+        total=payload.total,
+        operator=operator,
+        items=[
+            models.SaleItem(sku=it.sku, name=it.name, variant=it.variant, qty=it.qty, price=it.price)
+            for it in payload.items
+        ],
+    )
+    db.add(sale)
+    await db.flush()
+
+    # venda, itens, baixa de estoque e livro-razão numa única transação
+    touched = await decrease_stock_for_items(db, payload.items, sale_id=sale.id)
+    await db.commit()
+    return sale, touched
+
+
+async def create_sale(db: AsyncSession, payload: schemas.SaleIn, operator: str | None = None) -> models.Sale:
+    # encerra a leitura da autenticação: no SQLite, promover uma transação de
+    # leitura a escrita falha na hora (database is locked) se outro escreve
+    if db.in_transaction():
+        await db.commit()
+    async with _writer(db):
+        sale, touched = await _insert_sale(db, payload, operator)
+    await db.refresh(sale, ["created_at"])
+    cache.dashboard.invalidate_at(sale.created_at)
+
+    events.publish("sale_created", {
+        "id": sale.id,
+        "created_at": sale.created_at.isoformat(),
+        "payment": sale.payment,
+        "total": sale.total,
+        "qty": sum(int(it.qty) for it in payload.items),
+    })
+    if touched:
+        rows = (
+            await db.execute(
+                select(PV).where(PV.id.in_(touched)).execution_options(populate_existing=True)
+            )
+        ).scalars()
+        events.publish("stock_changed", {"variants": [events.variant_delta(pv) for pv in rows]})
+    return sale
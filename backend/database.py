@@ -1,10 +1,18 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+import importlib.util
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./backend/pdv.db")
 connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-engine = create_engine(DATABASE_URL, echo=False, future=True, connect_args=connect_args)
+# uma conexão por thread do threadpool (PDV_THREADS, ver admission.py): com
+# menos, rotas que já seguram conexão esperando thread e threads esperando
+# conexão se travam sob carga (QueuePool timeout)
+POOL_SIZE = int(os.getenv("PDV_DB_POOL", os.getenv("PDV_THREADS", "40")))
+engine = create_engine(
+    DATABASE_URL, echo=False, future=True, connect_args=connect_args,
+    pool_size=POOL_SIZE, max_overflow=10,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 class Base(DeclarativeBase): pass
@@ -15,3 +23,61 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# =========================
+# Caminho assíncrono (rotas quentes)
+# =========================
+# Mesmo banco, driver assíncrono: aiosqlite (SQLite) ou asyncpg (Postgres).
+# Padrão: liga no Postgres se o asyncpg estiver instalado. No SQLite o
+# aiosqlite só ganha nas vendas concorrentes e perde nas leituras (ver
+# scripts/bench_async.py), então lá é opcional: PDV_ASYNC_DB=1 liga,
+# PDV_ASYNC_DB=0 força o caminho síncrono. O engine só é criado no primeiro uso.
+
+def _async_url(url: str) -> tuple[str, str] | None:
+    scheme, sep, rest = url.partition("://")
+    base = scheme.split("+", 1)[0]
+    if base == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}", "aiosqlite"
+    if base in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg{sep}{rest}", "asyncpg"
+    return None
+
+_async_target = _async_url(DATABASE_URL)
+_async_flag = os.getenv("PDV_ASYNC_DB", "").lower()
+ASYNC_DB = (
+    _async_target is not None
+    and importlib.util.find_spec(_async_target[1]) is not None
+    and (
+        _async_flag in ("1", "true", "yes", "on")
+        or (_async_flag == "" and _async_target[1] == "asyncpg")
+    )
+)
+_async_engine = None
+_AsyncSessionLocal = None
+_async_hooks = []
+
+def on_async_engine(hook) -> None:
+    """Registra hook(sync_engine) para quando o engine assíncrono for criado
+    (instrumentação: métricas, contagem de SQL, tracing)."""
+    _async_hooks.append(hook)
+    if _async_engine is not None:
+        hook(_async_engine.sync_engine)
+
+def async_engine():
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        if _async_target is None:
+            raise RuntimeError("Sem driver assíncrono para %s" % DATABASE_URL)
+        _async_engine = create_async_engine(_async_target[0], echo=False)
+        # expire_on_commit=False: depois do commit os objetos seguem legíveis sem I/O
+        _AsyncSessionLocal = async_sessionmaker(_async_engine, expire_on_commit=False, autoflush=False)
+        for hook in _async_hooks:
+            hook(_async_engine.sync_engine)
+    return _async_engine
+
+async def get_async_db():
+    async_engine()
+    async with _AsyncSessionLocal() as db:
+        yield db
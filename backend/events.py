@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import threading
+from typing import Any
+
+# =========================
+# Eventos (Server-Sent Events)
+# =========================
+# Os endpoints são síncronos (rodam no threadpool), mas cada cliente SSE
+# espera numa asyncio.Queue do loop do servidor. Por isso a publicação usa
+# call_soon_threadsafe: pode ser chamada de qualquer thread.
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class _Subscriber:
+    __slots__ = ("loop", "queue")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        self.loop = loop
+        self.queue = queue
+
+
+def _offer(queue: asyncio.Queue, msg: str) -> None:
+    # cliente lento: descarta a mensagem em vez de crescer sem limite
+    try:
+        queue.put_nowait(msg)
+    except asyncio.QueueFull:
+        pass
+
+
+class EventBroker:
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self._queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subs: set[_Subscriber] = set()
+        self._ids = itertools.count(1)
+
+    def subscribe(self) -> _Subscriber:
+        """Registra um ouvinte. Deve ser chamado dentro do event loop."""
+        sub = _Subscriber(asyncio.get_running_loop(), asyncio.Queue(self._queue_size))
+        with self._lock:
+            self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: _Subscriber) -> None:
+        with self._lock:
+            self._subs.discard(sub)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subs)
+
+    def publish(self, event: str, data: dict[str, Any]) -> None:
+        """Serializa o evento uma única vez e entrega a todos os ouvintes."""
+        with self._lock:
+            subs = list(self._subs)
+        if not subs:
+            return
+        payload = json.dumps(data, default=str, separators=(",", ":"))
+        msg = f"id: {next(self._ids)}\nevent: {event}\ndata: {payload}\n\n"
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(_offer, sub.queue, msg)
+            except RuntimeError:
+                # loop encerrado (worker reiniciando)
+                self.unsubscribe(sub)
+
+
+broker = EventBroker()
+
+
+def publish(event: str, data: dict[str, Any]) -> None:
+    broker.publish(event, data)
+
+
+def variant_delta(pv) -> dict[str, Any]:
+    return {
+        "id": pv.id,
+        "product_id": pv.product_id,
+        "variant": pv.variant,
+        "stock": pv.stock,
+        "min_stock": pv.min_stock,
+        "low": pv.stock <= pv.min_stock,
+    }
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# =========================
+# Métricas (formato texto do Prometheus)
+# =========================
+# O middleware roda no event loop (uma thread só), então os contadores HTTP
+# são dicts simples, sem lock. As consultas SQL rodam no threadpool: cada
+# thread soma no seu próprio contador e o /metrics agrega na leitura.
+
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+UNMATCHED = "<unmatched>"  # 404 e afins: não vira um rótulo por URL
+
+_started = time.time()
+_in_flight = 0
+_requests: dict[tuple[str, str, int], int] = {}            # (método, rota, status) -> n
+_latency: dict[tuple[str, str], list] = {}                 # (método, rota) -> [buckets..., soma]
+
+_tls = threading.local()
+_sql_cells: list[list[int]] = []                           # um [n] por thread
+_sql_cells_lock = threading.Lock()                         # só no 1º uso de cada thread
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path_format
+    # mounts estáticos (/uploads, frontend) não preenchem "route"
+    path = scope.get("path", "")
+    if path.startswith("/api/"):
+        return UNMATCHED
+    return "/uploads" if path.startswith("/uploads/") else "<static>"
+
+
+def observe(method: str, route: str, status: int, ms: float) -> None:
+    key = (method, route, status)
+    _requests[key] = _requests.get(key, 0) + 1
+    h = _latency.get((method, route))
+    if h is None:
+        h = _latency[(method, route)] = [0] * (len(BUCKETS_MS) + 2)
+    h[bisect_left(BUCKETS_MS, ms)] += 1
+    h[-1] += ms
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: contagem, latência e status por rota (caminho template)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        global _in_flight
+        status = 500
+        t0 = time.perf_counter()
+
+        async def _send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        _in_flight += 1
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _in_flight -= 1
+            observe(scope["method"], _route_label(scope), status, (time.perf_counter() - t0) * 1000.0)
+
+
+# -------- SQL --------
+
+def _sql_cell() -> list[int]:
+    cell = getattr(_tls, "cell", None)
+    if cell is None:
+        cell = _tls.cell = [0]
+        with _sql_cells_lock:
+            _sql_cells.append(cell)
+    return cell
+
+
+def _on_execute(*_args, **_kw) -> None:
+    _sql_cell()[0] += 1
+
+
+def instrument_engine(engine: Engine) -> None:
+    if not event.contains(engine, "before_cursor_execute", _on_execute):
+        event.listen(engine, "before_cursor_execute", _on_execute)
+
+
+def sql_queries_total() -> int:
+    return sum(c[0] for c in list(_sql_cells))
+
+
+# -------- exposição --------
+
+def _esc(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _pool_stats(engine: Engine) -> dict[str, int]:
+    pool = engine.pool
+    out = {}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, name, None)
+        if callable(fn):
+            try:
+                out[name] = int(fn())
+            except Exception:
+                pass
+    return out
+
+
+def render(engine: Engine, gauges: list[tuple[str, str, float]] = ()) -> str:
+    """Texto para o /metrics; `gauges` = [(nome{rótulos}, descrição, valor)] extras."""
+    lines: list[str] = []
+
+    def head(name: str, kind: str, help_: str) -> None:
+        lines.append(f"# HELP {name} {help_}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    head("pdv_http_requests_total", "counter", "Requisições HTTP por rota e status.")
+    for (m, r, s), n in sorted(_requests.items()):
+        lines.append(f'pdv_http_requests_total{{method="{m}",route="{_esc(r)}",status="{s}"}} {n}')
+
+    head("pdv_http_request_duration_ms", "histogram", "Latência das requisições HTTP (ms).")
+    for (m, r), h in sorted(_latency.items()):
+        labels = f'method="{m}",route="{_esc(r)}"'
+        acc = 0
+        for le, n in zip(BUCKETS_MS, h):
+            acc += n
+            lines.append(f'pdv_http_request_duration_ms_bucket{{{labels},le="{le}"}} {acc}')
+        acc += h[len(BUCKETS_MS)]
+        lines.append(f'pdv_http_request_duration_ms_bucket{{{labels},le="+Inf"}} {acc}')
+        lines.append(f"pdv_http_request_duration_ms_sum{{{labels}}} {h[-1]:.3f}")
+        lines.append(f"pdv_http_request_duration_ms_count{{{labels}}} {acc}")
+
+    head("pdv_http_requests_in_flight", "gauge", "Requisições em andamento.")
+    lines.append(f"pdv_http_requests_in_flight {_in_flight}")
+
+    head("pdv_db_queries_total", "counter", "Consultas SQL executadas.")
+    lines.append(f"pdv_db_queries_total {sql_queries_total()}")
+
+    for name, v in _pool_stats(engine).items():
+        head(f"pdv_db_pool_{name}", "gauge", f"Pool de conexões: {name}.")
+        lines.append(f"pdv_db_pool_{name} {v}")
+
+    seen: set[str] = set()
+    for name, help_, v in gauges:
+        base = name.split("{", 1)[0]  # nome pode vir com rótulos
+        if base not in seen:
+            seen.add(base)
+            head(base, "gauge", help_)
+        lines.append(f"{name} {v}")
+
+    head("pdv_uptime_seconds", "gauge", "Tempo desde o start do processo.")
+    lines.append(f"pdv_uptime_seconds {time.time() - _started:.0f}")
+    return "\n".join(lines) + "\n"
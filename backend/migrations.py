@@ -0,0 +1,368 @@
+"""Migrações versionadas do banco.
+
+Uso (na raiz do projeto):
+    python -m backend.migrations upgrade     # aplica as pendentes
+    python -m backend.migrations status      # mostra a versão atual
+
+A aplicação só confere a versão ao subir (uma consulta). Para migrar
+automaticamente no startup, defina PDV_MIGRATE_ON_STARTUP=1.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from typing import Callable, NamedTuple
+
+from sqlalchemy import (
+    Column, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+    UniqueConstraint, func, inspect, text,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+
+from .database import engine as default_engine
+from . import models
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+
+
+# =========================
+# Helpers (idempotentes: bancos antigos podem já ter parte do esquema)
+# =========================
+
+def _create_tables(conn: Connection, *tables: Table) -> None:
+    for t in tables:
+        t.create(conn, checkfirst=True)
+
+
+def _add_column(conn: Connection, table: str, column: str, ddl: str) -> None:
+    cols = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in cols:
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def _create_index(conn: Connection, sql: str) -> None:
+    conn.exec_driver_sql(sql)
+
+
+# =========================
+# Tabelas como cada migração as criou
+# =========================
+# Cópias congeladas, não os models: mudar um model não pode mudar o DDL de
+# uma migração já publicada (banco novo e banco migrado saem dos mesmos
+# passos). Colunas e índices novos entram por ALTER/CREATE INDEX na
+# migração que os trouxe; aqui só o que existia quando a tabela nasceu.
+
+_frozen = MetaData()
+
+# migração 1 (sem image_url/permissions: 2; sem sales.operator: 3)
+_users = Table(
+    "users", _frozen,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("username", String(80), unique=True, index=True, nullable=False),
+    Column("full_name", String(255), nullable=True),
+    Column("password_hash", String(255), nullable=False),
+    Column("role", String(20)),
+    Column("created_at", DateTime, server_default=func.now()),
+)
+_products = Table(
+    "products", _frozen,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("sku", String(64), nullable=False, index=True),
+    Column("name", String(255), nullable=False),
+    Column("variant", String(120), nullable=True),
+    Column("price", Float),
+    UniqueConstraint("sku", "name", name="uq_products_sku_name"),
+)
+_product_variants = Table(
+    "product_variants", _frozen,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("product_id", Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("variant", String(120), nullable=False),
+    Column("stock", Integer, nullable=False),
+    Column("min_stock", Integer, nullable=False),
+    Column("price", Float, nullable=True),
+)
+_clients = Table(
+    "clients", _frozen,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String(255), nullable=False),
+)
+_sales = Table(
+    "sales", _frozen,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("client_name", String(255), nullable=True),
+    Column("payment", String(50), nullable=False),
+    Column("installments", Integer),
+    Column("discount_value", Float),
+    Column("discount_pct", Float),
+    Column("freight", Float),
+    Column("received", Float),
+    Column("subtotal", Float),
+    Column("total", Float),
+    Column("created_at", DateTime, server_default=func.now()),
+)
+_sale_items = Table(
+    "sale_items", _frozen,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("sale_id", Integer, ForeignKey("sales.id"), nullable=False, index=True),
+    Column("sku", String(64), nullable=True),
+    Column("name", String(255), nullable=False),
+    Column("variant", String(120), nullable=True),
+    Column("qty", Integer),
+    Column("price", Float),
+)
+
+# migração 4
+_stock_sessions = Table(
+    "stock_sessions", _frozen,
+    Column("id", Integer, primary_key=True),
+    Column("kind", String(20), nullable=False),
+    Column("status", String(20), nullable=False),
+    Column("created_by", String(80), nullable=True),
+    Column("created_at", DateTime, server_default=func.now()),
+    Column("applied_at", DateTime, nullable=True),
+)
+_stock_movements = Table(
+    "stock_movements", _frozen,
+    Column("id", Integer, primary_key=True),
+    Column("variant_id", Integer, ForeignKey("product_variants.id", ondelete="CASCADE"), nullable=False),
+    Column("delta", Integer, nullable=False),
+    Column("kind", String(20), nullable=False),
+    Column("sale_id", Integer, ForeignKey("sales.id"), nullable=True),
+    Column("session_id", Integer, ForeignKey("stock_sessions.id"), nullable=True, index=True),
+    Column("created_at", DateTime, server_default=func.now()),
+    Index("ix_stock_movements_variant_id_id", "variant_id", "id"),
+)
+_stock_snapshots = Table(
+    "stock_snapshots", _frozen,
+    Column("id", Integer, primary_key=True),
+    Column("variant_id", Integer, ForeignKey("product_variants.id", ondelete="CASCADE"), nullable=False),
+    Column("stock", Integer, nullable=False),
+    Column("last_movement_id", Integer, nullable=False),
+    Column("taken_at", DateTime, server_default=func.now()),
+    Index("ix_stock_snapshots_variant_id_taken_at", "variant_id", "taken_at"),
+)
+_stock_counts = Table(
+    "stock_counts", _frozen,
+    Column("id", Integer, primary_key=True),
+    Column("session_id", Integer, ForeignKey("stock_sessions.id", ondelete="CASCADE"), nullable=False),
+    Column("variant_id", Integer, ForeignKey("product_variants.id", ondelete="CASCADE"), nullable=False),
+    Column("qty", Integer, nullable=False),
+    Column("mark_movement_id", Integer, nullable=False),
+    UniqueConstraint("session_id", "variant_id", name="uq_stock_counts_session_variant"),
+)
+
+# migração 6
+_audit_log = Table(
+    "audit_log", _frozen,
+    Column("id", Integer, primary_key=True),
+    Column("at", DateTime, nullable=False),
+    Column("actor", String(80), nullable=True),
+    Column("action", String(40), nullable=False),
+    Column("entity", String(40), nullable=False),
+    Column("entity_id", String(64), nullable=True),
+    Column("detail", Text, nullable=True),
+    Index("ix_audit_log_entity", "entity", "entity_id"),
+    Index("ix_audit_log_at", "at"),
+)
+
+# migração 9
+_barcodes = Table(
+    "barcodes", _frozen,
+    Column("id", Integer, primary_key=True),
+    Column("code", String(64), nullable=False, unique=True, index=True),
+    Column("product_id", Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("variant_id", Integer, ForeignKey("product_variants.id", ondelete="CASCADE"), nullable=True),
+    Column("pack_qty", Integer, nullable=False),
+    Column("created_at", DateTime, server_default=func.now()),
+)
+
+
+# =========================
+# Migrações (nunca edite uma já publicada; acrescente uma nova)
+# =========================
+
+def _m1_base(conn: Connection) -> None:
+    _create_tables(conn, _users, _products, _product_variants, _clients, _sales, _sale_items)
+
+
+def _m2_image_and_permissions(conn: Connection) -> None:
+    # antigo scripts/add_image_columns.py
+    _add_column(conn, "products", "image_url", "TEXT")
+    _add_column(conn, "product_variants", "image_url", "TEXT")
+    _add_column(conn, "users", "permissions", "TEXT")
+
+
+def _m3_sale_operator(conn: Connection) -> None:
+    _add_column(conn, "sales", "operator", "VARCHAR(80)")
+
+
+def _m4_stock_ledger(conn: Connection) -> None:
+    _create_tables(conn, _stock_sessions, _stock_movements, _stock_snapshots, _stock_counts)
+    # saldo de abertura: o estoque atual vira a primeira foto do livro-razão
+    conn.exec_driver_sql(
+        "INSERT INTO stock_snapshots (variant_id, stock, last_movement_id) "
+        "SELECT id, stock, 0 FROM product_variants"
+    )
+
+
+def _m5_low_stock_index(conn: Connection) -> None:
+    _create_index(
+        conn,
+        "CREATE INDEX IF NOT EXISTS ix_product_variants_low_stock "
+        "ON product_variants (id) WHERE stock <= min_stock",
+    )
+
+
+def _m6_audit_log(conn: Connection) -> None:
+    _create_tables(conn, _audit_log)
+
+
+def _m7_sales_created_at_index(conn: Connection) -> None:
+    _create_index(conn, "CREATE INDEX IF NOT EXISTS ix_sales_created_at ON sales (created_at)")
+
+
+def _m8_products_sku_name_key(conn: Connection) -> None:
+    _add_column(conn, "products", "sku_key", "VARCHAR(64)")
+    _add_column(conn, "products", "name_key", "VARCHAR(255)")
+    rows = conn.exec_driver_sql("SELECT id, sku, name FROM products").all()
+    keys = [
+        {"id": pid, "sku_key": models.ci_key(sku), "name_key": models.ci_key(name)}
+        for pid, sku, name in rows
+    ]
+    # duplicados antigos (ex.: "ABC"/"abc" com o mesmo nome) impedem o índice:
+    # melhor parar com a lista do que escolher sozinho qual produto apagar
+    seen: dict[tuple, list[int]] = {}
+    for k in keys:
+        seen.setdefault((k["sku_key"], k["name_key"]), []).append(k["id"])
+    dups = [(key, ids) for key, ids in seen.items() if len(ids) > 1]
+    if dups:
+        raise RuntimeError(
+            "Produtos repetidos por SKU + nome (sem diferenciar maiúsculas); "
+            "junte ou renomeie antes de migrar: "
+            + "; ".join(f"{sku} / {name}: ids {ids}" for (sku, name), ids in dups[:20])
+        )
+    if keys:
+        conn.execute(
+            text("UPDATE products SET sku_key = :sku_key, name_key = :name_key WHERE id = :id"), keys
+        )
+    _create_index(
+        conn,
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_products_sku_name_key "
+        "ON products (sku_key, name_key)",
+    )
+
+
+def _m9_barcodes(conn: Connection) -> None:
+    _create_tables(conn, _barcodes)
+
+
+def _m10_products_search_keys(conn: Connection) -> None:
+    # busca do caixa sem acento ("agua" acha "Água"); name_key fica só para unicidade
+    _add_column(conn, "products", "sku_search", "VARCHAR(64)")
+    _add_column(conn, "products", "name_search", "VARCHAR(255)")
+    rows = conn.exec_driver_sql("SELECT id, sku, name FROM products").all()
+    if rows:
+        conn.execute(
+            text("UPDATE products SET sku_search = :s, name_search = :n WHERE id = :id"),
+            [{"id": pid, "s": models.search_key(sku), "n": models.search_key(name)} for pid, sku, name in rows],
+        )
+    _create_index(conn, "CREATE INDEX IF NOT EXISTS ix_products_sku_search ON products (sku_search)")
+    _create_index(conn, "CREATE INDEX IF NOT EXISTS ix_products_name_search ON products (name_search)")
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "base", _m1_base),
+    Migration(2, "image_url e permissions", _m2_image_and_permissions),
+    Migration(3, "sales.operator", _m3_sale_operator),
+    Migration(4, "livro-razão de estoque", _m4_stock_ledger),
+    Migration(5, "índice de estoque baixo", _m5_low_stock_index),
+    Migration(6, "audit_log", _m6_audit_log),
+    Migration(7, "índice de sales.created_at", _m7_sales_created_at_index),
+    Migration(8, "(sku, nome) único sem diferenciar maiúsculas", _m8_products_sku_name_key),
+    Migration(9, "códigos de barras", _m9_barcodes),
+    Migration(10, "chaves de busca sem acento", _m10_products_search_keys),
+]
+HEAD = MIGRATIONS[-1].version
+
+
+# =========================
+# Runner
+# =========================
+
+_VERSION_DDL = (
+    "CREATE TABLE IF NOT EXISTS schema_version ("
+    "version INTEGER PRIMARY KEY, "
+    "name VARCHAR(120) NOT NULL, "
+    "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+)
+
+
+def current_version(engine: Engine = default_engine) -> int:
+    """Versão aplicada (0 = banco sem controle de versão)."""
+    try:
+        with engine.connect() as conn:
+            return conn.exec_driver_sql("SELECT MAX(version) FROM schema_version").scalar() or 0
+    except DBAPIError:
+        return 0
+
+
+def upgrade(engine: Engine = default_engine, target: int | None = None) -> list[int]:
+    """Aplica as migrações pendentes, cada uma na sua transação."""
+    with engine.begin() as conn:
+        conn.exec_driver_sql(_VERSION_DDL)
+    done = current_version(engine)
+    applied = []
+    for m in MIGRATIONS:
+        if m.version <= done or (target is not None and m.version > target):
+            continue
+        with engine.begin() as conn:
+            m.apply(conn)
+            conn.execute(
+                text("INSERT INTO schema_version (version, name) VALUES (:v, :n)"),
+                {"v": m.version, "n": m.name},
+            )
+        applied.append(m.version)
+    return applied
+
+
+def ensure_current(engine: Engine = default_engine) -> None:
+    """Checagem do startup: uma consulta; migra só se PDV_MIGRATE_ON_STARTUP=1."""
+    if current_version(engine) >= HEAD:
+        return
+    if os.getenv("PDV_MIGRATE_ON_STARTUP", "").lower() in ("1", "true", "yes"):
+        upgrade(engine)
+        return
+    raise RuntimeError(
+        "Banco desatualizado (versão %d, esperado %d). "
+        "Rode: python -m backend.migrations upgrade" % (current_version(engine), HEAD)
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m backend.migrations")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    up = sub.add_parser("upgrade", help="aplica as migrações pendentes")
+    up.add_argument("--to", type=int, default=None, help="para nesta versão")
+    sub.add_parser("status", help="mostra a versão do banco")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "status":
+        print(f"Versão do banco: {current_version()} (atual: {HEAD})")
+        return 0
+
+    names = {m.version: m.name for m in MIGRATIONS}
+    applied = upgrade(target=args.to)
+    for v in applied:
+        print(f"OK -> {v} {names[v]}")
+    print(f"Banco na versão {current_version()}.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,3 +1,5 @@
+import unicodedata
+
 from sqlalchemy import (
     Column,
     Integer,
@@ -7,9 +9,11 @@ from sqlalchemy import (
     DateTime,
     func,
     UniqueConstraint,
+    Index,
     Text,  # <-- IMPORT NECESSÁRIO
+    text,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 
 from .database import Base
 
@@ -32,6 +36,29 @@ class User(Base):
 # =========================
 # Products
 # =========================
+def ci_key(value: str | None) -> str | None:
+    """Chave de comparação sem diferenciar maiúsculas ("AÇÚCAR" == "açúcar").
+
+    Calculada no Python: o lower() do SQLite só conhece ASCII.
+    """
+    return value.strip().casefold() if value is not None else None
+
+
+def fold(text: str | None) -> str:
+    """Tira acentos (NFKD) e maiúsculas: "Água" -> "agua"."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def search_key(value: str | None) -> str | None:
+    """Chave de busca do caixa: como ci_key, mas também sem acento.
+
+    Só para busca: a unicidade continua em ci_key ("Pão" e "Pao" são
+    produtos diferentes).
+    """
+    return fold(value).strip() if value is not None else None
+
+
 class Product(Base):
     __tablename__ = "products"
 
@@ -44,11 +71,26 @@ class Product(Base):
     # imagem principal do produto (usada também no PDV)
     image_url = Column(String, nullable=True)
 
-    # Nunca permitir mesmo (sku, name)
+    # sku/nome normalizados (ci_key), mantidos por _sync_keys: é nesse par
+    # que o banco barra duplicidade sem diferenciar maiúsculas
+    sku_key  = Column(String(64),  nullable=True)
+    name_key = Column(String(255), nullable=True)
+    # sku/nome sem acento (search_key): busca por início/trecho no caixa
+    sku_search  = Column(String(64),  nullable=True, index=True)
+    name_search = Column(String(255), nullable=True, index=True)
+
+    # Nunca permitir mesmo (sku, name), nem com maiúsculas/minúsculas trocadas
     __table_args__ = (
         UniqueConstraint("sku", "name", name="uq_products_sku_name"),
+        Index("uq_products_sku_name_key", "sku_key", "name_key", unique=True),
     )
 
+    @validates("sku", "name")
+    def _sync_keys(self, attr, value):
+        setattr(self, f"{attr}_key", ci_key(value))
+        setattr(self, f"{attr}_search", search_key(value))
+        return value
+
     # Relacionamento explícito com variações
     variants = relationship(
         "ProductVariant",
@@ -56,6 +98,8 @@ class Product(Base):
         cascade="all, delete-orphan",
         passive_deletes=True,
     )
+    # códigos de barras (sem passive_deletes: o SQLite daqui não liga foreign_keys)
+    barcodes = relationship("Barcode", back_populates="product", cascade="all, delete-orphan")
 
 
 class ProductVariant(Base):
@@ -76,6 +120,120 @@ class ProductVariant(Base):
 
     product = relationship("Product", back_populates="variants")
 
+    # índice parcial: só as variações abaixo do mínimo (relatório de reposição)
+    __table_args__ = (
+        Index(
+            "ix_product_variants_low_stock",
+            "id",
+            sqlite_where=text("stock <= min_stock"),
+            postgresql_where=text("stock <= min_stock"),
+        ),
+    )
+
+
+# =========================
+# Códigos de barras (EAN/GTIN do fornecedor)
+# =========================
+class Barcode(Base):
+    """Código lido no caixa -> variação exata e quantas unidades a embalagem tem."""
+    __tablename__ = "barcodes"
+
+    id = Column(Integer, primary_key=True)
+    code = Column(String(64), nullable=False, unique=True, index=True)
+    product_id = Column(
+        Integer,
+        ForeignKey("products.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    # vazio = código do produto (usa a variação legada / preço do produto)
+    variant_id = Column(Integer, ForeignKey("product_variants.id", ondelete="CASCADE"), nullable=True)
+    pack_qty = Column(Integer, nullable=False, default=1)   # caixa com 12 -> 12
+    created_at = Column(DateTime, server_default=func.now())
+
+    product = relationship("Product", back_populates="barcodes")
+    variant = relationship("ProductVariant")
+
+
+# =========================
+# Estoque (livro-razão)
+# =========================
+class StockMovement(Base):
+    """Movimento de estoque (append-only). Nunca é alterado nem apagado."""
+    __tablename__ = "stock_movements"
+
+    id = Column(Integer, primary_key=True)
+    variant_id = Column(
+        Integer,
+        ForeignKey("product_variants.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    delta = Column(Integer, nullable=False)            # + entrada / - saída
+    kind = Column(String(20), nullable=False)          # sale, adjust, receipt, stocktake
+    sale_id = Column(Integer, ForeignKey("sales.id"), nullable=True)
+    session_id = Column(Integer, ForeignKey("stock_sessions.id"), nullable=True, index=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_stock_movements_variant_id_id", "variant_id", "id"),
+    )
+
+
+class StockSession(Base):
+    """Sessão de contagem (inventário) ou de recebimento de mercadoria."""
+    __tablename__ = "stock_sessions"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(20), nullable=False)          # stocktake, receiving
+    status = Column(String(20), nullable=False, default="open")  # open, applied, cancelled
+    created_by = Column(String(80), nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    applied_at = Column(DateTime, nullable=True)
+
+
+class StockCount(Base):
+    """Tally de uma sessão: quantidade lida por variação (tabela de staging)."""
+    __tablename__ = "stock_counts"
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(
+        Integer,
+        ForeignKey("stock_sessions.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    variant_id = Column(
+        Integer,
+        ForeignKey("product_variants.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    qty = Column(Integer, nullable=False, default=0)
+    # último movimento do livro-razão quando a variação foi lida
+    mark_movement_id = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("session_id", "variant_id", name="uq_stock_counts_session_variant"),
+    )
+
+
+class StockSnapshot(Base):
+    """Foto periódica do estoque: base para "estoque na data X"."""
+    __tablename__ = "stock_snapshots"
+
+    id = Column(Integer, primary_key=True)
+    variant_id = Column(
+        Integer,
+        ForeignKey("product_variants.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    stock = Column(Integer, nullable=False)
+    # último movimento já refletido em `stock` (0 = nenhum)
+    last_movement_id = Column(Integer, nullable=False, default=0)
+    taken_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_stock_snapshots_variant_id_taken_at", "variant_id", "taken_at"),
+    )
+
 
 # =========================
 # Clients
@@ -102,7 +260,10 @@ class Sale(Base):
     received = Column(Float, default=0.0)
     subtotal = Column(Float, default=0.0)
     total = Column(Float, default=0.0)
-    created_at = Column(DateTime, server_default=func.now())
+    # usuário que registrou a venda (username, desnormalizado como em sale_items)
+    operator = Column(String(80), nullable=True)
+    # índice: dashboard, exportação e listagem filtram/ordenam por data
+    created_at = Column(DateTime, server_default=func.now(), index=True)
 
     items = relationship(
         "SaleItem",
@@ -123,3 +284,24 @@ class SaleItem(Base):
     price = Column(Float, default=0.0)
 
     sale = relationship("Sale", back_populates="items")
+
+
+# =========================
+# Auditoria (somente inserção)
+# =========================
+class AuditLog(Base):
+    """Mutações administrativas; gravado em lote por backend/audit.py."""
+    __tablename__ = "audit_log"
+
+    id = Column(Integer, primary_key=True)
+    at = Column(DateTime, nullable=False)
+    actor = Column(String(80), nullable=True)
+    action = Column(String(40), nullable=False)   # create | update | delete | apply | import | bulk_price
+    entity = Column(String(40), nullable=False)   # user | product | variant | stock_session | catalog
+    entity_id = Column(String(64), nullable=True)
+    detail = Column(Text, nullable=True)          # JSON
+
+    __table_args__ = (
+        Index("ix_audit_log_entity", "entity", "entity_id"),
+        Index("ix_audit_log_at", "at"),
+    )
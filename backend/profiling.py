@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+
+from fastapi.routing import APIRoute
+
+# =========================
+# Profiling sob demanda (admin)
+# =========================
+# 1) Por requisição: header "X-Profile: 1" (ou ?_profile=1) com token de
+#    admin. A rota roda sob um amostrador que lê só a thread dela; a resposta
+#    leva X-Profile-Id e as pilhas ficam em /api/admin/profiles/{id} no
+#    formato "folded" (flamegraph.pl, speedscope).
+# 2) Janela de amostragem: POST /api/admin/profiler/sample amostra todas as
+#    threads por N segundos a uma frequência baixa e guarda as pilhas mais
+#    quentes. Custo limitado pela frequência e pelo nº de pilhas distintas.
+#
+# Tudo em memória, por worker, sem reiniciar nada. Com PDV_PROFILE_DIR
+# definido, cada perfil também é gravado em disco.
+
+REQUEST_HZ = int(os.getenv("PDV_PROFILE_HZ", "1000"))
+MAX_STACKS = 5000
+MAX_DEPTH = 64
+KEEP = 20  # perfis guardados por worker
+PROFILE_DIR = os.getenv("PDV_PROFILE_DIR")
+
+_OVERFLOW = "<outras pilhas>"
+# pilhas paradas em espera (threadpool ocioso, event loop no select)
+_IDLE_LEAF = ("threading.py", "queue.py", "selectors.py", "socket.py")
+
+_ids = itertools.count(1)
+_store: deque[Profile] = deque(maxlen=KEEP)
+_request_profile: ContextVar[Profile | None] = ContextVar("pdv_request_profile", default=None)
+_window: Sampler | None = None
+_window_lock = threading.Lock()
+
+
+def _frame_label(f) -> str:
+    code = f.f_code
+    path = code.co_filename
+    if "site-packages" + os.sep in path:
+        path = path.split("site-packages" + os.sep, 1)[1]
+    elif os.sep + "backend" + os.sep in path:
+        path = "backend/" + path.rsplit(os.sep + "backend" + os.sep, 1)[1]
+    else:
+        path = os.path.basename(path)
+    return f"{code.co_name} ({path})"
+
+
+def _stack(frame) -> tuple[str, bool]:
+    names = []
+    leaf = os.path.basename(frame.f_code.co_filename)
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(_frame_label(frame))
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names), leaf in _IDLE_LEAF
+
+
+class Sampler:
+    """Amostra pilhas de threads (todas ou só `threads`) numa thread própria."""
+
+    def __init__(self, hz: int, threads: set[int] | None = None, skip_idle: bool = True,
+                 seconds: float | None = None, on_done=None):
+        self.interval = 1.0 / max(1, hz)
+        self.seconds = seconds
+        self.on_done = on_done
+        self.threads = threads
+        self.skip_idle = skip_idle
+        self.counts: Counter[str] = Counter()
+        self.samples = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pdv-sampler", daemon=True)
+
+    def start(self) -> "Sampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> "Sampler":
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        deadline = self.started + self.seconds if self.seconds else None
+        while not self._stop.wait(self.interval):
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            for tid, frame in sys._current_frames().items():
+                if tid == me or (self.threads is not None and tid not in self.threads):
+                    continue
+                stack, idle = _stack(frame)
+                if idle and self.skip_idle:
+                    continue
+                if stack not in self.counts and len(self.counts) >= MAX_STACKS:
+                    stack = _OVERFLOW
+                self.counts[stack] += 1
+                self.samples += 1
+        self.elapsed = time.perf_counter() - self.started
+        if self.on_done is not None:
+            self.on_done()
+
+    def folded(self) -> str:
+        return "".join(f"{s} {n}\n" for s, n in self.counts.most_common())
+
+    def top(self, n: int = 20) -> list[dict]:
+        total = max(1, self.samples)
+        return [
+            {"stack": s.split(";"), "samples": c, "pct": round(100.0 * c / total, 1)}
+            for s, c in self.counts.most_common(n)
+        ]
+
+
+class Profile:
+    def __init__(self, label: str, kind: str):
+        self.id = next(_ids)
+        self.label = label
+        self.kind = kind
+        self.created_at = datetime.now()
+        self.sampler: Sampler | None = None
+
+    def info(self) -> dict:
+        s = self.sampler
+        return {
+            "id": self.id, "kind": self.kind, "label": self.label,
+            "created_at": self.created_at.isoformat(timespec="seconds"),
+            "ms": round(s.elapsed * 1000.0, 1) if s else None,
+            "samples": s.samples if s else 0,
+            "running": bool(s and s.running),
+        }
+
+
+def _write(p: Profile) -> None:
+    if PROFILE_DIR:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = f"{p.created_at:%Y%m%d-%H%M%S}-{p.id}-{p.kind}.folded"
+        with open(os.path.join(PROFILE_DIR, name), "w", encoding="utf-8") as f:
+            f.write(p.sampler.folded())
+
+
+def get_profile(profile_id: int) -> Profile | None:
+    return next((p for p in _store if p.id == profile_id), None)
+
+
+def list_profiles() -> list[dict]:
+    return [p.info() for p in reversed(_store)]
+
+
+# -------- por requisição --------
+
+def _profiled(endpoint):
+    """Envolve a rota: se a requisição pediu profiling, amostra a thread dela."""
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def _async(*args, **kwargs):
+            prof = _request_profile.get()
+            if prof is None:
+                return await endpoint(*args, **kwargs)
+            prof.sampler = Sampler(REQUEST_HZ, {threading.get_ident()}, skip_idle=False).start()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                prof.sampler.stop()
+        return _async
+
+    @functools.wraps(endpoint)
+    def _sync(*args, **kwargs):
+        prof = _request_profile.get()
+        if prof is None:
+            return endpoint(*args, **kwargs)
+        prof.sampler = Sampler(REQUEST_HZ, {threading.get_ident()}, skip_idle=False).start()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            prof.sampler.stop()
+    return _sync
+
+
+class ProfiledRoute(APIRoute):
+    """route_class do app: permite perfilar qualquer rota sob demanda."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _profiled(endpoint), **kwargs)
+
+
+def _wants_profile(scope) -> str | None:
+    auth = None
+    wanted = b"_profile=1" in scope.get("query_string", b"")
+    for k, v in scope.get("headers", []):
+        if k == b"x-profile" and v not in (b"", b"0"):
+            wanted = True
+        elif k == b"authorization":
+            auth = v.decode("latin-1")
+    return auth if wanted else None
+
+
+def _is_admin(authorization: str) -> bool:
+    from .auth import user_from_token_str
+    from .database import SessionLocal
+
+    with SessionLocal() as db:
+        user = user_from_token_str(authorization, db)
+        return bool(user and user.role == "admin")
+
+
+class ProfilingMiddleware:
+    """Liga o profiling da requisição quando um admin pede (X-Profile: 1)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        auth = _wants_profile(scope) if scope["type"] == "http" else None
+        if not auth:
+            await self.app(scope, receive, send)
+            return
+        from starlette.concurrency import run_in_threadpool
+
+        if not await run_in_threadpool(_is_admin, auth):
+            await self.app(scope, receive, send)  # pedido ignorado, segue normal
+            return
+        prof = Profile(f'{scope["method"]} {scope.get("path", "")}', "request")
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"x-profile-id", str(prof.id).encode())]}
+            await send(message)
+
+        token = _request_profile.set(prof)
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _request_profile.reset(token)
+            if prof.sampler is not None:
+                _store.append(prof)
+                _write(prof)
+
+
+# -------- janela de amostragem (todas as threads) --------
+
+def start_window(seconds: float, hz: int) -> Profile:
+    """Amostra o processo por `seconds` numa thread de fundo; devolve o perfil."""
+    global _window
+    with _window_lock:
+        if _window is not None and _window.running:
+            raise RuntimeError("Já existe uma amostragem em andamento.")
+        prof = Profile(f"janela {seconds:g}s @ {hz}Hz", "window")
+        prof.sampler = _window = Sampler(hz, seconds=seconds, on_done=lambda: _write(prof)).start()
+    _store.append(prof)
+    return prof
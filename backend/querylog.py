@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# =========================
+# Instrumentação de SQL por requisição
+# =========================
+# Conta consultas e tempo de banco por requisição (headers X-Query-Count e
+# Server-Timing), loga consultas lentas sem os valores dos parâmetros e
+# detecta N+1: a mesma consulta (mesmo texto SQL) repetida mais de
+# PDV_NPLUS1_LIMIT vezes numa requisição gera log; com PDV_NPLUS1_RAISE=1
+# (dev/teste) a requisição falha.
+#
+# O contexto da requisição chega ao threadpool das rotas síncronas via
+# contextvars; o objeto é compartilhado, então as threads só o alteram.
+
+SLOW_QUERY_MS = float(os.getenv("PDV_SLOW_QUERY_MS", "200"))
+NPLUS1_LIMIT = int(os.getenv("PDV_NPLUS1_LIMIT", "20"))  # 0 = desliga
+NPLUS1_RAISE = os.getenv("PDV_NPLUS1_RAISE", "").lower() in ("1", "true", "yes")
+
+log = logging.getLogger("uvicorn.error")
+
+
+class RepeatedQueryError(RuntimeError):
+    """Mesma consulta repetida demais numa requisição (provável N+1)."""
+
+
+class QueryStats:
+    __slots__ = ("label", "count", "ms", "shapes", "flagged")
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.count = 0
+        self.ms = 0.0
+        self.shapes: Counter[str] = Counter()
+        self.flagged: set[str] = set()
+
+
+_current: ContextVar[QueryStats | None] = ContextVar("pdv_query_stats", default=None)
+
+
+@contextmanager
+def track(label: str = ""):
+    """Mede as consultas do bloco: `with track() as st: ...; st.count`."""
+    st = QueryStats(label)
+    token = _current.set(st)
+    try:
+        yield st
+    finally:
+        _current.reset(token)
+
+
+def _short(sql: str, size: int = 500) -> str:
+    sql = " ".join(sql.split())
+    return sql if len(sql) <= size else sql[:size] + "..."
+
+
+def _before(conn, cursor, statement, parameters, context, executemany):
+    context._pdv_t0 = time.perf_counter()
+    st = _current.get()
+    if st is None or NPLUS1_LIMIT <= 0:
+        return
+    n = st.shapes[statement] = st.shapes[statement] + 1
+    if n > NPLUS1_LIMIT and statement not in st.flagged:
+        st.flagged.add(statement)
+        msg = "Consulta repetida %d vezes em %s (N+1?): %s" % (n, st.label or "-", _short(statement))
+        if NPLUS1_RAISE:
+            raise RepeatedQueryError(msg)
+        log.warning(msg)
+
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    ms = (time.perf_counter() - getattr(context, "_pdv_t0", time.perf_counter())) * 1000.0
+    st = _current.get()
+    if st is not None:
+        st.count += 1
+        st.ms += ms
+    if ms >= SLOW_QUERY_MS:
+        nparams = len(parameters) if isinstance(parameters, (list, tuple, dict)) else 0
+        log.warning(
+            "Consulta lenta (%.0fms) em %s: %s [%s%d parâmetros omitidos]",
+            ms, st.label if st else "-", _short(statement),
+            "executemany, " if executemany else "", nparams,
+        )
+
+
+def instrument_engine(engine: Engine) -> None:
+    if not event.contains(engine, "before_cursor_execute", _before):
+        event.listen(engine, "before_cursor_execute", _before)
+        event.listen(engine, "after_cursor_execute", _after)
+
+
+class QueryStatsMiddleware:
+    """Abre um QueryStats por requisição e devolve os totais nos headers."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with track(f'{scope["method"]} {scope.get("path", "")}') as st:
+
+            async def _send(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-query-count", str(st.count).encode()))
+                    headers.append((b"server-timing", f"db;dur={st.ms:.1f}".encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, _send)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -78,6 +78,14 @@ class VariantCreate(BaseModel):
     min_stock: int = 0
     price: float | None = None
 
+class ScanMatch(BaseModel):
+    """O que o caixa põe no carrinho quando o código lido é um código de barras."""
+    code: str
+    variant_id: int | None = None
+    variant: str | None = None
+    price: float                  # preço da variação (ou do produto, se ela não tiver)
+    pack_qty: int = 1
+
 class ProductOut(BaseModel):
     id: int
     sku: str
@@ -86,9 +94,69 @@ class ProductOut(BaseModel):
     price: float
     variants: list[VariantOut] = []   # <-- NOVO
     image_url: str | None = None
+    match: ScanMatch | None = None    # só no /find por código de barras (variants = só a do código)
     class Config:
         from_attributes = True
 
+class BarcodeCreate(BaseModel):
+    code: str = Field(..., min_length=1, max_length=64)
+    variant: str | None = None     # nome da variação; vazio = código do produto
+    pack_qty: int = Field(1, ge=1)
+
+class BarcodeOut(BaseModel):
+    id: int
+    code: str
+    product_id: int
+    variant_id: int | None = None
+    variant: str | None = None
+    pack_qty: int
+
+class Candidate(BaseModel):
+    id: int
+    sku: str
+    name: str
+    variant: str | None = None
+    price: float
+    image_url: str | None = None
+    tier: str                          # sku | barcode | sku_prefix | name_prefix | name
+    match: ScanMatch | None = None     # só quando veio pelo código de barras
+
+class Suggestion(BaseModel):
+    id: int
+    sku: str
+    name: str
+
+class SuggestOut(BaseModel):
+    items: list[Suggestion]
+
+class ResolveOut(BaseModel):
+    items: list[Candidate]
+    exact: bool = False                # SKU ou código de barras exato
+    truncated: bool = False            # parou no prazo (PDV_RESOLVE_BUDGET_MS)
+
+
+class BulkPriceIn(BaseModel):
+    mode: Literal["percent", "absolute"]          # percent: +10 = +10%; absolute: +1.50
+    value: float
+    target: Literal["product", "variant", "both"] = "product"
+    rounding: Literal["none", "cents", "integer", "ends_90", "ends_99"] = "cents"
+    # filtros (ao menos um)
+    sku_prefix: str | None = None
+    query: str | None = None
+    ids: list[int] | None = None
+    dry_run: bool = False
+
+
+class StockSessionCreate(BaseModel):
+    kind: Literal["stocktake", "receiving"] = "stocktake"
+
+class StockScanItem(BaseModel):
+    code: str                  # SKU, "SKU-VARIAÇÃO" ou "SKU#VARIAÇÃO"
+    qty: int = 1
+
+class StockScanIn(BaseModel):
+    items: List[StockScanItem]
+
 
 class ClientOut(BaseModel):
     id: int
@@ -129,6 +197,7 @@ class SaleOut(BaseModel):
     received: float
     subtotal: float
     total: float
+    operator: str | None = None
     created_at: datetime
     items: List[SaleItemOut]
     class Config: from_attributes = True
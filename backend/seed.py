@@ -1,14 +1,162 @@
 from .database import SessionLocal, engine
 from .models import Product, Client, User
 from sqlalchemy.orm import Session
-from .database import Base
+from . import migrations
+import argparse
+import sys
 import logging
+import time
+from datetime import datetime, timedelta
 logging.getLogger("passlib").setLevel(logging.ERROR)
 
-# cria as tabelas antes de semear
-Base.metadata.create_all(bind=engine)
 
-def main():
+# =========================
+# Gerador de volume (dados sintéticos)
+# =========================
+# python -m backend.seed --products 50000 --variants 4 --sales 2000000 --days 365
+# Popularidade Zipf (poucos produtos vendem muito), curva de vendas por hora,
+# mais movimento no fim de semana e mix de pagamento. Insere com executemany
+# do Core em blocos grandes, uma transação por fase.
+
+SIZES = ["UN", "P", "M", "G", "GG", "XG", "350ml", "1L"]
+WORDS = [
+    "Coca-Cola", "Guaraná", "Água Mineral", "Suco", "Cerveja", "Café", "Arroz", "Feijão",
+    "Açúcar", "Biscoito", "Salgadinho", "Chocolate", "Sabonete", "Detergente", "Camiseta",
+    "Bermuda", "Meia", "Boné", "Pão de Forma", "Leite",
+]
+# fração das vendas por hora do dia (loja aberta 7h-22h, picos no almoço e fim da tarde)
+HOURLY = [0, 0, 0, 0, 0, 0, 0, 2, 4, 5, 6, 8, 10, 8, 6, 5, 6, 8, 10, 9, 6, 4, 2, 0]
+WEEKDAY = [0.9, 0.85, 0.9, 0.95, 1.1, 1.4, 1.0]  # seg..dom
+PAYMENTS = [("PIX", 0.42), ("Cartão Débito", 0.25), ("Cartão Crédito", 0.2), ("Dinheiro", 0.13)]
+OPERATORS = ["admin", "caixa1", "caixa2", "caixa3"]
+ITEMS_PER_SALE = [0.35, 0.25, 0.15, 0.1, 0.06, 0.04, 0.03, 0.02]  # 1..8 linhas
+SALES_CHUNK = 50_000
+
+
+def _next_id(conn, table) -> int:
+    from sqlalchemy import func, select
+    return (conn.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar_one()) + 1
+
+
+def ean13(n: int) -> str:
+    """EAN-13 de teste, prefixo 789 (Brasil), com dígito verificador."""
+    body = f"789{n:09d}"
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(body))
+    return body + str((10 - total % 10) % 10)
+
+
+def generate(products: int, variants: int, sales: int, days: int, seed: int = 42, zipf: float = 1.1) -> dict:
+    """Gera catálogo e histórico de vendas; devolve contagens e tempos."""
+    import numpy as np
+    from sqlalchemy import insert, select
+    from . import models, stock
+
+    rng = np.random.default_rng(seed)
+    variants = max(1, min(variants, len(SIZES)))
+    out = {"products": 0, "variants": 0, "sales": 0, "items": 0}
+    t0 = time.perf_counter()
+
+    # ---- catálogo ----
+    P, PV = models.Product.__table__, models.ProductVariant.__table__
+    with engine.begin() as conn:
+        first = _next_id(conn, P)
+        pids = np.arange(first, first + products)
+        prices = np.round(np.exp(rng.normal(2.5, 0.9, products)), 2).clip(0.5, 2000)
+        words = rng.integers(0, len(WORDS), products)
+        skus = [f"G{i:07d}" for i in pids]
+        conn.execute(insert(P), [
+            {"id": int(pid), "sku": sku, "name": f"{WORDS[w]} {pid}", "variant": SIZES[0], "price": float(pr),
+             "sku_key": models.ci_key(sku), "name_key": models.ci_key(f"{WORDS[w]} {pid}"),
+             "sku_search": models.search_key(sku), "name_search": models.search_key(f"{WORDS[w]} {pid}")}
+            for pid, sku, w, pr in zip(pids, skus, words, prices)
+        ])
+        first_variant = _next_id(conn, PV)
+        stocks = rng.integers(0, 300, products * variants)
+        conn.execute(insert(PV), [
+            {"product_id": int(pids[k // variants]), "variant": SIZES[k % variants],
+             "stock": int(stocks[k]), "min_stock": 5}
+            for k in range(products * variants)
+        ])
+        # um EAN-13 por variação (ean13(id da variação))
+        B = models.Barcode.__table__
+        conn.execute(insert(B), [
+            {"code": ean13(vid), "product_id": pid, "variant_id": vid, "pack_qty": 1}
+            for vid, pid in conn.execute(
+                select(PV.c.id, PV.c.product_id).where(PV.c.product_id >= first)
+            )
+        ])
+    out["products"], out["variants"] = products, products * variants
+    out["catalog_s"] = round(time.perf_counter() - t0, 2)
+
+    # ---- vendas ----
+    t1 = time.perf_counter()
+    rank = rng.permutation(products) + 1  # popularidade não acompanha o id
+    pop = 1.0 / rank ** zipf
+    pop /= pop.sum()
+    hourly = np.array(HOURLY, dtype=float) / sum(HOURLY)
+    start = datetime.combine(datetime.now().date() - timedelta(days=days - 1), datetime.min.time())
+    dweights = np.array([WEEKDAY[(start + timedelta(days=d)).weekday()] for d in range(days)])
+    dweights /= dweights.sum()
+    pay_names = [p for p, _ in PAYMENTS]
+    pay_p = np.array([w for _, w in PAYMENTS])
+
+    S, SI = models.Sale.__table__, models.SaleItem.__table__
+    with engine.begin() as conn:
+        sale_id = _next_id(conn, S)
+        for offset in range(0, sales, SALES_CHUNK):
+            n = min(SALES_CHUNK, sales - offset)
+            secs = (
+                rng.choice(days, n, p=dweights) * 86400
+                + rng.choice(24, n, p=hourly) * 3600
+                + rng.integers(0, 3600, n)
+            )
+            order = np.argsort(secs)  # ids crescem com o tempo, como na vida real
+            secs = secs[order]
+            nitems = rng.choice(len(ITEMS_PER_SALE), n, p=ITEMS_PER_SALE) + 1
+            owner = np.repeat(np.arange(n), nitems)
+            prod = rng.choice(products, owner.size, p=pop)
+            var = rng.integers(0, variants, owner.size)
+            qty = rng.choice([1, 1, 1, 2, 2, 3, 6], owner.size)
+            line = qty * prices[prod]
+            subtotal = np.round(np.bincount(owner, weights=line, minlength=n), 2)
+            pay = rng.choice(len(pay_names), n, p=pay_p)
+            oper = rng.integers(0, len(OPERATORS), n)
+
+            ids = np.arange(sale_id, sale_id + n)
+            conn.execute(insert(S), [
+                {"id": int(ids[k]), "payment": pay_names[pay[k]], "subtotal": float(subtotal[k]),
+                 "total": float(subtotal[k]), "received": float(subtotal[k]),
+                 "operator": OPERATORS[oper[k]], "created_at": start + timedelta(seconds=int(secs[k]))}
+                for k in range(n)
+            ])
+            conn.execute(insert(SI), [
+                {"sale_id": int(ids[owner[j]]), "sku": skus[prod[j]], "name": f"{WORDS[words[prod[j]]]} {pids[prod[j]]}",
+                 "variant": SIZES[var[j]], "qty": int(qty[j]), "price": float(prices[prod[j]])}
+                for j in range(owner.size)
+            ])
+            sale_id += n
+            out["sales"] += n
+            out["items"] += int(owner.size)
+            print(f"  vendas: {out['sales']}/{sales}", file=sys.stderr, flush=True)
+    out["sales_s"] = round(time.perf_counter() - t1, 2)
+
+    # foto de abertura só das variações novas (o livro-razão começa aqui)
+    with SessionLocal() as db:
+        stock.take_snapshot(db, after_id=first_variant - 1)
+    return out
+
+
+def main(argv: list[str] | None = None):
+    ap = argparse.ArgumentParser(prog="python -m backend.seed")
+    ap.add_argument("--products", type=int, default=0, help="produtos sintéticos (0 = só o seed demo)")
+    ap.add_argument("--variants", type=int, default=1, help="variações por produto")
+    ap.add_argument("--sales", type=int, default=0)
+    ap.add_argument("--days", type=int, default=365, help="período das vendas (até hoje)")
+    ap.add_argument("--seed", type=int, default=42, help="semente (gera sempre os mesmos dados)")
+    args = ap.parse_args(argv)
+
+    # aplica as migrações pendentes antes de semear
+    migrations.upgrade(engine)
     db: Session = SessionLocal()
     try:
         # Usuário admin padrão (se não existir)
@@ -36,5 +184,12 @@ def main():
     finally:
         db.close()
 
+    if args.products > 0:
+        r = generate(args.products, args.variants, args.sales, args.days, args.seed)
+        print(
+            f"Gerados {r['products']} produtos, {r['variants']} variações ({r['catalog_s']}s), "
+            f"{r['sales']} vendas, {r['items']} itens ({r.get('sales_s', 0)}s)."
+        )
+
 if __name__ == "__main__":
     main()
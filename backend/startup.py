@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import logging
+import os
+import time
+
+# =========================
+# Tempo de startup por fase
+# =========================
+# Importado primeiro por app.py: cada mark() fecha a fase iniciada no
+# mark anterior. O relatório sai no log ao subir e em /api/admin/startup.
+
+_t0 = time.perf_counter()
+_last = _t0
+_phases: list[tuple[str, float]] = []
+
+log = logging.getLogger("uvicorn.error")  # aparece junto com o log do uvicorn
+
+
+def mark(name: str) -> None:
+    global _last
+    now = time.perf_counter()
+    _phases.append((name, (now - _last) * 1000.0))
+    _last = now
+
+
+def report() -> dict:
+    return {
+        "pid": os.getpid(),
+        "phases": [{"name": n, "ms": round(ms, 1)} for n, ms in _phases],
+        "total_ms": round(sum(ms for _, ms in _phases), 1),
+    }
+
+
+def log_report() -> None:
+    r = report()
+    parts = ", ".join(f"{p['name']}={p['ms']}ms" for p in r["phases"])
+    log.info("Startup em %.1fms (%s)", r["total_ms"], parts)
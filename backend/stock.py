@@ -0,0 +1,125 @@
+"""Livro-razão de estoque: fotos periódicas, estoque na data e conciliação.
+
+Uso (na raiz do projeto):
+    python -m backend.stock snapshot
+    python -m backend.stock reconcile --workers 4 --chunk 2000
+
+O saldo de abertura é gravado pela migração do livro-razão; rode
+`snapshot` periodicamente (agendador do Windows / cron).
+"""
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session, aliased
+
+from .database import SessionLocal
+from . import models
+
+Move = models.StockMovement
+Snap = models.StockSnapshot
+PV = models.ProductVariant
+
+
+def take_snapshot(db: Session, after_id: int = 0) -> int:
+    """Grava uma foto das variações (id > after_id; padrão: todas) num único INSERT ... SELECT."""
+    last_move = select(func.coalesce(func.max(Move.id), 0)).scalar_subquery()
+    res = db.execute(
+        insert(Snap).from_select(
+            ["variant_id", "stock", "last_movement_id"],
+            select(PV.id, PV.stock, last_move).where(PV.id > after_id),
+        )
+    )
+    db.commit()
+    return res.rowcount or 0
+
+
+def stock_at(db: Session, variant_id: int, at: datetime) -> int:
+    """Estoque da variação em `at`: última foto anterior + movimentos seguintes."""
+    snap = db.execute(
+        select(Snap.stock, Snap.last_movement_id)
+        .where(Snap.variant_id == variant_id, Snap.taken_at <= at)
+        .order_by(Snap.taken_at.desc(), Snap.id.desc())
+        .limit(1)
+    ).first()
+    base, after = (snap.stock, snap.last_movement_id) if snap else (0, 0)
+    moved = db.execute(
+        select(func.coalesce(func.sum(Move.delta), 0)).where(
+            Move.variant_id == variant_id,
+            Move.id > after,
+            Move.created_at <= at,
+        )
+    ).scalar_one()
+    return int(base) + int(moved)
+
+
+def _reconcile_chunk(ids: list[int]) -> list[dict]:
+    """Confere um bloco de variações com uma única consulta agregada."""
+    latest = (
+        select(Snap.variant_id, func.max(Snap.id).label("sid"))
+        .where(Snap.variant_id.in_(ids))
+        .group_by(Snap.variant_id)
+        .subquery()
+    )
+    snap = aliased(Snap)
+    after = func.coalesce(snap.last_movement_id, 0)
+    moved = (
+        select(func.coalesce(func.sum(Move.delta), 0))
+        .where(Move.variant_id == PV.id, Move.id > after)
+        .correlate(PV, snap)
+        .scalar_subquery()
+    )
+    q = (
+        select(PV.id, PV.stock, func.coalesce(snap.stock, 0), moved)
+        .outerjoin(latest, latest.c.variant_id == PV.id)
+        .outerjoin(snap, snap.id == latest.c.sid)
+        .where(PV.id.in_(ids))
+    )
+    out = []
+    with SessionLocal() as db:
+        for vid, stock, base, delta in db.execute(q):
+            expected = int(base) + int(delta)
+            if expected != int(stock):
+                out.append({"variant_id": vid, "stock": int(stock), "ledger": expected})
+    return out
+
+
+def reconcile(workers: int = 4, chunk: int = 2000) -> list[dict]:
+    """Compara o livro-razão com `product_variants.stock`, em blocos paralelos."""
+    with SessionLocal() as db:
+        ids = db.execute(select(PV.id).order_by(PV.id)).scalars().all()
+    chunks = [ids[i:i + chunk] for i in range(0, len(ids), chunk)]
+    mismatches: list[dict] = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for part in pool.map(_reconcile_chunk, chunks):
+            mismatches.extend(part)
+    return mismatches
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m backend.stock")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("snapshot", help="grava uma foto do estoque atual")
+    rc = sub.add_parser("reconcile", help="confere livro-razão x estoque")
+    rc.add_argument("--workers", type=int, default=4)
+    rc.add_argument("--chunk", type=int, default=2000)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "snapshot":
+        with SessionLocal() as db:
+            n = take_snapshot(db)
+        print(f"Snapshot OK ({n} variações).")
+        return 0
+
+    bad = reconcile(workers=args.workers, chunk=args.chunk)
+    for m in bad:
+        print(f"DIVERGENTE variação {m['variant_id']}: estoque={m['stock']} livro={m['ledger']}")
+    print(f"Conciliação: {len(bad)} divergência(s).")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
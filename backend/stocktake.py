@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import re
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import and_, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from . import models, schemas, events
+from .crud import parse_sku_and_variant
+
+# =========================
+# Inventário / recebimento em lote
+# =========================
+# As leituras vão para uma tabela de staging (stock_counts), somadas por
+# variação. Ao aplicar, as diferenças viram movimentos do livro-razão e o
+# estoque é ajustado numa única transação.
+#
+# Vendas durante a contagem: cada linha do tally guarda o último movimento
+# existente quando a variação foi lida. No inventário o estoque final é
+#   contado + movimentos posteriores à leitura
+# então o que foi vendido depois de contado continua sendo baixado.
+
+Move, Count, Sess = models.StockMovement, models.StockCount, models.StockSession
+PV, P = models.ProductVariant, models.Product
+
+
+def open_session(db: Session, kind: str, user: str | None) -> models.StockSession:
+    s = Sess(kind=kind, status="open", created_by=user)
+    db.add(s)
+    db.commit()
+    db.refresh(s)
+    return s
+
+
+def get_session(db: Session, session_id: int) -> models.StockSession | None:
+    return db.get(Sess, session_id)
+
+
+def _candidates(code: str) -> list[tuple[str, str | None]]:
+    # SKU pode conter hífen: tenta o parser padrão, o último separador e o código inteiro
+    cands = [parse_sku_and_variant(code)]
+    m = re.match(r"^(?P<sku>.+?)\s*[-# ]\s*(?P<var>[^-# ]+)$", code)
+    if m:
+        cands.append((m.group("sku"), m.group("var")))
+    cands.append((code, None))
+    return cands
+
+
+def _resolve_codes(db: Session, codes: set[str]) -> dict[str, int]:
+    """code -> variant_id, com uma consulta para todo o lote."""
+    parsed = {c: _candidates(c) for c in codes}
+    skus = {sku for cands in parsed.values() for sku, _ in cands}
+    rows = db.execute(
+        select(PV.id, PV.variant, P.sku, P.variant.label("legacy"))
+        .join(P, P.id == PV.product_id)
+        .where(P.sku.in_(skus))
+    ).all()
+    by_sku: dict[str, list] = {}
+    for r in rows:
+        by_sku.setdefault(r.sku, []).append(r)
+
+    out: dict[str, int] = {}
+    for code, cands in parsed.items():
+        for sku, var in cands:
+            rows_sku = by_sku.get(sku, [])
+            if var is not None:
+                hit = [r for r in rows_sku if r.variant.lower() == var.lower()]
+            elif len(rows_sku) == 1:
+                hit = rows_sku
+            else:
+                hit = [r for r in rows_sku if r.legacy and r.variant == r.legacy]
+            if len(hit) == 1:
+                out[code] = hit[0].id
+                break
+    return out
+
+
+def _upsert_counts(db: Session, session_id: int, tally: dict[int, int], mark: int) -> None:
+    dialect = db.get_bind().dialect.name
+    rows = [
+        {"session_id": session_id, "variant_id": vid, "qty": qty, "mark_movement_id": mark}
+        for vid, qty in tally.items()
+    ]
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(Count)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Count.session_id, Count.variant_id],
+            set_={
+                "qty": Count.qty + stmt.excluded.qty,
+                "mark_movement_id": stmt.excluded.mark_movement_id,
+            },
+        )
+        db.execute(stmt, rows)
+        return
+    # outros bancos: lê o que já existe e separa insert/update
+    have = dict(db.execute(
+        select(Count.variant_id, Count.id)
+        .where(Count.session_id == session_id, Count.variant_id.in_(tally))
+    ).all())
+    new = [r for r in rows if r["variant_id"] not in have]
+    if new:
+        db.execute(insert(Count), new)
+    for r in rows:
+        if r["variant_id"] in have:
+            db.execute(
+                update(Count)
+                .where(Count.id == have[r["variant_id"]])
+                .values(qty=Count.qty + r["qty"], mark_movement_id=mark)
+            )
+
+
+def add_scans(db: Session, session: models.StockSession, scans: schemas.StockScanIn) -> dict:
+    """Soma um lote de leituras ao tally da sessão."""
+    if session.status != "open":
+        raise ValueError("Sessão já encerrada.")
+    codes = {i.code.strip() for i in scans.items if i.code and i.code.strip()}
+    resolved = _resolve_codes(db, codes) if codes else {}
+
+    tally: Counter[int] = Counter()
+    unknown: list[str] = []
+    for item in scans.items:
+        vid = resolved.get((item.code or "").strip())
+        if vid is None:
+            unknown.append(item.code)
+        else:
+            tally[vid] += int(item.qty)
+
+    if tally:
+        mark = db.execute(select(func.coalesce(func.max(Move.id), 0))).scalar_one()
+        _upsert_counts(db, session.id, tally, mark)
+        db.commit()
+    return {"accepted": sum(tally.values()), "variants": len(tally), "unknown": unknown}
+
+
+def session_summary(db: Session, session: models.StockSession, limit: int = 200) -> dict:
+    """Prévia das diferenças (sem gravar nada)."""
+    rows = db.execute(
+        select(Count.variant_id, P.sku, P.name, PV.variant, Count.qty, PV.stock, _moved_after())
+        .join(PV, PV.id == Count.variant_id)
+        .join(P, P.id == PV.product_id)
+        .where(Count.session_id == session.id)
+        .order_by(Count.variant_id)
+        .limit(limit)
+    ).all()
+    lines = []
+    for vid, sku, name, variant, qty, stock, moved in rows:
+        target = stock + qty if session.kind == "receiving" else qty + moved
+        lines.append({
+            "variant_id": vid, "sku": sku, "name": name, "variant": variant,
+            "counted": qty, "stock": stock, "new_stock": target, "delta": target - stock,
+        })
+    total = db.execute(select(func.count()).select_from(Count).where(Count.session_id == session.id)).scalar_one()
+    return {
+        "id": session.id, "kind": session.kind, "status": session.status,
+        "created_by": session.created_by, "created_at": session.created_at,
+        "applied_at": session.applied_at, "variants": total, "lines": lines,
+    }
+
+
+def _moved_after():
+    # movimentos da variação posteriores à leitura (vendas durante a contagem)
+    return (
+        select(func.coalesce(func.sum(Move.delta), 0))
+        .where(Move.variant_id == Count.variant_id, Move.id > Count.mark_movement_id)
+        .correlate(Count)
+        .scalar_subquery()
+    )
+
+
+def _claim(db: Session, session: models.StockSession, status: str, **values) -> None:
+    """Encerra a sessão (open -> status) no banco, na transação corrente.
+
+    O UPDATE ... WHERE status = 'open' é o que decide: de dois apply/cancel
+    simultâneos (duplo clique, dois admins) só um muda a linha.
+    """
+    # encerra a leitura que carregou a sessão: no SQLite, promover uma
+    # transação de leitura a escrita falha (database is locked) se outro escreveu
+    if db.in_transaction():
+        db.commit()
+    res = db.execute(
+        update(Sess)
+        .where(Sess.id == session.id, Sess.status == "open")
+        .values(status=status, **values)
+        .execution_options(synchronize_session=False)
+    )
+    if res.rowcount != 1:
+        db.rollback()
+        raise ValueError("Sessão já encerrada.")
+
+
+def apply_session(db: Session, session: models.StockSession) -> dict:
+    """Aplica o tally ao estoque numa transação e devolve o resumo."""
+    _claim(db, session, "applied", applied_at=datetime.now())
+
+    # Postgres: trava as variações da sessão (SQLite: o INSERT abaixo já
+    # pega o lock de escrita do banco até o commit)
+    db.execute(
+        select(PV.id)
+        .where(PV.id.in_(select(Count.variant_id).where(Count.session_id == session.id)))
+        .with_for_update()
+    ).all()
+
+    if session.kind == "receiving":
+        delta = Count.qty
+        kind = "receipt"
+    else:
+        delta = Count.qty + _moved_after() - PV.stock
+        kind = "stocktake"
+
+    # 1) diferenças -> livro-razão (um INSERT ... SELECT)
+    db.execute(
+        insert(Move).from_select(
+            ["variant_id", "delta", "kind", "session_id"],
+            select(Count.variant_id, delta, literal(kind), literal(session.id))
+            .join(PV, PV.id == Count.variant_id)
+            .where(Count.session_id == session.id, delta != 0),
+        )
+    )
+    # 2) estoque += diferença (um UPDATE)
+    applied = (
+        select(Move.delta)
+        .where(Move.session_id == session.id, Move.variant_id == PV.id)
+        .scalar_subquery()
+    )
+    db.execute(
+        update(PV)
+        .where(PV.id.in_(select(Move.variant_id).where(Move.session_id == session.id)))
+        .values(stock=PV.stock + applied)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+    changes = db.execute(
+        select(PV.id, PV.product_id, P.sku, P.name, PV.variant, PV.stock, PV.min_stock, Move.delta)
+        .join(Move, and_(Move.variant_id == PV.id, Move.session_id == session.id))
+        .join(P, P.id == PV.product_id)
+        .order_by(PV.id)
+    ).all()
+    if changes:
+        events.publish("stock_changed", {
+            "variants": [
+                {"id": c.id, "product_id": c.product_id, "variant": c.variant,
+                 "stock": c.stock, "min_stock": c.min_stock, "low": c.stock <= c.min_stock}
+                for c in changes
+            ],
+        })
+    return {
+        "id": session.id,
+        "kind": session.kind,
+        "changed": len(changes),
+        "units_in": sum(c.delta for c in changes if c.delta > 0),
+        "units_out": -sum(c.delta for c in changes if c.delta < 0),
+        "changes": [
+            {"variant_id": c.id, "sku": c.sku, "name": c.name, "variant": c.variant,
+             "delta": c.delta, "stock": c.stock}
+            for c in changes
+        ],
+    }
+
+
+def cancel_session(db: Session, session: models.StockSession) -> None:
+    _claim(db, session, "cancelled")
+    db.execute(Count.__table__.delete().where(Count.session_id == session.id))
+    db.commit()
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import re
+import threading
+from bisect import bisect_left, insort
+
+from sqlalchemy import select
+
+from . import models
+from .database import SessionLocal
+from .models import fold  # a mesma dobra das chaves de busca do crud.resolve
+
+# =========================
+# Sugestões do PDV (autocompletar por prefixo)
+# =========================
+# Índice em memória (cada worker do uvicorn tem o seu, como o cache do
+# dashboard): lista ordenada de (token, id) com os tokens do nome e do SKU
+# sem acento e sem diferenciar maiúsculas. "agua 5" acha "Água Mineral 500ml":
+# cada termo digitado tem que ser início de algum token do produto.
+#
+# Montado no startup (lifespan) ou na primeira consulta; depois só recebe os
+# deltas das gravações de produto (crud, importação de catálogo). Preço e
+# estoque não entram: o PDV busca o produto pelo id ao escolher.
+
+SUGGEST_LIMIT = 10
+# entradas do índice examinadas por consulta, no máximo: termos largos sem
+# produto em comum ("c a") varreriam faixas de dezenas de milhares com o
+# lock seguro (e o event loop parado, no modo async). Sugestão é atalho;
+# a leitura completa é o /api/products/resolve.
+SUGGEST_SCAN = 500
+_WORD = re.compile(r"\w+")
+_END = "\U0010ffff"  # depois de qualquer caractere: fim da faixa de um prefixo
+
+
+def tokens(sku: str | None, name: str | None) -> tuple[str, ...]:
+    sku_key = fold(sku).strip()
+    found = set(_WORD.findall(fold(name))) | set(_WORD.findall(sku_key))
+    if sku_key:
+        found.add(sku_key)  # "ABC-12" também casa inteiro
+    return tuple(sorted(found))
+
+
+def _entry(sku: str, name: str) -> tuple[str, str, tuple[str, ...], str]:
+    toks = tokens(sku, name)
+    return sku, name, toks, "".join("\0" + t for t in toks)
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: list[tuple[str, int]] = []          # ordenada
+        # id -> (sku, nome, tokens, "\0tok1\0tok2": filtro dos outros termos com um `in`)
+        self._products: dict[int, tuple[str, str, tuple[str, ...], str]] = {}
+        self.built = False
+
+    # ---- montagem / deltas ----
+
+    def build(self, db) -> int:
+        """Monta a partir do banco. Devolve o número de produtos."""
+        P = models.Product
+        with self._lock:
+            # segura o lock durante a leitura: gravações que chegarem agora
+            # esperam e entram por cima da foto (upsert/remove são idempotentes)
+            rows = db.execute(select(P.id, P.sku, P.name)).all()
+            products = {pid: _entry(sku, name) for pid, sku, name in rows}
+            self._products = products
+            self._entries = sorted((tok, pid) for pid, p in products.items() for tok in p[2])
+            self.built = True
+        return len(products)
+
+    def _drop(self, pid: int) -> None:
+        old = self._products.pop(pid, None)
+        if old is None:
+            return
+        for tok in old[2]:
+            i = bisect_left(self._entries, (tok, pid))
+            if i < len(self._entries) and self._entries[i] == (tok, pid):
+                del self._entries[i]
+
+    def upsert(self, pid: int, sku: str, name: str) -> None:
+        self.upsert_many([(pid, sku, name)])
+
+    def upsert_many(self, rows: list[tuple[int, str, str]]) -> None:
+        with self._lock:
+            if not self.built:
+                return  # a montagem vai ler do banco
+            added = []
+            for pid, sku, name in rows:
+                self._drop(pid)
+                self._products[pid] = p = _entry(sku, name)
+                added.extend((tok, pid) for tok in p[2])
+            if len(added) < 64:
+                for entry in added:
+                    insort(self._entries, entry)
+            else:
+                # importação: um sort só (o Timsort aproveita a parte já ordenada)
+                self._entries.extend(added)
+                self._entries.sort()
+
+    def remove(self, pid: int) -> None:
+        with self._lock:
+            if self.built:
+                self._drop(pid)
+
+    # ---- consulta ----
+
+    def suggest(self, query: str, limit: int = SUGGEST_LIMIT) -> list[dict]:
+        """Até `limit` produtos; token exato antes de token mais longo."""
+        terms = sorted(set(_WORD.findall(fold(query))))
+        if not terms:
+            return []
+        out: list[dict] = []
+        with self._lock:
+            entries = self._entries
+            # o termo com a menor faixa guia a varredura; os demais só filtram
+            lo, hi, guide = min(
+                ((bisect_left(entries, (t,)), bisect_left(entries, (t + _END,)), t) for t in terms),
+                key=lambda r: r[1] - r[0],
+            )
+            others = ["\0" + t for t in terms if t != guide]
+            products = self._products
+            seen: set[int] = set()
+            for _tok, pid in entries[lo:min(hi, lo + SUGGEST_SCAN)]:
+                if pid in seen:
+                    continue
+                seen.add(pid)
+                p = products[pid]
+                for t in others:  # laço simples: um all(genexpr) por entrada pesa
+                    if t not in p[3]:
+                        break
+                else:
+                    out.append({"id": pid, "sku": p[0], "name": p[1]})
+                    if len(out) >= limit:
+                        break
+        return out
+
+    def stats(self) -> dict:
+        return {"built": self.built, "products": len(self._products), "tokens": len(self._entries)}
+
+
+index = SuggestIndex()
+
+
+def ensure_built() -> None:
+    if not index.built:
+        with SessionLocal() as db:
+            index.build(db)
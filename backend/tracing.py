@@ -0,0 +1,339 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .profiling import ProfiledRoute
+
+# =========================
+# Tracing leve (spans em JSONL, formato OTLP/JSON)
+# =========================
+# PDV_TRACE_SAMPLE=0.1 rastreia 10% das requisições (padrão 0 = desligado;
+# um "traceparent" W3C com flag sampled também liga). Spans: a requisição,
+# dependências de auth, a rota, cada função do crud e cada comando SQL.
+# Uma thread grava os spans em lote em PDV_TRACE_FILE, uma linha por lote
+# no formato ExportTraceServiceRequest (o mesmo do file exporter do
+# OpenTelemetry Collector), com rotação por tamanho.
+#
+# Sem trace ativo, cada ponto instrumentado custa um ContextVar.get().
+
+SAMPLE_RATE = float(os.getenv("PDV_TRACE_SAMPLE", "0") or 0)
+TRACE_FILE = os.getenv(
+    "PDV_TRACE_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "traces", "spans.jsonl"),
+)
+MAX_BYTES = int(float(os.getenv("PDV_TRACE_MAX_MB", "20")) * 1024 * 1024)
+BACKUPS = 5
+BATCH = 512
+FLUSH_S = 2.0
+
+SERVICE = "pdv-api"
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start", "end", "attrs", "events", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, kind: int = KIND_INTERNAL):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time_ns()
+        self.end = 0
+        self.attrs: dict = {}
+        self.events: list[tuple[str, int]] = []
+        self.error: str | None = None
+
+    def child(self, name: str, kind: int = KIND_INTERNAL) -> "Span":
+        return Span(name, self.trace_id, self.span_id, kind)
+
+    def finish(self) -> None:
+        self.end = time.time_ns()
+        _exporter.put(self)
+
+    def to_otlp(self) -> dict:
+        d = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [_attr(k, v) for k, v in self.attrs.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 0},
+        }
+        if self.parent_id:
+            d["parentSpanId"] = self.parent_id
+        if self.events:
+            d["events"] = [{"name": n, "timeUnixNano": str(t)} for n, t in self.events]
+        return d
+
+
+def _attr(key: str, v) -> dict:
+    if isinstance(v, bool):
+        val = {"boolValue": v}
+    elif isinstance(v, int):
+        val = {"intValue": str(v)}
+    elif isinstance(v, float):
+        val = {"doubleValue": v}
+    else:
+        val = {"stringValue": str(v)}
+    return {"key": key, "value": val}
+
+
+_current: ContextVar[Span | None] = ContextVar("pdv_span", default=None)
+
+
+def current_trace_id() -> str | None:
+    s = _current.get()
+    return s.trace_id if s else None
+
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, **attrs):
+    """Span filho do atual; sem trace ativo não faz nada."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    s = parent.child(name, kind)
+    s.attrs.update(attrs)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"[:300]
+        raise
+    finally:
+        _current.reset(token)
+        s.finish()
+
+
+def traced(name: str):
+    """Decorator: a função vira um span (mantém a assinatura para o FastAPI)."""
+    def deco(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def _async(*args, **kwargs):
+                if _current.get() is None:
+                    return await fn(*args, **kwargs)
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return _async
+
+        @functools.wraps(fn)
+        def _sync(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return _sync
+    return deco
+
+
+def instrument_module(module, prefix: str | None = None) -> None:
+    """Troca as funções públicas do módulo por versões com span.
+
+    Como a troca é no namespace do módulo, as chamadas internas (ex.:
+    create_sale -> decrease_stock_for_items) também viram spans.
+    """
+    prefix = prefix or module.__name__.rsplit(".", 1)[-1]
+    for attr, fn in list(vars(module).items()):
+        if attr.startswith("_") or not inspect.isfunction(fn) or fn.__module__ != module.__name__:
+            continue
+        if getattr(fn, "__pdv_traced__", False):
+            continue
+        wrapped = traced(f"{prefix}.{attr}")(fn)
+        wrapped.__pdv_traced__ = True
+        setattr(module, attr, wrapped)
+
+
+class TracedRoute(ProfiledRoute):
+    """route_class do app: a função da rota vira um span próprio."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, traced(f"route {endpoint.__name__}")(endpoint), **kwargs)
+
+
+# -------- SQL --------
+
+def _before(conn, cursor, statement, parameters, context, executemany):
+    parent = _current.get()
+    if parent is None:
+        return
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+    s = parent.child(f"sql {verb}", KIND_CLIENT)
+    s.attrs["db.system"] = conn.dialect.name
+    s.attrs["db.statement"] = " ".join(statement.split())[:1000]  # sem parâmetros
+    if executemany:
+        s.attrs["db.executemany"] = True
+    context._pdv_span = s
+
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    s = getattr(context, "_pdv_span", None)
+    if s is not None:
+        s.attrs["db.rows"] = cursor.rowcount if cursor.rowcount is not None else -1
+        s.finish()
+
+
+def _error(exc_ctx):
+    s = getattr(exc_ctx.execution_context, "_pdv_span", None) if exc_ctx.execution_context else None
+    if s is not None:
+        s.error = f"{type(exc_ctx.original_exception).__name__}: {exc_ctx.original_exception}"[:300]
+        s.finish()
+
+
+def instrument_engine(engine: Engine) -> None:
+    if not event.contains(engine, "before_cursor_execute", _before):
+        event.listen(engine, "before_cursor_execute", _before)
+        event.listen(engine, "after_cursor_execute", _after)
+        event.listen(engine, "handle_error", _error)
+
+
+# -------- exportador --------
+
+class _Exporter:
+    """Fila + thread: agrupa spans e grava um lote por linha, com rotação."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._q: queue.SimpleQueue[Span] = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def put(self, s: Span) -> None:
+        self._q.put(s)
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="pdv-trace-export", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._q.get()]
+            deadline = time.monotonic() + FLUSH_S
+            while len(batch) < BATCH:
+                try:
+                    batch.append(self._q.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self.write(batch)
+            except OSError:
+                pass  # disco cheio/sem permissão: perde o lote, não derruba nada
+
+    def flush(self) -> None:
+        batch = []
+        while True:
+            try:
+                batch.append(self._q.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self.write(batch)
+
+    def write(self, batch: list[Span]) -> None:
+        line = json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [_attr("service.name", SERVICE), _attr("process.pid", os.getpid())]},
+                "scopeSpans": [{"scope": {"name": "backend.tracing"}, "spans": [s.to_otlp() for s in batch]}],
+            }],
+        }, ensure_ascii=False)
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= MAX_BYTES:
+                self._rotate()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def _rotate(self) -> None:
+        for i in range(BACKUPS - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+_exporter = _Exporter(TRACE_FILE)
+
+
+# -------- middleware --------
+
+def _parse_traceparent(value: str) -> tuple[str, str, bool] | None:
+    # 00-<trace 32 hex>-<span 16 hex>-<flags>
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2], bool(int(parts[3], 16) & 1)
+
+
+class TracingMiddleware:
+    """Abre o span raiz da requisição (se amostrada) e devolve o traceparent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        incoming = None
+        for k, v in scope.get("headers", []):
+            if k == b"traceparent":
+                try:
+                    incoming = _parse_traceparent(v.decode("latin-1"))
+                except ValueError:
+                    incoming = None
+                break
+        if incoming is not None:
+            sampled = incoming[2]
+        else:
+            sampled = SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+        if not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        trace_id, parent_id = (incoming[0], incoming[1]) if incoming else (os.urandom(16).hex(), None)
+        root = Span(f'{scope["method"]} {scope.get("path", "")}', trace_id, parent_id, KIND_SERVER)
+        root.attrs["http.method"] = scope["method"]
+        root.attrs["http.target"] = scope.get("path", "")
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                root.attrs["http.status_code"] = message["status"]
+                root.events.append(("response.start", time.time_ns()))
+                tp = f"00-{trace_id}-{root.span_id}-01".encode()
+                message = {**message, "headers": [*message.get("headers", []), (b"traceparent", tp)]}
+            await send(message)
+
+        token = _current.set(root)
+        try:
+            await self.app(scope, receive, _send)
+        except BaseException as e:
+            root.error = f"{type(e).__name__}: {e}"[:300]
+            raise
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            if route is not None:
+                root.name = f'{scope["method"]} {route.path_format}'
+                root.attrs["http.route"] = route.path_format
+            if root.attrs.get("http.status_code", 500) >= 500 and not root.error:
+                root.error = "HTTP %s" % root.attrs.get("http.status_code", 500)
+            root.finish()
@@ -159,7 +159,7 @@ function setLoggedIn(user, token){
     }
   }
 }
-on($("#logoutBtn"), "click", () => setLoggedIn(null, null));
+on($("#logoutBtn"), "click", () => { stopLiveEvents(); setLoggedIn(null, null); });
 
 // ===== Navegação lateral =====
 $$(".sidebar a").forEach(a => on(a, "click", e=>{
@@ -177,7 +177,7 @@ $$(".sidebar a").forEach(a => on(a, "click", e=>{
 }));
 
 // ===== Dashboard =====
-const dashState = { start:null, end:null };
+const dashState = { start:null, end:null, kpis:null };
 
 function setPreset(p){
   const t = new Date(); let s, e;
@@ -197,22 +197,29 @@ on($("#dashApply"), "click", ()=>{
 });
 $$(".chip").forEach(c=> on(c, "click", ()=>{ setPreset(c.dataset.range); $("#dashApply")?.click(); }));
 
+function renderKpis(k){
+  const set = (id,val)=>{ const el=$("#"+id); if (el) el.textContent = val; };
+  set("kpiOrders", k.orders||0);
+  set("kpiRevenue", currency(k.revenue||0));
+  set("kpiAvg", currency(k.avg_ticket||0));
+  set("kpiMonth", currency(k.month_revenue||0));
+}
+function latestSaleRow(v){
+  const tr = document.createElement("tr");
+  tr.innerHTML = `<td>${v.id}</td><td>${new Date(v.created_at).toLocaleString("pt-BR")}</td><td>${v.channel||"-"}</td><td>${v.payment||"-"}</td><td>R$ ${currency(v.total||0)}</td>`;
+  return tr;
+}
+
 async function refreshDashboard(){
   try{
     const qs = `?start=${encodeURIComponent(dashState.start||"")}&end=${encodeURIComponent(dashState.end||"")}`;
     const r1 = await api("/api/dashboard/summary"+qs); const s = await r1.json();
-    const k = s.kpis || {};
-    const set = (id,val)=>{ const el=$("#"+id); if (el) el.textContent = val; };
-    set("kpiOrders", k.orders||0);
-    set("kpiRevenue", currency(k.revenue||0));
-    set("kpiAvg", currency(k.avg_ticket||0));
-    set("kpiMonth", currency(k.month_revenue||0));
+    dashState.kpis = { ...(s.kpis || {}) };
+    renderKpis(dashState.kpis);
 
     const r2 = await api("/api/dashboard/latest_sales"+qs); const ls = await r2.json();
     const tb = $("#tblLatest tbody"); if (tb){ tb.innerHTML=""; (ls.items||[]).forEach(v=>{
-      const tr = document.createElement("tr");
-      tr.innerHTML = `<td>${v.id}</td><td>${new Date(v.created_at).toLocaleString("pt-BR")}</td><td>${v.channel||"-"}</td><td>${v.payment||"-"}</td><td>R$ ${currency(v.total||0)}</td>`;
-      tb.appendChild(tr);
+      tb.appendChild(latestSaleRow(v));
     });}
 
     const r3 = await api("/api/dashboard/top_products"+qs); const tp = await r3.json();
@@ -223,6 +230,36 @@ async function refreshDashboard(){
     });}
   }catch{/* silencioso */}
 }
+// ===== Eventos ao vivo (SSE): atualiza KPIs sem reconsultar o servidor =====
+let liveEvents = null;
+function dashIncludesToday(){
+  const today = fmtDate(new Date());
+  const s = dashState.start || today, e = dashState.end || today;
+  return s <= today && today <= e;
+}
+function onSaleCreated(ev){
+  const sale = JSON.parse(ev.data);
+  const k = dashState.kpis; if (!k) return;
+  if (dashIncludesToday()){
+    k.orders = (k.orders||0) + 1;
+    k.revenue = (k.revenue||0) + (sale.total||0);
+    k.avg_ticket = k.orders ? k.revenue / k.orders : 0;
+    const tb = $("#tblLatest tbody");
+    if (tb){ tb.prepend(latestSaleRow({ ...sale, channel:"PDV" })); if (tb.rows.length > 20) tb.deleteRow(-1); }
+  }
+  k.month_revenue = (k.month_revenue||0) + (sale.total||0);
+  renderKpis(k);
+}
+function startLiveEvents(){
+  stopLiveEvents();
+  if (!auth.token || typeof EventSource === "undefined") return;
+  liveEvents = new EventSource(`${API}/api/events/stream?token=${encodeURIComponent(auth.token)}`);
+  liveEvents.addEventListener("sale_created", onSaleCreated);
+}
+function stopLiveEvents(){
+  if (liveEvents){ liveEvents.close(); liveEvents = null; }
+}
+
 on($("#goSales"), "click", ()=> { showView("vendas"); });
 on($("#btnCsv"), "click", async ()=>{
   const qs = `?start=${encodeURIComponent(dashState.start||"")}&end=${encodeURIComponent(dashState.end||"")}`;
@@ -298,6 +335,29 @@ function addOrIncrementItem(prod, qty = 1, priceOverride = null){
   renderItems();
 }
 
+// sugestões por nome enquanto digita (índice em memória do servidor);
+// leitor de código de barras só manda dígitos: não consulta
+let pdvSuggestSeq = 0;
+on($("#pdvCode"), "input", async e=>{
+  const q = (e.target.value || "").trim();
+  const list = $("#pdvSuggest");
+  if (!list) return;
+  if (q.length < 2 || /^\d+$/.test(q)){ list.innerHTML = ""; return; }
+  const seq = ++pdvSuggestSeq;
+  try{
+    const r = await api(`/api/products/suggest?query=${encodeURIComponent(q)}`);
+    if (!r.ok || seq !== pdvSuggestSeq) return;   // resposta atrasada de outra tecla
+    const d = await r.json();
+    list.innerHTML = "";
+    (d.items || []).forEach(p=>{
+      const opt = document.createElement("option");
+      opt.value = p.sku;
+      opt.label = p.name;
+      list.appendChild(opt);
+    });
+  }catch{}
+});
+
 // submit do formulário de bipagem
 on($("#scanForm"), "submit", async (e)=>{
   e.preventDefault();
@@ -317,14 +377,22 @@ async function pdvFindAndAdd(){
   if (!code){ showPdvError("Informe um código/SKU para adicionar."); return; }
 
   if (btnAdd) btnAdd.disabled = true;
+  hidePdvPick();
 
   const res = await apiFetch(`/api/products/find?query=${encodeURIComponent(code)}`, { returnResponse: true });
 
   if (res.status === 200){
     const prod = await res.json();
-    addOrIncrementItem(prod, qty, pOv);
+    const m = prod.match;   // lido por código de barras: variação, preço e embalagem exatos
+    if (m) addOrIncrementItem({ ...prod, variant: m.variant, price: m.price }, qty * (m.pack_qty || 1), pOv);
+    else addOrIncrementItem(prod, qty, pOv);
     if (codeInput){ codeInput.value = ""; codeInput.focus(); }
     if (priceInp) priceInp.value = "";
+  }else if (res.status === 300){
+    // vários produtos para o que foi digitado: o caixa escolhe na lista
+    const data = await res.json();
+    showPdvError(data.detail || "Mais de um produto encontrado.");
+    showPdvPick(data.candidates || [], qty, pOv);
   }else if (res.status === 404){
     showPdvError("Produto não encontrado. Cadastre no inventário primeiro.");
   }else if (res.status === 400 || res.status === 422){
@@ -340,10 +408,37 @@ async function pdvFindAndAdd(){
   if (btnAdd) btnAdd.disabled = false;
 }
 
+function hidePdvPick(){
+  const box = $("#pdvPick");
+  if (box){ box.innerHTML = ""; box.classList.add("is-hidden"); }
+}
+
+function showPdvPick(candidates, qty, pOv){
+  const box = $("#pdvPick");
+  if (!box) return;
+  box.innerHTML = "";
+  candidates.forEach(c=>{
+    const b = document.createElement("button");
+    b.type = "button";
+    b.className = "btn";
+    b.textContent = `${c.sku} · ${c.name} · ${currency(c.price)}`;
+    on(b, "click", async ()=>{
+      hidePdvPick();
+      const res = await api(`/api/products/${c.id}`);
+      if (!res.ok){ showPdvError("Produto não encontrado."); return; }
+      addOrIncrementItem(await res.json(), qty, pOv);
+      const codeInput = $("#pdvCode");
+      if (codeInput){ codeInput.value = ""; codeInput.focus(); }
+    });
+    box.appendChild(b);
+  });
+  box.classList.toggle("is-hidden", !candidates.length);
+}
+
 // atalhos
 on(document, "keydown", e=>{
   if (e.altKey && (e.key === "d" || e.key === "D")){ e.preventDefault(); toggleTheme(); }
-  if (e.key === "Escape") { closeHistoryOverlay(); }
+  if (e.key === "Escape") { closeHistoryOverlay(); hidePdvPick(); }
   if (e.ctrlKey && e.key === "Backspace"){ e.preventDefault(); state.items = []; renderItems(); }
 });
 on($("#itensTable"), "input", e=>{
@@ -670,6 +765,7 @@ async function initAfterLogin(){
   ensureHistoryOverlay();
   await Promise.all([ refreshDashboard(), loadProducts() ]);
   await loadClients();
+  startLiveEvents();
 }
 
 // ===== Administração: Usuários & Permissões =====
@@ -0,0 +1,254 @@
+# scripts/bench.py
+# Benchmark reprodutível da API, em processo (ASGI), sobre um banco gerado.
+#
+# Uso (na raiz do projeto; requer httpx):
+#   python scripts/bench.py                          # roda tudo, imprime JSON
+#   python scripts/bench.py --out bench.json         # grava o resultado
+#   python scripts/bench.py --compare bench.json     # sinaliza regressões (p95)
+#   python scripts/bench.py --scenarios scan,checkout --iterations 500
+#
+# Cada cenário informa p50/p95/p99 (ms), vazão (req/s) e consultas SQL por
+# requisição. Com --compare, sai com código 1 se algum p95 piorar mais que
+# --threshold (padrão 20%). Cenários acima do orçamento de consultas
+# (QUERY_BUDGETS) também fazem o script sair com código 1.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+
+def _percentile(sorted_ms: list[float], p: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    k = min(len(sorted_ms) - 1, max(0, round(p / 100.0 * (len(sorted_ms) - 1))))
+    return sorted_ms[k]
+
+
+def build_dataset(products: int, variants: int, sales: int, days: int, seed: int) -> dict:
+    """Gera o banco com o gerador do seed (mesma semente = mesmos dados)."""
+    from backend import seed as seeder
+    return seeder.generate(products, variants, sales, days, seed)
+
+
+def _scenarios(products: int, lines: int):
+    from backend.seed import ean13
+
+    today = date.today()
+
+    def dash(days: int):
+        qs = f"?start={(today - timedelta(days=days - 1)).isoformat()}&end={today.isoformat()}"
+        return [
+            ("GET", f"/api/dashboard/summary{qs}", None),
+            ("GET", f"/api/dashboard/top_products{qs}", None),
+            ("GET", f"/api/dashboard/latest_sales{qs}", None),
+        ]
+
+    def sale(rnd):
+        items = []
+        for _ in range(lines):
+            pid = rnd.randint(1, products)
+            items.append({"sku": f"G{pid:07d}", "name": f"Produto {pid}", "variant": "UN", "qty": 1, "price": 10.0})
+        total = 10.0 * lines
+        return {"payment": "PIX", "subtotal": total, "total": total, "items": items}
+
+    return {
+        "scan": lambda rnd: [("GET", f"/api/products/find?query=G{rnd.randint(1, products):07d}", None)],
+        # leitura por EAN (seed.ean13 do id da variação; o SKU exato erra primeiro)
+        "scan_barcode": lambda rnd: [("GET", f"/api/products/find?query={ean13(rnd.randint(1, products))}", None)],
+        "checkout": lambda rnd: [("POST", "/api/sales", sale(rnd))],
+        "search": lambda rnd: [("GET", f"/api/products?query={rnd.choice(['coca', 'suco', 'arroz', 'leite'])}", None)],
+        "dashboard_1d": lambda rnd: dash(1),
+        "dashboard_1m": lambda rnd: dash(30),
+        "dashboard_1y": lambda rnd: dash(365),
+        "export_csv": lambda rnd: [("GET", f"/api/dashboard/export/sales.csv?start={(today - timedelta(days=29)).isoformat()}&end={today.isoformat()}", None)],
+    }
+
+
+async def run_scenario(client, headers, build, iterations, concurrency, keep_cache, seed):
+    from backend import cache
+
+    rnd = random.Random(seed)
+    timings: list[float] = []
+    errors = 0
+    queries = 0
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors, queries
+        reqs = build(rnd)
+        async with sem:
+            if not keep_cache:
+                cache.dashboard.clear()
+            t = time.perf_counter()
+            for method, url, body in reqs:
+                r = await client.request(method, url, json=body, headers=headers)
+                if r.status_code >= 400:
+                    errors += 1
+                # contado pelo middleware do backend (backend/querylog.py)
+                queries += int(r.headers.get("x-query-count", 0))
+            timings.append((time.perf_counter() - t) * 1000.0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(iterations)))
+    elapsed = time.perf_counter() - t0
+    timings.sort()
+    return {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "p50_ms": round(_percentile(timings, 50), 3),
+        "p95_ms": round(_percentile(timings, 95), 3),
+        "p99_ms": round(_percentile(timings, 99), 3),
+        "mean_ms": round(sum(timings) / len(timings), 3) if timings else 0.0,
+        "throughput_rps": round(iterations / elapsed, 1) if elapsed else 0.0,
+        "queries_per_request": round(queries / max(1, iterations), 2),
+        "errors": errors,
+    }
+
+
+# consultas SQL por iteração (inclui a do usuário autenticado)
+QUERY_BUDGETS = {
+    "scan": 3,
+    "scan_barcode": 3,
+    "search": 6,
+    "dashboard_1d": 10,
+    "dashboard_1m": 10,
+    "dashboard_1y": 10,
+    "export_csv": 4,
+}
+
+
+def over_budget(results: dict, lines: int) -> list[str]:
+    budgets = dict(QUERY_BUDGETS, checkout=2 + 8 * lines)
+    return [
+        f"{name}: {r['queries_per_request']} consultas/req (orçamento {budgets[name]})"
+        for name, r in results.items()
+        if name in budgets and r["queries_per_request"] > budgets[name]
+    ]
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    out = []
+    for name, cur in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base or not base.get("p95_ms"):
+            continue
+        ratio = cur["p95_ms"] / base["p95_ms"]
+        if ratio > 1 + threshold:
+            out.append(f"{name}: p95 {base['p95_ms']}ms -> {cur['p95_ms']}ms (+{(ratio - 1) * 100:.0f}%)")
+        if cur["queries_per_request"] > base.get("queries_per_request", cur["queries_per_request"]):
+            out.append(f"{name}: consultas/req {base['queries_per_request']} -> {cur['queries_per_request']}")
+    return out
+
+
+async def amain(args) -> int:
+    import httpx
+    from backend.database import SessionLocal, engine
+    from backend import crud, migrations
+    from backend.auth import create_access_token
+
+    migrations.upgrade(engine)
+    t = time.perf_counter()
+    dataset = build_dataset(args.products, args.variants, args.sales, args.days, args.seed)
+    dataset["build_s"] = round(time.perf_counter() - t, 2)
+    with SessionLocal() as db:
+        crud.create_user(db, username="bench", password="bench", role="admin")
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench'})}"}
+
+    from backend.app import app
+    scenarios = _scenarios(args.products, args.lines)
+    wanted = args.scenarios.split(",") if args.scenarios else list(scenarios)
+
+    results = {}
+    # erro do app vira 500 contado em "errors" (não derruba o benchmark)
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i, name in enumerate(wanted):
+            build = scenarios[name]
+            iterations = args.iterations if not name.startswith(("dashboard_1y", "export")) else max(1, args.iterations // 5)
+            # aquecimento (não medido)
+            await run_scenario(client, headers, build, min(5, iterations), 1, args.keep_cache, args.seed)
+            results[name] = await run_scenario(
+                client, headers, build, iterations, args.concurrency, args.keep_cache, args.seed + i
+            )
+            print(f"{name:14s} p50={results[name]['p50_ms']:8.2f}ms p95={results[name]['p95_ms']:8.2f}ms "
+                  f"{results[name]['throughput_rps']:8.1f} req/s  {results[name]['queries_per_request']} q/req",
+                  file=sys.stderr)
+
+    import sqlalchemy
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "machine": platform.machine(),
+            "dataset": dataset,
+            "lines_per_checkout": args.lines,
+            "keep_cache": args.keep_cache,
+        },
+        "scenarios": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    problems = over_budget(results, args.lines)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            problems += compare(report, json.load(f), args.threshold)
+    for p in problems:
+        print(f"REGRESSÃO {p}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Benchmark da API do PDV")
+    ap.add_argument("--products", type=int, default=5000)
+    ap.add_argument("--variants", type=int, default=2)
+    ap.add_argument("--sales", type=int, default=20000)
+    ap.add_argument("--days", type=int, default=365)
+    ap.add_argument("--lines", type=int, default=5, help="itens por venda no cenário checkout")
+    ap.add_argument("--iterations", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=1)
+    ap.add_argument("--scenarios", default="", help="lista separada por vírgula")
+    ap.add_argument("--keep-cache", action="store_true", help="não limpa o cache do dashboard entre requisições")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", default="")
+    ap.add_argument("--compare", default="", help="JSON de uma execução anterior")
+    ap.add_argument("--threshold", type=float, default=0.2)
+    ap.add_argument("--db", default="", help="arquivo SQLite novo, mantido ao fim (padrão: temporário)")
+    args = ap.parse_args()
+
+    tmp = None
+    if not args.db:
+        tmp = tempfile.TemporaryDirectory()
+        args.db = os.path.join(tmp.name, "bench.db")
+    elif os.path.exists(args.db):
+        # o bench gera o banco do zero: nunca apaga nem reaproveita arquivo alheio
+        print(f"{args.db} já existe; informe um arquivo novo (ou omita --db).", file=sys.stderr)
+        return 2
+    # precisa estar definido antes de importar backend.database
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+    os.environ.setdefault("PDV_ACCESS_LOG", "off")  # stdout é do JSON
+    try:
+        return asyncio.run(amain(args))
+    finally:
+        if tmp:
+            from backend.database import engine
+            engine.dispose()
+            tmp.cleanup()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,75 @@
+# scripts/bench_async.py
+# Compara o caminho síncrono (threadpool) com o assíncrono (aiosqlite/asyncpg)
+# sob muitos clientes simultâneos: roda o scripts/bench.py duas vezes, com
+# PDV_ASYNC_DB=0 e PDV_ASYNC_DB=1, sobre o mesmo banco gerado (mesma semente).
+#
+# Uso (na raiz do projeto; requer httpx e aiosqlite):
+#   python scripts/bench_async.py                     # 200 clientes
+#   python scripts/bench_async.py --concurrency 50 --iterations 400
+#   python scripts/bench_async.py --out async.json    # grava as duas execuções
+#
+# A admissão por classe de rota (backend/admission.py) fica desligada e o
+# pool síncrono ganha uma conexão por cliente (PDV_DB_POOL): com os padrões,
+# busca e dashboard recusam (503) a maior parte dos 200 clientes, e o que se
+# quer medir aqui é o banco, não o teto de cada classe.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SCENARIOS = "scan,checkout,search,dashboard_1d"
+
+
+def run(mode: str, args, out: str) -> dict:
+    env = dict(
+        os.environ, PDV_ASYNC_DB=mode, PDV_ACCESS_LOG="off",
+        PDV_ADMISSION="off", PDV_DB_POOL=str(args.concurrency),
+    )
+    cmd = [
+        sys.executable, os.path.join(ROOT, "scripts", "bench.py"),
+        "--products", str(args.products), "--sales", str(args.sales),
+        "--iterations", str(args.iterations), "--concurrency", str(args.concurrency),
+        "--scenarios", args.scenarios, "--seed", str(args.seed), "--out", out,
+    ]
+    print(f"== PDV_ASYNC_DB={mode}", file=sys.stderr)
+    # código 1 do bench = orçamento de consultas; aqui só interessa o JSON
+    subprocess.run(cmd, cwd=ROOT, env=env, check=False)
+    with open(out, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Caminho síncrono x assíncrono sob concorrência")
+    ap.add_argument("--concurrency", type=int, default=200)
+    ap.add_argument("--iterations", type=int, default=1000)
+    ap.add_argument("--products", type=int, default=5000)
+    ap.add_argument("--sales", type=int, default=20000)
+    ap.add_argument("--scenarios", default=SCENARIOS)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", default="")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sync = run("0", args, os.path.join(tmp, "sync.json"))
+        asyn = run("1", args, os.path.join(tmp, "async.json"))
+
+    print(f"\n{'cenário':14s} {'p50 sync':>10s} {'p50 async':>10s} {'p95 sync':>10s} {'p95 async':>10s} "
+          f"{'req/s sync':>11s} {'req/s async':>11s} {'erros':>7s}")
+    for name, s in sync["scenarios"].items():
+        a = asyn["scenarios"].get(name)
+        if not a:
+            continue
+        print(f"{name:14s} {s['p50_ms']:10.1f} {a['p50_ms']:10.1f} {s['p95_ms']:10.1f} {a['p95_ms']:10.1f} "
+              f"{s['throughput_rps']:11.1f} {a['throughput_rps']:11.1f} {s['errors']:>3d}/{a['errors']:<3d}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"concurrency": args.concurrency, "sync": sync, "async": asyn}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,88 @@
+# scripts/bench_suggest.py
+# Latência do autocompletar do PDV (backend/suggest.py), sem HTTP.
+# Uso (na raiz do projeto):
+#   python scripts/bench_suggest.py                    # 50k produtos
+#   python scripts/bench_suggest.py --products 200000 --iterations 20000
+#
+# Gera o catálogo num banco temporário (backend/seed.py), monta o índice e
+# mede suggest() com termos digitados tecla a tecla ("c", "co", "coc"...),
+# nomes com acento sem acento ("agua 5"), termos que não acham nada e
+# termos largos sem produto em comum ("coca agua").
+# Mede também o custo de um upsert (cadastro/edição de produto).
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+QUERIES = [
+    "c", "co", "coc", "coca", "coca c", "agua", "agua 5", "acucar", "ACUCAR 12",
+    "pao de", "cerv", "feijao 9", "g00001", "g0000042", "camis", "zzzz", "xyz 1",
+    # termos largos sem produto em comum: o pior caso da varredura
+    "c a", "a b", "1 2", "coca agua",
+]
+
+
+def pct(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Latência do /api/products/suggest (em processo)")
+    ap.add_argument("--products", type=int, default=50000)
+    ap.add_argument("--iterations", type=int, default=10000)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp.name, 'suggest.db')}"
+    from backend import migrations, seed, suggest
+    from backend.database import SessionLocal, engine
+
+    migrations.upgrade(engine)
+    seed.generate(args.products, 1, 0, 1, args.seed)
+
+    t0 = time.perf_counter()
+    with SessionLocal() as db:
+        n = suggest.index.build(db)
+    build_ms = (time.perf_counter() - t0) * 1000
+    print(f"índice: {n} produtos, {suggest.index.stats()['tokens']} tokens, montado em {build_ms:.0f}ms")
+
+    rng = random.Random(args.seed)
+    per_query: dict[str, list[float]] = {q: [] for q in QUERIES}
+    for _ in range(args.iterations):
+        q = rng.choice(QUERIES)
+        t = time.perf_counter()
+        suggest.index.suggest(q)
+        per_query[q].append((time.perf_counter() - t) * 1e6)
+
+    print(f"\n{'consulta':14s} {'achados':>7s} {'p50 µs':>8s} {'p99 µs':>8s}")
+    everything = []
+    for q, times in per_query.items():
+        if not times:
+            continue
+        everything += times
+        found = len(suggest.index.suggest(q))
+        print(f"{q:14s} {found:7d} {statistics.median(times):8.1f} {pct(times, 0.99):8.1f}")
+    print(f"\ntodas: p50 {statistics.median(everything):.1f}µs, p99 {pct(everything, 0.99):.1f}µs")
+
+    times = []
+    for i in range(200):
+        t = time.perf_counter()
+        suggest.index.upsert(10_000_000 + i, f"BENCH{i}", f"Produto de teste {i}")
+        times.append((time.perf_counter() - t) * 1e6)
+    print(f"upsert: p50 {statistics.median(times):.1f}µs, p99 {pct(times, 0.99):.1f}µs")
+
+    engine.dispose()
+    tmp.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,59 @@
+# scripts/check_importtime.py
+# Regressão do tempo de import de backend.app (python -X importtime).
+# Uso: python scripts/check_importtime.py [--budget-ms 1500] [--runs 5]
+# Sai com código 1 se estourar o orçamento ou se um módulo pesado voltar
+# a ser carregado no boot.
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# carregados só sob demanda (ver backend/startup.py e imports locais)
+LAZY = ["numpy", "jose", "passlib", "openpyxl", "aiosqlite", "asyncpg"]
+
+
+def measure(env: dict) -> tuple[float, set[str]]:
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import backend.app"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stderr
+    total_us, mods = 0, set()
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        name = name.strip()
+        mods.add(name.split(".")[0])
+        if name == "backend.app":
+            total_us = int(cumulative)
+    return total_us / 1000.0, mods
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "1500")))
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'importtime.db')}"
+        env["PDV_MIGRATE_ON_STARTUP"] = "1"
+        measure(env)  # aquece: cria o banco e o cache de bytecode
+        results = [measure(env) for _ in range(max(1, args.runs))]
+
+    best = min(ms for ms, _ in results)
+    eager = sorted(set(LAZY) & results[0][1])
+    print(f"import backend.app: melhor de {len(results)} = {best:.0f}ms (orçamento {args.budget_ms:.0f}ms)")
+    if eager:
+        print(f"FALHA: módulos que deveriam ser lazy foram importados no boot: {', '.join(eager)}")
+    if best > args.budget_ms:
+        print("FALHA: tempo de import acima do orçamento")
+    return 1 if eager or best > args.budget_ms else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,204 @@
+# scripts/check_query_plans.py
+# Regressão de plano de execução das consultas quentes (SQLite).
+# Uso (na raiz do projeto): python scripts/check_query_plans.py [--show]
+#
+# Gera um banco temporário (backend/seed.py), roda cada função quente do
+# crud e cada rota do dashboard capturando o SQL que de fato vai ao banco,
+# e passa cada SELECT/UPDATE/DELETE por EXPLAIN QUERY PLAN. Sai com código
+# 1 se um plano fizer SCAN completo de sales, sale_items, products ou
+# product_variants onde o caso espera busca por índice.
+#
+# Por caso, cada tabela pode ter uma exceção declarada:
+#   "ordered": SCAN permitido só na ordem do ORDER BY (índice ou rowid,
+#              sem ordenação temporária), que para no LIMIT
+#   "full":    SCAN permitido (ex.: COUNT(*) do catálogo, ILIKE '%x%')
+# (o trecho do nome no crud.resolve é "ordered": percorre por id até o LIMIT)
+# Casos com `known` são regressões já conhecidas: aparecem no relatório,
+# mas não derrubam a verificação (e avisam quando passarem a passar).
+import argparse
+import os
+import re
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+HOT_TABLES = {"sales", "sale_items", "products", "product_variants"}
+_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX (\w+))?")
+
+
+@contextmanager
+def capture(engine):
+    """Guarda (sql, parâmetros) de tudo que o engine executar no bloco."""
+    from sqlalchemy import event
+
+    seen: list[tuple[str, tuple]] = []
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper()
+        if not executemany and verb in ("SELECT", "UPDATE", "DELETE", "WITH"):
+            seen.append((statement, tuple(parameters or ())))
+
+    event.listen(engine, "before_cursor_execute", _before)
+    try:
+        yield seen
+    finally:
+        event.remove(engine, "before_cursor_execute", _before)
+
+
+def explain(engine, sql: str, params: tuple) -> list[str]:
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params).all()
+    return [r[-1] for r in rows]
+
+
+def violations(plan: list[str], allow: dict[str, str]) -> list[str]:
+    # sem "USE TEMP B-TREE FOR ORDER BY" o SCAN já sai na ordem pedida
+    # (índice ou rowid) e para no LIMIT
+    in_order = not any("TEMP B-TREE FOR ORDER BY" in line for line in plan)
+    out = []
+    for line in plan:
+        m = _SCAN.match(line.strip())
+        if not m or m.group(1) not in HOT_TABLES:
+            continue
+        mode = allow.get(m.group(1))
+        if mode == "full" or (mode == "ordered" and (m.group(2) or in_order)):
+            continue
+        out.append(line.strip())
+    return out
+
+
+def _cases(client, headers, db):
+    from backend import catalog, crud, schemas, seed
+
+    today = date.today()
+    month = f"start={(today - timedelta(days=29)).isoformat()}&end={today.isoformat()}"
+
+    def sale():
+        items = [
+            schemas.SaleItemIn(sku=f"G{pid:07d}", name=f"Produto {pid}", variant="UN", qty=1, price=10.0)
+            for pid in (3, 17, 42, 99, 123)
+        ]
+        crud.create_sale(db, schemas.SaleIn(payment="PIX", subtotal=50.0, total=50.0, items=items), operator="plans")
+
+    existing = crud.get_product(db, 42)
+    pid, sku, name, price = existing.id, existing.sku, existing.name, existing.price
+    dup = schemas.ProductCreate(sku=sku.lower(), name=name.upper(), variant="UN", price=1.0)
+    db.rollback()
+
+    def duplicate():
+        # mesmo SKU + nome com outra caixa: tem que dar conflito
+        try:
+            crud.create_product_strict(db, dup)
+        except ValueError:
+            return
+        raise AssertionError("esperava conflito de SKU + nome")
+
+    def route(path):
+        def run():
+            r = client.get(path, headers=headers)
+            assert r.status_code == 200, (path, r.status_code, r.text[:200])
+        return run
+
+    # (nome, função, exceções por tabela, regressão conhecida)
+    return [
+        ("find_product (SKU exato)", lambda: crud.find_product(db, "G0000042"), {}, None),
+        ("find_product (SKU#variação)", lambda: crud.find_product(db, "G0000042#UN"), {}, None),
+        ("find_product (código de barras)", lambda: crud.find_product(db, seed.ean13(84)), {}, None),
+        ("find_product (sem SKU exato)", lambda: crud.find_product(db, "nao existe"),
+         {"products": "ordered"}, None),
+        ("resolve (início do SKU)", lambda: crud.resolve(db, "G00000"), {}, None),
+        ("resolve (início do nome)", lambda: crud.resolve(db, "açúcar"), {}, None),
+        ("resolve (início do nome, sem acento)", lambda: crud.resolve(db, "acucar"), {}, None),
+        ("resolve (trecho do nome)", lambda: crud.resolve(db, "cola"), {"products": "ordered"}, None),
+        ("rota resolve", route("/api/products/resolve?query=arroz"), {}, None),
+        ("get_product", lambda: crud.get_product(db, pid), {}, None),
+        ("list_products", lambda: crud.list_products(db, None),
+         {"products": "full"}, None),
+        ("list_products (busca)", lambda: crud.list_products(db, "arroz"),
+         {"products": "full"}, None),
+        ("create_product_strict (duplicidade)", duplicate, {}, None),
+        ("update_product_strict", lambda: crud.update_product_strict(
+            db, pid, schemas.ProductUpdate(price=price)), {}, None),
+        ("catalog.import_rows", lambda: catalog.import_rows(db, [
+            ["sku", "name", "variant", "price", "stock"],
+            [sku.lower(), name, "UN", "9.90", "7"],
+            ["NOVO-PLANOS", "Produto novo", "UN", "1.00", "1"],
+        ]), {}, None),
+        ("create_sale (5 itens)", sale, {}, None),
+        ("list_sales", lambda: crud.list_sales(db, 20), {"sales": "ordered"}, None),
+        ("list_low_stock", lambda: crud.list_low_stock(db), {"product_variants": "ordered"}, None),
+        ("dashboard summary", route(f"/api/dashboard/summary?{month}"), {}, None),
+        ("dashboard top_products", route(f"/api/dashboard/top_products?{month}"), {}, None),
+        ("dashboard latest_sales", route(f"/api/dashboard/latest_sales?{month}"), {}, None),
+        ("dashboard export CSV", route(f"/api/dashboard/export/sales.csv?{month}"), {}, None),
+    ]
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN das consultas quentes")
+    ap.add_argument("--show", action="store_true", help="imprime SQL e plano de todas as consultas")
+    ap.add_argument("--products", type=int, default=3000)
+    ap.add_argument("--sales", type=int, default=5000)
+    args = ap.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    # precisa estar definido antes de importar backend.database
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp.name, 'plans.db')}"
+    os.environ["PDV_ACCESS_LOG"] = "off"
+    os.environ["PDV_ADMISSION"] = "off"
+    os.environ["PDV_ASYNC_DB"] = "0"  # o SQL do crud_async é o mesmo; aqui vale o do crud
+
+    from fastapi.testclient import TestClient
+    from backend import cache, crud, migrations, seed
+    from backend.auth import create_access_token
+    from backend.database import SessionLocal, engine
+
+    migrations.upgrade(engine)
+    from backend.app import app  # confere a versão do banco no import
+    seed.generate(args.products, 2, args.sales, 90, 42)
+    with SessionLocal() as db:
+        crud.create_user(db, username="plans", password="plans", role="admin")
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'plans'})}"}
+
+    failed = 0
+    with TestClient(app) as client, SessionLocal() as db:
+        for name, fn, allow, known in _cases(client, headers, db):
+            cache.dashboard.clear()
+            db.expunge_all()  # sem identity map: cada caso vai ao banco
+            with capture(engine) as seen:
+                fn()
+            bad = []
+            for sql, params in seen:
+                plan = explain(engine, sql, params)
+                found = violations(plan, allow)
+                if found:
+                    bad.append((sql, plan, found))
+                if args.show:
+                    print(f"--- {name}\n{' '.join(sql.split())}\n  " + "\n  ".join(plan))
+            if bad and known:
+                print(f"CONHECIDO {name}: {known}")
+            elif bad:
+                failed += 1
+                print(f"FALHA     {name}")
+                for sql, plan, found in bad:
+                    print(f"    {' '.join(sql.split())[:200]}")
+                    for line in found:
+                        print(f"      -> {line}")
+            elif known:
+                print(f"ok        {name} (estava como conhecido: remova `known`)")
+            else:
+                print(f"ok        {name} ({len(seen)} consultas)")
+
+    engine.dispose()
+    tmp.cleanup()
+    if failed:
+        print(f"FALHA: {failed} caso(s) com SCAN completo de tabela quente")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())